@@ -0,0 +1,83 @@
+"""Templates listing from a live LIST against the catalog manifest
+
+Run from the repository root:
+
+    PYTHONPATH=layers/common python -m benchmarks.bench_catalog
+"""
+
+import os
+import statistics
+import time
+import boto3
+from moto import mock_aws
+from webshell_common import catalog
+from webshell_common.catalog import read_catalog, write_catalog
+from webshell_common.s3 import S3ResourceTemplates
+
+OBJECTS = 10_000
+ITERATIONS = 20
+BUCKET = "bench-templates"
+
+
+def live_listing(s3resource):
+    return [obj.key for obj in s3resource.bucket.objects.all()]
+
+
+def cold_manifest(s3resource):
+    catalog._catalogs.clear()
+    return sorted(read_catalog(s3resource)["templates"])
+
+
+def warm_manifest(s3resource):
+    return sorted(read_catalog(s3resource)["templates"])
+
+
+def measure(fn, s3resource) -> list[float]:
+    timings = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        fn(s3resource)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name: str, timings: list[float]):
+    print(
+        f"{name:<24} mean={statistics.mean(timings):8.2f}ms "
+        f"min={min(timings):8.2f}ms max={max(timings):8.2f}ms"
+    )
+
+
+def main():
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        for i in range(OBJECTS):
+            client.put_object(Bucket=BUCKET, Key=f"documents/{i:05}.docx", Body=b"")
+        s3resource = S3ResourceTemplates.for_bucket(BUCKET)
+        write_catalog(
+            s3resource,
+            {
+                "version": catalog.CATALOG_VERSION,
+                "templates": {
+                    obj.key: {
+                        "size": obj.size,
+                        "etag": obj.e_tag,
+                        "lastModified": obj.last_modified.isoformat(),
+                        "variables": [],
+                    }
+                    for obj in s3resource.bucket.objects.all()
+                },
+            },
+        )
+        print(f"{OBJECTS} objects in moto S3, {ITERATIONS} iterations")
+        report("objects.all()", measure(live_listing, s3resource))
+        report("manifest, cold", measure(cold_manifest, s3resource))
+        report("manifest, ETag match", measure(warm_manifest, s3resource))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Cold start of each function: init duration and import-time breakdown
+
+Every sample is a fresh interpreter that imports the handler module (the
+Lambda init phase) and then handles one request that fails validation, so
+no AWS call is made. Run from the repository root:
+
+    PYTHONPATH=layers/common python -m benchmarks.bench_cold_start [samples]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+SAMPLES = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+TOP_IMPORTS = 8
+
+HANDLERS = {
+    "DocumentsFunction": ("functions.documents.app.lambda_file", "general_amdt_doc"),
+    "AppResourcesFunction": ("functions.app_resources.app.lambda_file", "list_docs"),
+}
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import importlib
+module = importlib.import_module(sys.argv[1])
+init = time.perf_counter() - start
+with open(sys.argv[2]) as fp:
+    event = json.load(fp)
+event["httpMethod"] = "PUT"
+start = time.perf_counter()
+module.lambda_handler(event=event, context=None)
+print(json.dumps({"init": init * 1000, "invoke": (time.perf_counter() - start) * 1000}))
+"""
+
+
+def child_env(tmp: str) -> dict:
+    return {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([str(ROOT / "layers" / "common"), str(ROOT)]),
+        "AWS_REGION": "us-east-1",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "TEMPLATE_CACHE_DIR": tmp,
+        "TEMPLATES_BUCKET": "bench-templates",
+        "OUTPUT_BUCKET": "bench-output",
+    }
+
+
+def sample(module: str, event: Path, env: dict, *importtime: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, *importtime, "-c", CHILD, module, str(event)],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=ROOT,
+        check=True,
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["stderr"] = result.stderr
+    return timings
+
+
+def top_imports(stderr: str) -> list:
+    # cumulative microseconds of the top-level packages, as -X importtime shows
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit() or name.startswith("  "):
+            continue
+        name = name.strip().split(".")[0]
+        packages[name] = packages.get(name, 0) + int(cumulative)
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def percentile(values: list, q: int) -> float:
+    return statistics.quantiles(values, n=100)[q - 1]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        env = child_env(tmp)
+        for function, (module, event_name) in HANDLERS.items():
+            event = ROOT / "events" / f"{event_name}.json"
+            samples = [sample(module, event, env) for _ in range(SAMPLES)]
+            init = [s["init"] for s in samples]
+            invoke = [s["invoke"] for s in samples]
+            print(f"{function} ({module}), {SAMPLES} cold starts")
+            print(
+                f"  init    p50={percentile(init, 50):7.1f}ms "
+                f"p99={percentile(init, 99):7.1f}ms"
+            )
+            print(
+                f"  invoke  p50={percentile(invoke, 50):7.1f}ms "
+                f"p99={percentile(invoke, 99):7.1f}ms"
+            )
+            breakdown = sample(module, event, env, "-X", "importtime")["stderr"]
+            for name, micros in top_imports(breakdown)[:TOP_IMPORTS]:
+                print(f"    {name:<28} {micros / 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Queue throughput of asynchronous document jobs
+
+Submits jobs through the API handler, then drains the queue with the worker
+handler in SQS-sized batches. Run from the repository root:
+
+    PYTHONPATH=layers/common python -m benchmarks.bench_jobs
+"""
+
+import copy
+import json
+import os
+import time
+from pathlib import Path
+import boto3
+from moto import mock_aws
+from functions.documents.app.job_handlers import worker_handler
+from functions.documents.app.jobs import JobQueue, JobStore, SUCCEEDED
+from functions.documents.app.lambda_file import lambda_handler
+
+JOBS = 200
+BATCH_SIZE = 10
+TEMPLATE_BUCKET = "bench-templates"
+OUTPUT_BUCKET = "bench-output"
+ROOT = Path(__file__).parents[1]
+
+
+def async_event(index: int, base: dict) -> dict:
+    event = copy.deepcopy(base)
+    event["queryStringParameters"].update(
+        mode="async",
+        documentKey=f"documents/job-{index}.docx",
+        templateBucket=f"arn:aws:s3:::{TEMPLATE_BUCKET}",
+        outputBucket=f"arn:aws:s3:::{OUTPUT_BUCKET}",
+    )
+    return event
+
+
+def drain(queue) -> int:
+    processed = 0
+    while messages := queue.receive_messages(MaxNumberOfMessages=BATCH_SIZE):
+        records = [
+            {"messageId": message.message_id, "body": message.body}
+            for message in messages
+        ]
+        failures = worker_handler(event={"Records": records}, context=None)
+        failed = {
+            failure["itemIdentifier"] for failure in failures["batchItemFailures"]
+        }
+        # as the SQS event source does, only successes leave the queue
+        done = [
+            {"Id": message.message_id, "ReceiptHandle": message.receipt_handle}
+            for message in messages
+            if message.message_id not in failed
+        ]
+        if done:
+            queue.delete_messages(Entries=done)
+        processed += len(records)
+    return processed
+
+
+def main():
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket=TEMPLATE_BUCKET)
+        s3.create_bucket(Bucket=OUTPUT_BUCKET)
+        s3.upload_file(
+            ROOT / "fixtures" / "general_amdt_doc.docx",
+            TEMPLATE_BUCKET,
+            "documents/general_amdt_doc.docx",
+        )
+        table = boto3.resource("dynamodb").create_table(
+            TableName="bench-jobs",
+            KeySchema=[{"AttributeName": "jobId", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "jobId", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        queue = boto3.resource("sqs").create_queue(QueueName="bench-jobs")
+        os.environ["JOBS_TABLE"] = table.name
+        os.environ["JOBS_QUEUE_URL"] = queue.url
+        JobStore.from_env.cache_clear()
+        JobQueue.from_env.cache_clear()
+
+        with (ROOT / "events" / "general_amdt_doc.json").open() as fp:
+            base = json.load(fp)
+
+        start = time.perf_counter()
+        job_ids = [
+            json.loads(
+                lambda_handler(event=async_event(i, base), context=None)["body"]
+            )["jobId"]
+            for i in range(JOBS)
+        ]
+        submitted = time.perf_counter() - start
+
+        start = time.perf_counter()
+        processed = drain(queue)
+        drained = time.perf_counter() - start
+
+        store = JobStore.from_env()
+        succeeded = sum(store.get(job_id)["status"] == SUCCEEDED for job_id in job_ids)
+        print(f"{JOBS} jobs against moto SQS/DynamoDB/S3, batches of {BATCH_SIZE}")
+        print(f"submit  {submitted * 1000:8.1f}ms  {JOBS / submitted:7.1f} jobs/s")
+        print(f"drain   {drained * 1000:8.1f}ms  {processed / drained:7.1f} jobs/s")
+        print(f"succeeded {succeeded}/{JOBS}")
+
+
+if __name__ == "__main__":
+    main()
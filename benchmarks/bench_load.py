@@ -0,0 +1,409 @@
+"""Load test of the API routes against warm handlers
+
+Serves the API routes of template.yaml from a Werkzeug front end, which
+turns every HTTP request into an API Gateway proxy event. moto server
+stands in for S3. The handlers are imported once and stay warm across
+requests, caches included, like one Lambda container. With --concurrency
+above 1 the requests share that container, so run with 1 to size a single
+one. A weighted mix of events/ files, or the events found in a log, is sent
+at the given concurrency and, with --rate, at a fixed request rate. The
+report has throughput, latency percentiles and error rates per route. From
+the repository root:
+
+    PYTHONPATH=layers/common python -m benchmarks.bench_load \\
+        --events general_amdt_doc=4,batch_general_amdt_doc,packet,list_docs \\
+        --requests 400 --concurrency 4 --rate 40 --output head.json
+    # payloads logged with LOG_PAYLOADS=true, or one event per line
+    PYTHONPATH=layers/common python -m benchmarks.bench_load --log requests.log
+    # only serve, for curl or another load generator
+    PYTHONPATH=layers/common python -m benchmarks.bench_load --serve
+
+Async jobs need DynamoDB and SQS and are not provisioned, mode=async
+requests fail.
+"""
+
+import argparse
+import base64
+import contextlib
+import importlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlencode
+import boto3
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, Rule
+from werkzeug.serving import make_server
+from werkzeug.wrappers import Request, Response
+
+ROOT = Path(__file__).parents[1]
+EVENTS = ROOT / "events"
+FIXTURES = ROOT / "fixtures"
+ARN_PREFIX = "arn:aws:s3:::"
+# buckets of the events/ files, listed by /resources
+TEMPLATES_BUCKET = "webshell-dev-templates"
+OUTPUT_BUCKET = "webshell-dev-output"
+REQUEST_TIMEOUT = 60
+# hop-by-hop headers are not sent again when an event is replayed
+SKIPPED_HEADERS = {"host", "content-length", "connection", "accept-encoding"}
+
+# (route as in template.yaml, method, module[, handler if not lambda_handler])
+ROUTES = (
+    ("/documents/{template}", "POST", "functions.documents.app.lambda_file"),
+    ("/documents/{template}/batch", "POST", "functions.documents.app.lambda_file"),
+    ("/packets", "POST", "functions.documents.app.lambda_file"),
+    ("/bundles", "POST", "functions.documents.app.bundle_handlers", "bundle_handler"),
+    (
+        "/templates/{template}/schema",
+        "GET",
+        "functions.documents.app.catalog_handlers",
+        "schema_handler",
+    ),
+    ("/resources", "GET", "functions.app_resources.app.lambda_file"),
+)
+
+
+@dataclass
+class Result:
+    route: str
+    status: Optional[int]
+    # from the time the request was due, so a backed-up harness shows up
+    # as latency rather than as a lower rate
+    latency_ms: float
+
+
+def set_environment(endpoint_url: str):
+    # before any handler module is imported, they read it at import
+    os.environ.update(
+        {
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+            "AWS_SESSION_TOKEN": "testing",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_REGION": "us-east-1",
+            "AWS_ENDPOINT_URL": endpoint_url,
+            "TEMPLATES_BUCKET": TEMPLATES_BUCKET,
+            "OUTPUT_BUCKET": OUTPUT_BUCKET,
+            "TEMPLATE_CACHE_DIR": str(Path("/tmp/bench-load-templates")),
+        }
+    )
+
+
+def provision(events: list):
+    # every bucket the events name, with the fixtures as templates and as
+    # generated documents to bundle
+    s3 = boto3.resource("s3")
+    names = {TEMPLATES_BUCKET, OUTPUT_BUCKET}
+    for event in events:
+        query = event.get("queryStringParameters") or {}
+        for param in ("templateBucket", "outputBucket"):
+            if param in query:
+                names.add(query[param].removeprefix(ARN_PREFIX))
+    for name in names:
+        bucket = s3.create_bucket(Bucket=name)
+        for path in FIXTURES.glob("*.docx"):
+            bucket.upload_file(str(path), f"documents/{path.name}")
+
+
+def load_handlers() -> Map:
+    rules = []
+    for route, method, module, *name in ROUTES:
+        handler = getattr(importlib.import_module(module), *name or ["lambda_handler"])
+        rule = route.replace("{", "<").replace("}", ">")
+        rules.append(
+            Rule(rule, methods=[method], endpoint=(f"{method} {route}", handler))
+        )
+    return Map(rules)
+
+
+def proxy_event(request: Request, route: str, path_parameters: dict) -> dict:
+    # what API Gateway's Lambda proxy integration sends
+    return {
+        "resource": route.split(" ", 1)[1],
+        "path": request.path,
+        "httpMethod": request.method,
+        "headers": dict(request.headers),
+        "queryStringParameters": request.args.to_dict() or None,
+        "pathParameters": path_parameters or None,
+        "body": request.get_data(as_text=True) or None,
+        "isBase64Encoded": False,
+        "requestContext": {
+            "requestId": str(uuid.uuid4()),
+            "stage": "local",
+            "httpMethod": request.method,
+            "path": request.path,
+        },
+    }
+
+
+def front_end(routes: Map):
+    @Request.application
+    def application(request: Request) -> Response:
+        try:
+            (route, handler), path_parameters = routes.bind_to_environ(
+                request.environ
+            ).match()
+        except HTTPException as e:
+            return e
+        response = handler(proxy_event(request, route, path_parameters), None)
+        body = response.get("body") or ""
+        if response.get("isBase64Encoded"):
+            body = base64.b64decode(body)
+        return Response(
+            body, status=response["statusCode"], headers=response.get("headers")
+        )
+
+    return application
+
+
+def read_events(mix: str) -> tuple:
+    # "general_amdt_doc=4,packet" -> the events and their weights
+    events, weights = [], []
+    for item in mix.split(","):
+        name, _, weight = item.strip().partition("=")
+        events.append(json.loads((EVENTS / f"{name}.json").read_text()))
+        weights.append(float(weight or 1))
+    return events, weights
+
+
+def logged_events(path: Path) -> list:
+    # events one per line, or in the "request payload: " lines log_request
+    # writes with LOG_PAYLOADS=true; payloads truncated in the log are skipped
+    events = []
+    for line in path.read_text().splitlines():
+        with contextlib.suppress(ValueError):
+            record = json.loads(line)
+            if isinstance(record, dict) and "httpMethod" in record:
+                events.append(record)
+                continue
+            if isinstance(record, dict):
+                line = str(record.get("message", ""))
+        _, found, payload = line.partition("request payload: ")
+        if found:
+            with contextlib.suppress(ValueError):
+                events.append(json.loads(payload))
+    return events
+
+
+def with_distinct_key(event: dict, index: int) -> dict:
+    # documentKey made unique per request: production writes distinct
+    # documents, and moto server can fail concurrent PUTs to one key
+    query = event.get("queryStringParameters") or {}
+    if "documentKey" not in query:
+        return event
+    stem, dot, suffix = query["documentKey"].rpartition(".")
+    key = f"{stem}-{index}{dot}{suffix}" if dot else f"{suffix}-{index}"
+    return {**event, "queryStringParameters": {**query, "documentKey": key}}
+
+
+def http_request(base_url: str, event: dict) -> urllib.request.Request:
+    query = event.get("queryStringParameters") or {}
+    url = base_url + event["path"] + (f"?{urlencode(query)}" if query else "")
+    headers = {
+        name: value
+        for name, value in (event.get("headers") or {}).items()
+        if name.lower() not in SKIPPED_HEADERS
+    }
+    body = event.get("body")
+    return urllib.request.Request(
+        url,
+        data=body.encode() if body else None,
+        headers=headers,
+        method=event["httpMethod"],
+    )
+
+
+def send(base_url: str, routes: Map, event: dict) -> tuple:
+    # (route, status), status None when no response came back at all
+    try:
+        (route, _), _ = routes.bind("localhost").match(
+            event["path"], method=event["httpMethod"]
+        )
+    except HTTPException:
+        route = f"{event['httpMethod']} {event['path']}"
+    try:
+        with urllib.request.urlopen(
+            http_request(base_url, event), timeout=REQUEST_TIMEOUT
+        ) as response:
+            response.read()
+            return route, response.status
+    except urllib.error.HTTPError as e:
+        return route, e.code
+    except OSError:
+        return route, None
+
+
+def replay(
+    base_url: str, routes: Map, events: list, *, concurrency: int, rate: float
+) -> tuple:
+    # open loop with --rate: request i is due at i / rate seconds, whether or
+    # not earlier ones have finished; closed loop without it
+    def run(index: int, event: dict) -> Result:
+        due = start + index / rate if rate else time.perf_counter()
+        if (wait := due - time.perf_counter()) > 0:
+            time.sleep(wait)
+        route, status = send(base_url, routes, event)
+        return Result(route, status, (time.perf_counter() - due) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(run, range(len(events)), events))
+    return results, time.perf_counter() - start
+
+
+def percentile(values: list, q: float) -> float:
+    # nearest rank on sorted values
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+
+def report(results: list, duration: float) -> dict:
+    by_route = {}
+    for result in results:
+        by_route.setdefault(result.route, []).append(result)
+    summary = {}
+    for route, route_results in sorted(by_route.items()):
+        latencies = sorted(result.latency_ms for result in route_results)
+        statuses = [result.status for result in route_results]
+        summary[route] = {
+            "requests": len(route_results),
+            "rps": round(len(route_results) / duration, 2),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "4xx_rate": round(
+                sum(1 for s in statuses if s and 400 <= s < 500) / len(statuses), 4
+            ),
+            "error_rate": round(
+                sum(1 for s in statuses if s is None or s >= 500) / len(statuses), 4
+            ),
+        }
+    return summary
+
+
+def print_report(summary: dict, duration: float, total: int):
+    print(f"{total} requests in {duration:.1f}s, {total / duration:.1f} req/s")
+    print(
+        f"{'route':<36} {'requests':>8} {'req/s':>7} {'p50':>8} {'p95':>8} "
+        f"{'p99':>8} {'4xx':>6} {'errors':>6}"
+    )
+    for route, row in summary.items():
+        print(
+            f"{route:<36} {row['requests']:>8} {row['rps']:>7.1f} "
+            f"{row['p50_ms']:>6.1f}ms {row['p95_ms']:>6.1f}ms {row['p99_ms']:>6.1f}ms "
+            f"{row['4xx_rate']:>6.1%} {row['error_rate']:>6.1%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        "--events",
+        default="general_amdt_doc=4,batch_general_amdt_doc,packet,list_docs",
+        help="events/ files to mix, name=weight, comma separated",
+    )
+    source.add_argument("--log", type=Path, help="replay the events in this log")
+    parser.add_argument("--requests", type=int, help="default 200, or the log")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0, help="requests/s, 0 is max")
+    parser.add_argument("--warmup", type=int, default=10, help="not measured")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--same-keys", action="store_true", help="keep the events' documentKey"
+    )
+    parser.add_argument("--output", type=Path, help="write the report as JSON")
+    parser.add_argument("--serve", action="store_true", help="serve until Ctrl-C")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    from moto.server import ThreadedMotoServer
+
+    moto_server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    moto_server.start()
+    host, port = moto_server.get_host_and_port()
+    set_environment(f"http://{host}:{port}")
+
+    if args.log:
+        events = logged_events(args.log)
+        if not events:
+            parser.error(f"no events found in {args.log}")
+        count = args.requests or len(events)
+        # in order, and again from the start to make up the count
+        mix = [events[i % len(events)] for i in range(count)]
+    else:
+        events, weights = read_events(args.events)
+        count = args.requests or 200
+        mix = random.Random(args.seed).choices(events, weights, k=count)
+    if not args.same_keys:
+        mix = [with_distinct_key(event, index) for index, event in enumerate(mix)]
+    provision(events)
+
+    routes = load_handlers()
+    server = make_server("127.0.0.1", 0, front_end(routes), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        if args.serve:
+            print(f"serving {base_url}, S3 at http://{host}:{port}")
+            threading.Event().wait()
+        # EMF lines and per-request warnings would drown the report; failed
+        # requests are counted in it, and errors are still logged
+        logging.disable(logging.WARNING)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if args.warmup:
+                replay(
+                    base_url,
+                    routes,
+                    mix[: args.warmup],
+                    concurrency=args.concurrency,
+                    rate=0,
+                )
+            results, duration = replay(
+                base_url,
+                routes,
+                mix,
+                concurrency=args.concurrency,
+                rate=args.rate,
+            )
+    except KeyboardInterrupt:
+        return
+    finally:
+        server.shutdown()
+        moto_server.stop()
+
+    summary = report(results, duration)
+    print(
+        f"concurrency={args.concurrency} "
+        f"rate={args.rate or 'max'} warmup={args.warmup}"
+    )
+    print_report(summary, duration, len(results))
+    if args.output:
+        args.output.write_text(
+            json.dumps(
+                {
+                    "concurrency": args.concurrency,
+                    "rate": args.rate,
+                    "requests": len(results),
+                    "duration_s": round(duration, 3),
+                    "routes": summary,
+                },
+                indent=2,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Stage-level latency and allocation of the document pipeline
+
+Drives lambda_handler end to end and each stage in isolation against moto
+S3, over a matrix of synthetic templates and content sizes. Results are
+JSON so runs from two commits can be compared. From the repository root:
+
+    PYTHONPATH=layers/common python -m benchmarks.bench_pipeline --output head.json
+    PYTHONPATH=layers/common python -m benchmarks.bench_pipeline \\
+        --compare base.json head.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from pathlib import Path
+import boto3
+from moto import mock_aws
+from webshell_common.s3 import S3ResourceOutput, S3ResourceTemplates
+from webshell_common.telemetry import metrics
+from functions.documents.app import lambda_file
+from functions.documents.app.compiled_cache import CompiledTemplateCache
+from functions.documents.app.template_cache import TemplateCache
+from functions.documents.app.validation import parse_document_request
+from . import synthetic
+
+ROOT = Path(__file__).parents[1]
+TEMPLATE_BUCKET = "bench-templates"
+OUTPUT_BUCKET = "bench-output"
+MB = 1024 * 1024
+
+TEMPLATES = {
+    "small": synthetic.small_template,
+    "paragraphs_500": lambda: synthetic.paragraphs_template(paragraphs=500),
+    "table": lambda: synthetic.table_template(columns=4),
+    "images_10x512k": lambda: synthetic.image_heavy_template(
+        images=10, image_bytes=512 * 1024
+    ),
+    "headers_20": lambda: synthetic.headers_template(sections=20),
+}
+CONTENT = {
+    "rows_10": lambda: synthetic.content(rows=10),
+    "rows_2000": lambda: synthetic.content(rows=2000),
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=ROOT,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def api_event(template_key: str, content: dict) -> dict:
+    with (ROOT / "events" / "general_amdt_doc.json").open() as fp:
+        event = json.load(fp)
+    event["path"] = f"/{template_key}"
+    event["pathParameters"]["template"] = template_key.rsplit("/", 1)[-1]
+    event["queryStringParameters"].update(
+        documentKey="bench/output.docx",
+        templateBucket=f"arn:aws:s3:::{TEMPLATE_BUCKET}",
+        outputBucket=f"arn:aws:s3:::{OUTPUT_BUCKET}",
+    )
+    event["body"] = json.dumps(content)
+    return event
+
+
+def fresh_template_cache(tmp: str) -> TemplateCache:
+    return TemplateCache(
+        Path(tmp),
+        max_bytes=512 * MB,
+        max_memory_bytes=64 * MB,
+        memory_threshold=lambda_file.IN_MEMORY_MAX_BYTES,
+        negative_ttl=30,
+    )
+
+
+def emf_stages(text: str) -> dict:
+    # p50 of every *_ms metric in the EMF documents the handler printed
+    samples = {}
+    for line in text.splitlines():
+        if '"_aws"' not in line:
+            continue
+        document = json.loads(line)
+        for directive in document["_aws"]["CloudWatchMetrics"]:
+            for metric in directive["Metrics"]:
+                if metric["Name"].endswith("_ms"):
+                    samples.setdefault(metric["Name"], []).extend(
+                        document[metric["Name"]]
+                    )
+    return {
+        name: round(statistics.median(values), 3) for name, values in samples.items()
+    }
+
+
+def stages(template_key: str, content: dict, tmp: str, emf: io.StringIO) -> dict:
+    # name -> (setup, run); setup prepares caches, only run is measured.
+    # The EMF metrics lambda_handler prints are collected in emf
+    templates = S3ResourceTemplates.for_bucket(TEMPLATE_BUCKET)
+    output = S3ResourceOutput.for_bucket(OUTPUT_BUCKET)
+    event = api_event(template_key, content)
+    rendered = {}
+
+    def handle():
+        # stages run outside the handler must not be flushed with its own
+        metrics.clear_metrics()
+        with contextlib.redirect_stdout(emf):
+            lambda_file.lambda_handler(event=event, context=None)
+
+    def cold_caches():
+        lambda_file.template_cache = fresh_template_cache(tmp)
+        lambda_file.compiled_templates = CompiledTemplateCache(max_bytes=512 * MB)
+
+    def warm_caches():
+        lambda_file.download_template(templates, key=template_key)
+        lambda_file.compiled_templates.get(
+            lambda_file.download_template(templates, key=template_key)
+        )
+
+    def render():
+        template = lambda_file.download_template(templates, key=template_key)
+        document = io.BytesIO()
+        lambda_file.generate_document(document, template, content=content)
+        return document
+
+    def rendered_document():
+        cold_caches()
+        warm_caches()
+        rendered["bytes"] = render().getvalue()
+
+    return {
+        "validate": (lambda: None, lambda: parse_document_request(event)),
+        "download_template": (
+            cold_caches,
+            lambda: lambda_file.download_template(templates, key=template_key),
+        ),
+        "generate_document_cold": (
+            lambda: (
+                cold_caches(),
+                lambda_file.download_template(templates, key=template_key),
+            ),
+            render,
+        ),
+        "generate_document": (lambda: (cold_caches(), warm_caches()), render),
+        "upload_generated_document": (
+            rendered_document,
+            # the transfer closes the file object it was given
+            lambda: lambda_file.upload_generated_document(
+                output, key="bench/output.docx", fileobj=io.BytesIO(rendered["bytes"])
+            ),
+        ),
+        "lambda_handler": (lambda: (cold_caches(), warm_caches()), handle),
+    }
+
+
+def measure(setup, run, iterations: int) -> dict:
+    # setup runs before every sample, untimed, so cold stages stay cold
+    setup()
+    run()  # first call outside the samples, e.g. lazy imports
+    timings = []
+    for _ in range(iterations):
+        setup()
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    # allocations in a separate pass, tracing would skew the timings
+    setup()
+    tracemalloc.start()
+    run()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    return {
+        "mean_ms": round(statistics.mean(timings), 3),
+        "p50_ms": round(timings[len(timings) // 2], 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        "peak_kib": round(peak / 1024, 1),
+        "retained_kib": round(current / 1024, 1),
+    }
+
+
+def run_suite(iterations: int) -> dict:
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.pop("RENDER_INDEX_TABLE", None)
+    warnings.simplefilter("ignore")
+    results = []
+    with mock_aws(), tempfile.TemporaryDirectory() as tmp:
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket=TEMPLATE_BUCKET)
+        s3.create_bucket(Bucket=OUTPUT_BUCKET)
+        for template_name, build in TEMPLATES.items():
+            template_key = f"bench/{template_name}.docx"
+            data = build()
+            s3.put_object(Bucket=TEMPLATE_BUCKET, Key=template_key, Body=data)
+            for content_name, make_content in CONTENT.items():
+                content = make_content()
+                emf = io.StringIO()
+                matrix = stages(template_key, content, tmp, emf)
+                for stage, (setup, run) in matrix.items():
+                    result = {
+                        "template": template_name,
+                        "template_bytes": len(data),
+                        "content": content_name,
+                        "stage": stage,
+                        **measure(setup, run, iterations),
+                    }
+                    if stage == "lambda_handler":
+                        # the same stages as measured inside the handler
+                        result["emf_p50_ms"] = emf_stages(emf.getvalue())
+                    print(
+                        f"{template_name:<16} {content_name:<10} {stage:<26} "
+                        f"p50={result['p50_ms']:9.2f}ms "
+                        f"peak={result['peak_kib']:9.1f}KiB",
+                        file=sys.stderr,
+                    )
+                    results.append(result)
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "iterations": iterations,
+        "results": results,
+    }
+
+
+def compare(base_path: str, head_path: str, threshold: float) -> int:
+    # exit status 1 when any stage's p50 grew by more than the threshold
+    with open(base_path) as fp:
+        base = json.load(fp)
+    with open(head_path) as fp:
+        head = json.load(fp)
+    base_results = {
+        (r["template"], r["content"], r["stage"]): r for r in base["results"]
+    }
+    regressions = 0
+    print(f"{base['commit']} -> {head['commit']}, p50 change")
+    for result in head["results"]:
+        key = (result["template"], result["content"], result["stage"])
+        if key not in base_results:
+            continue
+        before, after = base_results[key]["p50_ms"], result["p50_ms"]
+        change = (after - before) / before if before else 0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(
+            f"{' '.join(key):<56} {before:9.2f}ms -> {after:9.2f}ms "
+            f"{change:+7.1%}{flag}"
+        )
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"))
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+    suite = run_suite(args.iterations)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(suite, fp, indent=2)
+    else:
+        json.dump(suite, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Full download against ranged partial fetch of an image-heavy template
+
+Each iteration starts from cold caches, fetches the template, renders it and
+writes the output package. Run from the repository root:
+
+    PYTHONPATH=layers/common python -m benchmarks.bench_ranged_fetch
+"""
+
+import io
+import os
+import statistics
+import time
+import tracemalloc
+import warnings
+import boto3
+from moto import mock_aws
+from webshell_common.s3 import S3ResourceTemplates
+from functions.documents.app.compiled_cache import CompiledTemplateCache
+from functions.documents.app.template_cache import TemplateCache
+from .synthetic import image_heavy_template
+
+ITERATIONS = 5
+BUCKET = "bench-templates"
+KEY = "documents/image_heavy.docx"
+MB = 1024 * 1024
+
+
+def render(s3resource, tmp_root, *, ranged: bool):
+    cache = TemplateCache(
+        tmp_root,
+        max_bytes=512 * MB,
+        max_memory_bytes=512 * MB,
+        memory_threshold=512 * MB,
+        ranged_min_bytes=16 * MB if ranged else 0,
+        passthrough_min_bytes=64 * 1024,
+        negative_ttl=30,
+    )
+    template = cache.fetch(s3resource, KEY)
+    docxtemplate = (
+        CompiledTemplateCache(max_bytes=512 * MB).get(template).new_document()
+    )
+    docxtemplate.render({"name": "Ada"})
+    document = io.BytesIO()
+    with template.open() as source:
+        if template.partial:
+            with io.BytesIO() as rendered:
+                docxtemplate.save(rendered, source=source)
+                template.partial.assemble(rendered, document)
+        else:
+            docxtemplate.save(document, source=source)
+    return template
+
+
+def measure(s3resource, tmp_root, *, ranged: bool):
+    timings, peaks = [], []
+    for _ in range(ITERATIONS):
+        tracemalloc.start()
+        start = time.perf_counter()
+        template = render(s3resource, tmp_root, ranged=ranged)
+        timings.append((time.perf_counter() - start) * 1000)
+        peaks.append(tracemalloc.get_traced_memory()[1] / MB)
+        tracemalloc.stop()
+    fetched = template.partial.bytes_fetched if template.partial else template.size
+    print(
+        f"{'ranged' if ranged else 'full download':<14} "
+        f"mean={statistics.mean(timings):8.1f}ms "
+        f"peak={max(peaks):6.1f}MB fetched={fetched / MB:6.2f}MB"
+    )
+
+
+def main():
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    warnings.simplefilter("ignore")
+    with mock_aws():
+        s3 = boto3.resource("s3")
+        s3.create_bucket(Bucket=BUCKET)
+        data = image_heavy_template(images=10, image_bytes=3 * MB)
+        s3.Bucket(BUCKET).put_object(Key=KEY, Body=data)
+        templates = S3ResourceTemplates({"resource": s3, "bucket_name": BUCKET})
+
+        print(f"template {len(data) / MB:.1f}MB, {ITERATIONS} cold renders each")
+        measure(templates, "/tmp/bench-templates", ranged=False)
+        measure(templates, "/tmp/bench-templates", ranged=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Per-invocation cost of building S3 access, before and after sharing it
+
+Run from the repository root:
+
+    PYTHONPATH=layers/common python -m benchmarks.bench_s3_clients
+"""
+
+import os
+import statistics
+import time
+import boto3
+from moto import mock_aws
+from webshell_common.s3 import S3Resource, S3ResourceOutput, S3ResourceTemplates
+
+ITERATIONS = 200
+TEMPLATE_BUCKET = "bench-templates"
+OUTPUT_BUCKET = "bench-output"
+
+
+def per_invocation_resources():
+    # previous behaviour: two new resources on every invocation
+    templates = S3Resource(
+        {"resource": boto3.resource("s3"), "bucket_name": TEMPLATE_BUCKET}
+    )
+    output = S3Resource(
+        {"resource": boto3.resource("s3"), "bucket_name": OUTPUT_BUCKET}
+    )
+    templates.client.head_bucket(Bucket=TEMPLATE_BUCKET)
+    output.client.head_bucket(Bucket=OUTPUT_BUCKET)
+
+
+def shared_handles():
+    templates = S3ResourceTemplates.for_bucket(TEMPLATE_BUCKET)
+    output = S3ResourceOutput.for_bucket(OUTPUT_BUCKET)
+    templates.client.head_bucket(Bucket=TEMPLATE_BUCKET)
+    output.client.head_bucket(Bucket=OUTPUT_BUCKET)
+
+
+def measure(fn) -> list[float]:
+    timings = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name: str, timings: list[float]):
+    quantiles = statistics.quantiles(timings, n=100)
+    print(
+        f"{name:<28} mean={statistics.mean(timings):7.2f}ms "
+        f"p50={quantiles[49]:7.2f}ms p99={quantiles[98]:7.2f}ms"
+    )
+
+
+def main():
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=TEMPLATE_BUCKET)
+        client.create_bucket(Bucket=OUTPUT_BUCKET)
+        print(f"{ITERATIONS} invocations against moto S3")
+        report("per-invocation resources", measure(per_invocation_resources))
+        report("shared handles", measure(shared_handles))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""docxtpl's save against saving with untouched parts copied
+
+Renders the same compiled template repeatedly and times only the save, in
+CPU and wall time, for the fixture template and a 30MB image-heavy one.
+Run from the repository root:
+
+    PYTHONPATH=layers/common python -m benchmarks.bench_save
+"""
+
+import io
+import statistics
+import time
+import warnings
+import zipfile
+from pathlib import Path
+from functions.documents.app.compiled_cache import CompiledTemplateCache
+from functions.documents.app.template_cache import CachedTemplate
+from .synthetic import image_heavy_template
+
+ITERATIONS = 5
+MB = 1024 * 1024
+FIXTURE = Path(__file__).parents[1] / "fixtures" / "general_amdt_doc.docx"
+
+
+def measure(template: CachedTemplate, content: dict, *, passthrough: bool):
+    compiled = CompiledTemplateCache(max_bytes=512 * MB).get(template)
+    cpu, wall = [], []
+    for _ in range(ITERATIONS):
+        docxtemplate = compiled.new_document()
+        docxtemplate.render(content)
+        document = io.BytesIO()
+        with template.open() as source:
+            start_cpu, start = time.process_time(), time.perf_counter()
+            docxtemplate.save(document, source=source if passthrough else None)
+            cpu.append((time.process_time() - start_cpu) * 1000)
+            wall.append((time.perf_counter() - start) * 1000)
+    assert zipfile.ZipFile(document).testzip() is None
+    print(
+        f"  {'passthrough' if passthrough else 'docxtpl':<12} "
+        f"cpu={statistics.median(cpu):8.1f}ms wall={statistics.median(wall):8.1f}ms "
+        f"output={document.getbuffer().nbytes / MB:6.2f}MB"
+    )
+
+
+def main():
+    warnings.simplefilter("ignore")
+    templates = {
+        FIXTURE.name: (FIXTURE.read_bytes(), {"docket_number": "ABC-123US01"}),
+        "image_heavy_30mb": (
+            image_heavy_template(images=10, image_bytes=3 * MB),
+            {"name": "Ada"},
+        ),
+    }
+    print(f"median of {ITERATIONS} saves")
+    for name, (data, content) in templates.items():
+        template = CachedTemplate(
+            bucket_name="bench",
+            key=name,
+            etag='"1"',
+            size=len(data),
+            data=data,
+        )
+        print(f"{name} ({len(data) / MB:.2f}MB)")
+        measure(template, content, passthrough=False)
+        measure(template, content, passthrough=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Upload and download throughput of generated documents per transfer profile
+
+Uploads a 1, 10 and 50 MB document with boto3's default TransferConfig and
+with each profile of webshell_common.s3, then downloads it the way the
+template cache does. moto serves from memory in the same process, so this
+shows the cost of part handling and concurrency, not network bandwidth;
+pass a real bucket to measure that. Run from the repository root:
+
+    PYTHONPATH=layers/common python -m benchmarks.bench_transfer [bucket]
+"""
+
+import contextlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+import boto3
+from boto3.s3.transfer import TransferConfig
+from moto import mock_aws
+from webshell_common.s3 import TRANSFER_PROFILES, S3ResourceOutput
+from functions.documents.app import template_cache
+
+ITERATIONS = 5
+OUTPUT_BUCKET = sys.argv[1] if len(sys.argv) > 1 else None
+MB = 1024 * 1024
+SIZES = (1 * MB, 10 * MB, 50 * MB)
+
+
+def upload(output, path: str, config: TransferConfig):
+    with open(path, "rb") as fp:
+        output.bucket.upload_fileobj(fp, "bench/document.docx", Config=config)
+
+
+def download(output, path: str, profile):
+    obj = output.bucket.Object("bench/document.docx")
+    response = obj.get()
+    with open(path, "wb") as fp:
+        if profile is None:
+            # single streamed GET, as before
+            for chunk in iter(lambda: response["Body"].read(256 * 1024), b""):
+                fp.write(chunk)
+        else:
+            template_cache.transfer_profile = lambda size: profile
+            template_cache.download_to_file(obj, response, fp)
+
+
+def throughput(fn, size: int) -> float:
+    timings = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return size / MB / statistics.median(timings)
+
+
+def main():
+    configs = {"boto3 default": (TransferConfig(), None)}
+    for name, profile in TRANSFER_PROFILES.items():
+        configs[f"profile {name}"] = (profile.config(), profile)
+    with contextlib.ExitStack() as stack:
+        tmp = stack.enter_context(tempfile.TemporaryDirectory())
+        bucket = OUTPUT_BUCKET
+        if bucket is None:
+            os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+            os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+            os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+            stack.enter_context(mock_aws())
+            bucket = "bench-output"
+            boto3.client("s3").create_bucket(Bucket=bucket)
+        output = S3ResourceOutput.for_bucket(bucket)
+        source = os.path.join(tmp, "source.docx")
+        target = os.path.join(tmp, "target.docx")
+        for size in SIZES:
+            with open(source, "wb") as fp:
+                fp.write(os.urandom(size))
+            print(f"{size // MB} MB document")
+            for name, (config, profile) in configs.items():
+                up = throughput(lambda: upload(output, source, config), size)
+                down = throughput(lambda: download(output, target, profile), size)
+                print(f"  {name:<16} upload={up:7.1f}MB/s download={down:7.1f}MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Per-call request validation, powertools' validate against compiled validators
+
+Run from the repository root:
+
+    PYTHONPATH=layers/common python -m benchmarks.bench_validation
+"""
+
+import json
+import statistics
+import time
+from pathlib import Path
+from aws_lambda_powertools.utilities.validation import validate
+from functions.documents.app.schemas import (
+    INPUT_SCHEMA,
+    BATCH_INPUT_SCHEMA,
+    BATCH_ITEMS_SCHEMA,
+)
+from functions.documents.app.validation import parse_document_request
+
+ITERATIONS = 2000
+EVENTS = Path(__file__).parents[1] / "events"
+
+
+def per_call_schemas(event: dict):
+    # previous handler: schema compiled by every validate call, then the
+    # ARNs and body parsed again
+    if event["path"].endswith("/batch"):
+        validate(event=event, schema=BATCH_INPUT_SCHEMA)
+        validate(
+            event=event, schema=BATCH_ITEMS_SCHEMA, envelope="powertools_json(body)"
+        )
+    else:
+        validate(event=event, schema=INPUT_SCHEMA)
+    event["queryStringParameters"]["templateBucket"].split(":::")[1]
+    event["queryStringParameters"]["outputBucket"].split(":::")[1]
+    json.loads(event["body"])
+
+
+def compiled_validators(event: dict):
+    parse_document_request(event)
+
+
+def measure(fn, event: dict) -> list[float]:
+    timings = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        fn(event)
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    return timings
+
+
+def report(name: str, timings: list[float]):
+    quantiles = statistics.quantiles(timings, n=100)
+    print(
+        f"{name:<40} mean={statistics.mean(timings):9.1f}us "
+        f"p50={quantiles[49]:9.1f}us p99={quantiles[98]:9.1f}us"
+    )
+
+
+def main():
+    print(f"{ITERATIONS} validations per event")
+    for name in ["general_amdt_doc", "batch_general_amdt_doc"]:
+        with (EVENTS / f"{name}.json").open() as fp:
+            event = json.load(fp)
+        report(f"{name}, per-call schemas", measure(per_call_schemas, event))
+        report(f"{name}, compiled", measure(compiled_validators, event))
+
+
+if __name__ == "__main__":
+    main()
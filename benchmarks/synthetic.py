@@ -0,0 +1,90 @@
+"""Synthetic docx templates for benchmarks"""
+
+import io
+import os
+import struct
+import zlib
+from docx import Document
+from docx.shared import Inches
+
+
+def png(size: int) -> bytes:
+    # header chunks python-docx reads, followed by `size` bytes of
+    # incompressible noise; the unit tests' image as well
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    ihdr = struct.pack(">IIBBBBB", 64, 64, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", ihdr)
+        + chunk(b"IDAT", os.urandom(size))
+        + chunk(b"IEND", b"")
+    )
+
+
+def image_heavy_template(*, images: int, image_bytes: int) -> bytes:
+    document = Document()
+    document.add_paragraph("Dear {{ name }}")
+    for _ in range(images):
+        document.add_picture(io.BytesIO(png(image_bytes)), width=Inches(1))
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def _save(document) -> bytes:
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def small_template() -> bytes:
+    document = Document()
+    document.add_paragraph("Dear {{ name }}")
+    return _save(document)
+
+
+def paragraphs_template(*, paragraphs: int) -> bytes:
+    document = Document()
+    for i in range(paragraphs):
+        document.add_paragraph(f"Paragraph {i} for {{{{ name }}}}, case {{{{ case }}}}")
+    return _save(document)
+
+
+def table_template(*, columns: int) -> bytes:
+    # one docxtpl row loop over `rows`, each row a dict of c0..cN
+    document = Document()
+    document.add_paragraph("Statement for {{ name }}")
+    table = document.add_table(rows=4, cols=columns)
+    for i in range(columns):
+        table.cell(0, i).text = f"Column {i}"
+        table.cell(2, i).text = f"{{{{ row.c{i} }}}}"
+    table.cell(1, 0).text = "{%tr for row in rows %}"
+    table.cell(3, 0).text = "{%tr endfor %}"
+    return _save(document)
+
+
+def headers_template(*, sections: int) -> bytes:
+    # every section has its own header and footer with variables
+    document = Document()
+    for i in range(sections):
+        section = document.sections[0] if i == 0 else document.add_section()
+        section.header.is_linked_to_previous = False
+        section.footer.is_linked_to_previous = False
+        section.header.paragraphs[0].text = f"{{{{ name }}}} section {i}"
+        section.footer.paragraphs[0].text = f"Case {{{{ case }}}} page {i}"
+        document.add_paragraph(f"Section {i} for {{{{ name }}}}")
+    return _save(document)
+
+
+def content(*, rows: int, columns: int = 4) -> dict:
+    return {
+        "name": "Ada Lovelace",
+        "case": "2024-0042",
+        "rows": [
+            {f"c{column}": f"value {row}.{column}" for column in range(columns)}
+            for row in range(rows)
+        ],
+    }
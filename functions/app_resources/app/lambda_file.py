@@ -1,46 +1,198 @@
+import base64
+import binascii
 import logging
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from os import environ
-from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+from typing import TYPE_CHECKING
+from botocore.exceptions import BotoCoreError, ClientError
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from aws_lambda_powertools.utilities.validation import validate, SchemaValidationError
-from boto3 import resource
+from aws_lambda_powertools.utilities.validation import SchemaValidationError
+from webshell_common.catalog import read_catalog
+from webshell_common.request_logging import LOG_LEVEL, log_request
+from webshell_common.s3 import S3Resource, S3ResourceOutput, S3ResourceTemplates
+from webshell_common.telemetry import add_count, instrumented, stage
+from webshell_common.validation import Validator
 from .schemas import INPUT_SCHEMA
 
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
 
 logger = logging.getLogger()
-logger.setLevel("INFO")
+logger.setLevel(LOG_LEVEL)
 
+# keys per bucket when the request does not set a limit
+DEFAULT_PAGE_SIZE = int(environ.get("RESOURCES_PAGE_SIZE", 100))
+# buckets are listed concurrently, each within its own time budget
+LISTING_MAX_WORKERS = int(environ.get("LISTING_MAX_WORKERS", 8))
+LISTING_TIMEOUT = float(environ.get("LISTING_TIMEOUT", 5))
+# written to the output buckets by the documents function (request profiles),
+# not documents, so left out of their listing
+DIAGNOSTICS_PREFIX = environ.get("DIAGNOSTICS_PREFIX", "_diagnostics/")
 
-# TODO: dupe from documents - layers?
-class S3Resource:
-    """AWS S3 Resource"""
+validate_input = Validator(INPUT_SCHEMA)
 
-    def __init__(self, lambda_s3_resource: dict):
-        self.resource = lambda_s3_resource["resource"]
-        self.bucket_name = lambda_s3_resource["bucket_name"]
-        self.bucket = self.resource.Bucket(self.bucket_name)
+RESOURCE_CLASSES = {"templates": S3ResourceTemplates, "documents": S3ResourceOutput}
 
 
-# TODO: dupe from documents - layers?
-class S3ResoureOutput(S3Resource):
-    # separate classes for patching
+class MissingEnvError(Exception):
     pass
 
 
-# TODO: dupe from documents - layers?
-class S3ResourceTemplates(S3Resource):
-    # separate classes for patching
+class InvalidTokenError(Exception):
     pass
 
 
-class MissingEnvError(Exception):
-    pass
+def bucket_names(env_name: str) -> list:
+    # comma separated, one bucket per tenant
+    names = [name.strip() for name in environ.get(env_name, "").split(",")]
+    names = [name for name in names if name]
+    if not names:
+        raise MissingEnvError(f"Missing env {env_name}")
+    return names
+
+
+def encode_token(bucket_name: str, token: str) -> str:
+    # the S3 continuation token only means something for its own bucket
+    data = json.dumps({"bucket": bucket_name, "token": token})
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_token(token: str) -> tuple:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return data["bucket"], data["token"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidTokenError(f"Invalid continuation token: {token}")
+
+
+def list_page(s3resource: S3Resource, listing: str, params: dict) -> dict:
+    # one ListObjectsV2 call; params are the {listing}Prefix/Delimiter/Limit
+    # query parameters and the S3 continuation token for this bucket, if any
+    request = {
+        "Bucket": s3resource.bucket_name,
+        "Prefix": params.get(f"{listing}Prefix", ""),
+        "MaxKeys": int(params.get(f"{listing}Limit", DEFAULT_PAGE_SIZE)),
+    }
+    if delimiter := params.get(f"{listing}Delimiter"):
+        request["Delimiter"] = delimiter
+    if token := params.get("token"):
+        request["ContinuationToken"] = token
+    with stage("list_objects", bucket=s3resource.bucket_name):
+        response = s3resource.client.list_objects_v2(**request)
+    add_count("listed_keys", response.get("KeyCount", 0))
+    keys = [obj["Key"] for obj in response.get("Contents", [])]
+    prefixes = [prefix["Prefix"] for prefix in response.get("CommonPrefixes", [])]
+    if listing == "documents" and DIAGNOSTICS_PREFIX:
+        # a page can then come back short of its limit
+        keys = [key for key in keys if not key.startswith(DIAGNOSTICS_PREFIX)]
+        prefixes = [
+            prefix for prefix in prefixes if not prefix.startswith(DIAGNOSTICS_PREFIX)
+        ]
+    return {
+        listing: keys,
+        "prefixes": prefixes,
+        "next_token": response.get("NextContinuationToken"),
+    }
 
 
-def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext):
-    logger.info("###EVENT RECIEVED")
-    logger.info(json.dumps(event, indent=2))
+def catalog_page(catalog: dict, listing: str, params: dict) -> dict:
+    # the same page list_page returns, cut from the catalog instead of S3;
+    # the token is the last key or folder of the previous page
+    prefix = params.get(f"{listing}Prefix", "")
+    delimiter = params.get(f"{listing}Delimiter")
+    limit = int(params.get(f"{listing}Limit", DEFAULT_PAGE_SIZE))
+    start_after = params.get("token", "")
+    keys, prefixes, last = [], [], None
+    for key in sorted(catalog["templates"]):
+        if not key.startswith(prefix) or key <= start_after:
+            continue
+        if delimiter and start_after.endswith(delimiter):
+            if key.startswith(start_after):
+                continue
+        folder = None
+        if delimiter and delimiter in key[len(prefix) :]:
+            rest = key[len(prefix) :]
+            folder = prefix + rest[: rest.index(delimiter) + len(delimiter)]
+            if folder == last:
+                continue
+        if len(keys) + len(prefixes) == limit:
+            return {listing: keys, "prefixes": prefixes, "next_token": last}
+        if folder:
+            prefixes.append(folder)
+        else:
+            keys.append(key)
+        last = folder or key
+    return {listing: keys, "prefixes": prefixes, "next_token": None}
+
+
+def template_page(s3resource: S3Resource, listing: str, params: dict) -> dict:
+    # templates come from the event-maintained catalog, a live listing is
+    # only made until the catalog has been built for the bucket
+    with stage("read_catalog", bucket=s3resource.bucket_name):
+        catalog = read_catalog(s3resource)
+    if catalog is None:
+        logger.warning(f"no catalog in {s3resource.bucket_name}, listing live")
+        return list_page(s3resource, listing, params)
+    return catalog_page(catalog, listing, params)
+
+
+def list_buckets(requests: list) -> list:
+    # requests - (bucket name, listing, params) per bucket; entries come back
+    # in request order and a bucket that fails or runs out of time is reported
+    # in its own entry instead of failing the response
+    pool = ThreadPoolExecutor(max_workers=min(LISTING_MAX_WORKERS, len(requests)))
+    deadline = time.monotonic() + LISTING_TIMEOUT
+    futures = [
+        pool.submit(
+            PAGE_FUNCTIONS[listing],
+            RESOURCE_CLASSES[listing].for_bucket(name),
+            listing,
+            params,
+        )
+        for name, listing, params in requests
+    ]
+    entries = []
+    for (name, _, _), future in zip(requests, futures):
+        entry = {"bucket_name": name}
+        try:
+            entry.update(future.result(timeout=max(deadline - time.monotonic(), 0)))
+            if entry["next_token"]:
+                entry["next_token"] = encode_token(name, entry["next_token"])
+        except TimeoutError:
+            logger.warning(f"listing {name} timed out")
+            entry["error"] = f"Timed out after {LISTING_TIMEOUT}s"
+        except ClientError as e:
+            logger.error(e)
+            entry["error"] = e.response["Error"]["Code"]
+        except BotoCoreError as e:
+            # no response from S3, e.g. EndpointConnectionError
+            logger.error(e)
+            entry["error"] = type(e).__name__
+        entries.append(entry)
+    # a listing still running must not hold up the response
+    pool.shutdown(wait=False, cancel_futures=True)
+    return entries
+
+
+PAGE_FUNCTIONS = {"templates": template_page, "documents": list_page}
+
+
+def listing_requests(names: list, listing: str, params: dict) -> list:
+    # a continuation token narrows its side of the response to its own bucket
+    params = {name: value for name, value in params.items() if name.startswith(listing)}
+    if token := params.get(f"{listing}Token"):
+        bucket_name, params["token"] = decode_token(token)
+        if bucket_name not in names:
+            raise InvalidTokenError(f"Invalid continuation token: {token}")
+        names = [bucket_name]
+    return [(name, listing, params) for name in names]
+
+
+@instrumented
+def lambda_handler(event: "APIGatewayProxyEvent", context: LambdaContext):
+    log_request(logger, event)
 
     headers = {
         "Content-Type": "application/json",
@@ -50,39 +202,24 @@ def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext):
     }
 
     try:
-        validate(event=event, schema=INPUT_SCHEMA)
-
-        template_bucket = environ.get("TEMPLATES_BUCKET")
-        if not template_bucket:
-            raise MissingEnvError("Missing env TEMPLATES_BUCKET")
-        output_bucket = environ.get("OUTPUT_BUCKET")
-        if not output_bucket:
-            raise MissingEnvError("Missing env OUTPUT_BUCKET")
-
-        s3resource_templates = S3ResourceTemplates(
-            {
-                "resource": resource("s3"),
-                "bucket_name": template_bucket,
-            }
-        )
-        s3resource_output = S3ResoureOutput(
-            {
-                "resource": resource("s3"),
-                "bucket_name": output_bucket,
-            }
-        )
+        with stage("validate"):
+            validate_input(event)
+
+        template_buckets = bucket_names("TEMPLATES_BUCKET")
+        output_buckets = bucket_names("OUTPUT_BUCKET")
 
-        templates = [obj.key for obj in s3resource_templates.bucket.objects.all()]
-        documents = [obj.key for obj in s3resource_output.bucket.objects.all()]
+        params = event.get("queryStringParameters") or {}
+        template_requests = listing_requests(template_buckets, "templates", params)
+        output_requests = listing_requests(output_buckets, "documents", params)
+        # one fan-out across both sides
+        entries = list_buckets(template_requests + output_requests)
         body = {
-            "template_buckets": [
-                {"bucket_name": template_bucket, "templates": templates}
-            ],
-            "output_buckets": [{"bucket_name": output_bucket, "documents": documents}],
+            "template_buckets": entries[: len(template_requests)],
+            "output_buckets": entries[len(template_requests) :],
         }
         status_code = 200
 
-    except SchemaValidationError as e:
+    except (SchemaValidationError, InvalidTokenError) as e:
         body = str(e)
         status_code = 400
 
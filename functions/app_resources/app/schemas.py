@@ -1,3 +1,32 @@
+def _listing_properties(listing: str) -> dict:
+    # paging parameters for one bucket, e.g. templatesPrefix, documentsToken
+    return {
+        f"{listing}Prefix": {
+            "$id": f"#/properties/queryStringParameters/{listing}Prefix",
+            "description": "Only list keys starting with this prefix",
+            "type": "string",
+        },
+        f"{listing}Delimiter": {
+            "$id": f"#/properties/queryStringParameters/{listing}Delimiter",
+            "description": "Group keys into folders on this character",
+            "type": "string",
+            "minLength": 1,
+        },
+        f"{listing}Limit": {
+            "$id": f"#/properties/queryStringParameters/{listing}Limit",
+            "description": "Page size, 1 to 1000",
+            "type": "string",
+            "pattern": "^([1-9][0-9]{0,2}|1000)$",
+        },
+        f"{listing}Token": {
+            "$id": f"#/properties/queryStringParameters/{listing}Token",
+            "description": "Continuation token returned by the previous page",
+            "type": "string",
+            "minLength": 1,
+        },
+    }
+
+
 INPUT_SCHEMA = {
     "$schema": "https://json-schema.org/draft/2020-12/schema",
     "$id": "https://example.com/documents.schema.json",
@@ -11,5 +40,13 @@ INPUT_SCHEMA = {
             "type": "string",
             "pattern": "GET",
         },
+        "queryStringParameters": {
+            "description": "Paging for each bucket, all optional",
+            "type": ["object", "null"],
+            "properties": {
+                **_listing_properties("templates"),
+                **_listing_properties("documents"),
+            },
+        },
     },
 }
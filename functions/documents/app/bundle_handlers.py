@@ -0,0 +1,195 @@
+import itertools
+import json
+import logging
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from typing import IO, TYPE_CHECKING, Iterator
+from botocore.exceptions import ClientError
+from boto3.exceptions import S3UploadFailedError
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from aws_lambda_powertools.utilities.validation import SchemaValidationError
+from webshell_common.request_logging import LOG_LEVEL, log_request
+from webshell_common.s3 import (
+    IO_CHUNK_BYTES,
+    S3Resource,
+    S3ResourceOutput,
+    upload_stream,
+)
+from webshell_common.validation import parse_json_body
+from .lambda_file import (
+    PRESIGNED_URL_EXPIRES,
+    UploadFailError,
+    document_location,
+    presigned_url,
+)
+from .template_cache import NOT_FOUND_CODES
+from .validation import ARN_PREFIX, validate_bundle_content, validate_bundle_input
+
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+
+logger = logging.getLogger()
+logger.setLevel(LOG_LEVEL)
+
+# documents under a prefix, at most; an explicit list is capped by its schema
+BUNDLE_MAX_DOCUMENTS = int(environ.get("BUNDLE_MAX_DOCUMENTS", 1000))
+# GETs running ahead of the zip writer
+BUNDLE_MAX_WORKERS = int(environ.get("BUNDLE_MAX_WORKERS", 4))
+# documents up to this size are read whole by the GET that runs ahead, larger
+# ones are streamed into the archive in IO_CHUNK_BYTES reads
+BUNDLE_PREFETCH_BYTES = int(environ.get("BUNDLE_PREFETCH_BYTES", 1024 * 1024))
+ZIP_CONTENT_TYPE = "application/zip"
+
+
+class MissingDocumentError(Exception):
+    pass
+
+
+class BundleSizeError(Exception):
+    pass
+
+
+def bundle_keys(s3resource: S3Resource, content: dict, *, exclude: str) -> list:
+    # keys in archive order: as listed, or every object under the prefix;
+    # exclude is the bundle itself, made again under its own prefix
+    if "keys" in content:
+        keys = [key for key in dict.fromkeys(content["keys"]) if key != exclude]
+    else:
+        listed = (
+            obj.key
+            for obj in s3resource.bucket.objects.filter(Prefix=content["prefix"])
+            if obj.key != exclude
+        )
+        keys = list(itertools.islice(listed, BUNDLE_MAX_DOCUMENTS + 1))
+    if not keys:
+        raise MissingDocumentError(
+            f"No documents to bundle in {s3resource.bucket_name}"
+        )
+    if len(keys) > BUNDLE_MAX_DOCUMENTS:
+        raise BundleSizeError(f"More than {BUNDLE_MAX_DOCUMENTS} documents to bundle")
+    return keys
+
+
+def read_documents(s3resource: S3Resource, keys: list) -> Iterator[tuple]:
+    # (key, GET response) in order, with up to BUNDLE_MAX_WORKERS GETs in
+    # flight ahead of the one being written; small bodies are read whole
+    # into response["Data"] so their transfer overlaps the writer too
+    def get(key):
+        try:
+            response = s3resource.client.get_object(
+                Bucket=s3resource.bucket_name, Key=key
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] in NOT_FOUND_CODES:
+                raise MissingDocumentError(
+                    f"Document not found: {key} in {s3resource.bucket_name}"
+                )
+            raise
+        if response["ContentLength"] <= BUNDLE_PREFETCH_BYTES:
+            response["Data"] = response["Body"].read()
+        return response
+
+    remaining = iter(keys)
+    with ThreadPoolExecutor(max_workers=BUNDLE_MAX_WORKERS) as pool:
+        pending = deque(
+            (key, pool.submit(get, key))
+            for key in itertools.islice(remaining, BUNDLE_MAX_WORKERS)
+        )
+        try:
+            while pending:
+                key, future = pending.popleft()
+                for next_key in itertools.islice(remaining, 1):
+                    pending.append((next_key, pool.submit(get, next_key)))
+                yield key, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def write_bundle(fileobj: IO[bytes], s3resource: S3Resource, keys: list):
+    # docx files are already deflated, so entries are stored as they are;
+    # the archive is written front to back and never seeks
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_STORED) as bundle:
+        for key, response in read_documents(s3resource, keys):
+            zinfo = zipfile.ZipInfo(key, response["LastModified"].timetuple()[:6])
+            zinfo.external_attr = 0o644 << 16
+            # decides up front whether the entry needs zip64 sizes
+            zinfo.file_size = response["ContentLength"]
+            with bundle.open(zinfo, "w") as entry:
+                if "Data" in response:
+                    entry.write(response["Data"])
+                    continue
+                body = response["Body"]
+                for chunk in iter(lambda: body.read(IO_CHUNK_BYTES), b""):
+                    entry.write(chunk)
+
+
+def create_bundle(s3resource: S3Resource, *, key: str, keys: list):
+    # streamed to S3 as a multipart upload while the documents are read,
+    # memory is bounded by the upload parts and not the archive; a document
+    # that fails aborts the upload and no bundle is created
+    try:
+        upload_stream(
+            s3resource.bucket,
+            key,
+            lambda fileobj: write_bundle(fileobj, s3resource, keys),
+            extra_args={"ContentType": ZIP_CONTENT_TYPE},
+        )
+    except (ClientError, S3UploadFailedError) as e:
+        logger.error(e)
+        raise UploadFailError(
+            f"Failed to upload bundle: {key} to {s3resource.bucket_name}"
+        )
+    logger.info(f"{key} bundled from {len(keys)} documents")
+
+
+def bundle_handler(event: "APIGatewayProxyEvent", context: LambdaContext):
+    # POST /bundles
+    log_request(logger, event)
+
+    headers = {"Content-Type": "application/json"}
+
+    try:
+        validate_bundle_input(event)
+        content = validate_bundle_content(parse_json_body(event))
+        query = event["queryStringParameters"]
+        key = query["documentKey"]
+        s3resource = S3ResourceOutput.for_bucket(
+            query["outputBucket"].removeprefix(ARN_PREFIX)
+        )
+        keys = bundle_keys(s3resource, content, exclude=key)
+        create_bundle(s3resource, key=key, keys=keys)
+        headers["Location"] = document_location(s3resource.bucket_name, key)
+        status_code = 201
+        body = "OK"
+        if query.get("response") == "presigned":
+            url = presigned_url(s3resource, key=key)
+            headers["Location"] = url
+            body = {"url": url, "expiresIn": PRESIGNED_URL_EXPIRES}
+
+    except MissingDocumentError as e:
+        logger.error(e)
+        body = str(e)
+        status_code = 404
+
+    except (SchemaValidationError, BundleSizeError) as e:
+        body = str(e)
+        status_code = 400
+
+    except UploadFailError as e:
+        body = str(e)
+        status_code = 500
+
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        body = "Unhandled Server Error: " + str(e)
+        status_code = 500
+
+    finally:
+        return {
+            "statusCode": status_code,
+            "headers": headers,
+            "body": json.dumps(body),
+        }
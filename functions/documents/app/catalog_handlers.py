@@ -0,0 +1,170 @@
+import io
+import json
+import logging
+import sys
+from datetime import datetime
+from urllib.parse import unquote_plus
+from botocore.exceptions import ClientError
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from aws_lambda_powertools.utilities.validation import SchemaValidationError
+from webshell_common.catalog import (
+    CATALOG_KEY,
+    empty_catalog,
+    read_catalog,
+    write_catalog,
+)
+from webshell_common.request_logging import LOG_LEVEL
+from webshell_common.s3 import S3Resource, S3ResourceTemplates
+from .template_cache import NOT_FOUND_CODES
+from .template_schema import cataloged_template, content_schema
+from .validation import ARN_PREFIX, validate_template_schema
+
+logger = logging.getLogger()
+logger.setLevel(LOG_LEVEL)
+
+
+def template_variables(data: bytes) -> list:
+    # undeclared jinja variables, empty for anything that is not a docx template
+    from docxtpl import DocxTemplate
+
+    try:
+        return sorted(
+            DocxTemplate(io.BytesIO(data)).get_undeclared_template_variables()
+        )
+    except Exception as e:
+        logger.warning(f"no template variables: {e}")
+        return []
+
+
+def catalog_entry(
+    *, size: int, etag: str, last_modified: datetime, data: bytes = None
+) -> dict:
+    return {
+        "size": size,
+        "etag": etag,
+        "lastModified": last_modified.isoformat(),
+        "variables": template_variables(data) if data is not None else [],
+    }
+
+
+def fetch_entry(s3resource: S3Resource, key: str):
+    # current state of one key, None once it has been deleted
+    try:
+        response = s3resource.client.get_object(Bucket=s3resource.bucket_name, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in NOT_FOUND_CODES:
+            return None
+        raise
+    return catalog_entry(
+        size=response["ContentLength"],
+        etag=response["ETag"],
+        last_modified=response["LastModified"],
+        data=response["Body"].read() if key.endswith(".docx") else None,
+    )
+
+
+def apply_events(s3resource: S3Resource, keys: list):
+    # events can arrive out of order, so each key is looked up again and
+    # the catalog records what is in the bucket now, not what the event said
+    catalog = read_catalog(s3resource) or empty_catalog()
+    templates = dict(catalog["templates"])
+    for key in keys:
+        entry = fetch_entry(s3resource, key)
+        if entry:
+            templates[key] = entry
+        else:
+            templates.pop(key, None)
+    write_catalog(s3resource, {**catalog, "templates": templates})
+    logger.info(f"catalog of {s3resource.bucket_name}: {len(templates)} templates")
+
+
+def rebuild_catalog(s3resource: S3Resource) -> dict:
+    # full listing, for drift between the bucket and its catalog; entries
+    # whose ETag still matches the listing are kept without a download
+    previous = (read_catalog(s3resource) or empty_catalog())["templates"]
+    catalog = empty_catalog()
+    for obj in s3resource.bucket.objects.all():
+        if obj.key == CATALOG_KEY:
+            continue
+        entry = previous.get(obj.key)
+        if not entry or entry["etag"] != obj.e_tag:
+            entry = fetch_entry(s3resource, obj.key)
+        if entry:
+            catalog["templates"][obj.key] = entry
+    write_catalog(s3resource, catalog)
+    logger.info(
+        f"catalog of {s3resource.bucket_name} rebuilt: "
+        f"{len(catalog['templates'])} templates"
+    )
+    return catalog
+
+
+def catalog_handler(event: dict, context: LambdaContext):
+    # S3 ObjectCreated/ObjectRemoved notifications, or {"rebuild": "<bucket>"}
+    if bucket_name := event.get("rebuild"):
+        catalog = rebuild_catalog(S3ResourceTemplates.for_bucket(bucket_name))
+        return {"templates": len(catalog["templates"])}
+
+    keys_by_bucket = {}
+    for record in event.get("Records", []):
+        key = unquote_plus(record["s3"]["object"]["key"])
+        # every catalog write notifies this function again; S3 filters can
+        # not leave out one key without leaving out images and other files
+        # the catalog lists, so it is dropped here, before any S3 call
+        if key != CATALOG_KEY:
+            bucket_name = record["s3"]["bucket"]["name"]
+            keys_by_bucket.setdefault(bucket_name, []).append(key)
+    if not keys_by_bucket:
+        logger.info("only the catalog changed, nothing to update")
+    for bucket_name, keys in keys_by_bucket.items():
+        apply_events(S3ResourceTemplates.for_bucket(bucket_name), keys)
+    return {"updated": sum(len(keys) for keys in keys_by_bucket.values())}
+
+
+def schema_handler(event: dict, context: LambdaContext):
+    # GET /templates/{template}/schema, for documents/{template}; answered
+    # from the catalog, a template added since the last catalog update is
+    # analyzed here without being added to it
+    headers = {"Content-Type": "application/json"}
+
+    try:
+        validate_template_schema(event)
+        key = f"documents/{event['pathParameters']['template']}"
+        s3resource = S3ResourceTemplates.for_bucket(
+            event["queryStringParameters"]["templateBucket"].removeprefix(ARN_PREFIX)
+        )
+        entry = cataloged_template(s3resource, key) or fetch_entry(s3resource, key)
+        if entry:
+            body = {
+                "template": key,
+                "etag": entry["etag"],
+                "variables": entry["variables"],
+                "schema": content_schema(entry["variables"]),
+            }
+            headers["ETag"] = entry["etag"]
+            status_code = 200
+        else:
+            body = f"Template not found: {key}"
+            status_code = 404
+
+    except SchemaValidationError as e:
+        body = str(e)
+        status_code = 400
+
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        body = "Unhandled Server Error: " + str(e)
+        status_code = 500
+
+    finally:
+        return {
+            "statusCode": status_code,
+            "headers": headers,
+            "body": json.dumps(body),
+        }
+
+
+if __name__ == "__main__":
+    # PYTHONPATH=layers/common python -m functions.documents.app.catalog_handlers <bucket>
+    logging.basicConfig()
+    print(catalog_handler({"rebuild": sys.argv[1]}, None))
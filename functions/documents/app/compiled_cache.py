@@ -0,0 +1,64 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from jinja2 import Environment
+    from .compiled_template import CompiledTemplate
+
+logger = logging.getLogger()
+
+
+class CompiledTemplateCache:
+    """LRU cache of CompiledTemplate by (bucket, key), bounded by memory
+
+    An entry is recompiled when the template's ETag changes.
+    """
+
+    def __init__(self, *, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._entries: OrderedDict[tuple, "CompiledTemplate"] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, template, jinja_env: "Environment" = None) -> "CompiledTemplate":
+        # template - CachedTemplate from the template file cache
+        # docxtpl and jinja are only imported once a template is rendered
+        from .compiled_template import CompiledTemplate
+
+        cache_key = (template.bucket_name, template.key, jinja_env)
+        with self._lock:
+            compiled = self._entries.get(cache_key)
+            if compiled and compiled.etag == template.etag:
+                self._entries.move_to_end(cache_key)
+                self.stats["hits"] += 1
+                return compiled
+
+        with template.open() as template_file:
+            compiled = CompiledTemplate(
+                template_file, etag=template.etag, jinja_env=jinja_env
+            )
+        with self._lock:
+            stale = self._entries.pop(cache_key, None)
+            if stale:
+                self.current_bytes -= stale.size
+            self.stats["misses"] += 1
+            if compiled.size <= self.max_bytes:
+                self._entries[cache_key] = compiled
+                self.current_bytes += compiled.size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.size
+                self.stats["evictions"] += 1
+        logger.info(
+            f"compiled template cache miss: {template.key} "
+            f"stats={self.stats} bytes={self.current_bytes}/{self.max_bytes}"
+        )
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
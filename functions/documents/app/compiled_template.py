@@ -0,0 +1,204 @@
+import copy
+import logging
+import re
+import time
+import zipfile
+import zlib
+from os import environ
+from typing import IO
+from docx.opc.pkgwriter import PackageWriter
+from docxtpl import DocxTemplate
+from jinja2 import Environment, Template
+from .zip_package import RawZipWriter, local_entry_chunks
+
+logger = logging.getLogger()
+
+# deflate levels for the parts a render rewrites; parts it leaves alone are
+# copied from the template still compressed
+XML_COMPRESS_LEVEL = int(environ.get("RENDER_XML_COMPRESS_LEVEL", 6))
+MEDIA_COMPRESS_LEVEL = int(environ.get("RENDER_MEDIA_COMPRESS_LEVEL", 1))
+XML_SUFFIXES = (".xml", ".rels")
+
+
+def write_package(phys_writer, package):
+    # what OpcPackage.save writes, into any python-docx physical writer
+    parts = list(package.iter_parts())
+    for part in parts:
+        part.before_marshal()
+    PackageWriter._write_content_types_stream(phys_writer, parts)
+    PackageWriter._write_pkg_rels(phys_writer, package.rels)
+    PackageWriter._write_parts(phys_writer, parts)
+    phys_writer.close()
+
+
+class _BlobDigests:
+    """Physical writer that only records (CRC, size) of each member"""
+
+    def __init__(self):
+        self.digests = {}
+
+    def write(self, pack_uri, blob: bytes):
+        self.digests[pack_uri.membername] = (zlib.crc32(blob), len(blob))
+
+    def close(self):
+        pass
+
+
+class PassthroughPkgWriter:
+    """Physical writer that copies the parts a render did not change
+
+    A member whose bytes are those the template itself would be saved with
+    is copied from the template package as raw compressed bytes, with its
+    original CRC and sizes; only the others are deflated again.
+    """
+
+    def __init__(self, fileobj: IO[bytes], source: IO[bytes], pristine: dict):
+        # pristine - member name -> (CRC, size) of the unrendered template's
+        # blob and the CRC of the template's own entry, see CompiledTemplate
+        self.source = source
+        self.pristine = pristine
+        self.copied = 0
+        self.compressed = 0
+        self._package = zipfile.ZipFile(source)
+        self._entries = {zinfo.filename: zinfo for zinfo in self._package.infolist()}
+        self._writer = RawZipWriter(fileobj)
+
+    def write(self, pack_uri, blob: bytes):
+        name = pack_uri.membername
+        zinfo = self._entries.get(name)
+        expected = self.pristine.get(name)
+        if (
+            zinfo
+            and expected
+            and expected[2] == zinfo.CRC
+            and expected[:2] == (zlib.crc32(blob), len(blob))
+        ):
+            self._writer.write_raw(zinfo, local_entry_chunks(self.source, zinfo))
+            self.copied += 1
+            return
+        new = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        new.compress_type = zipfile.ZIP_DEFLATED
+        new.external_attr = 0o600 << 16
+        level = (
+            XML_COMPRESS_LEVEL if name.endswith(XML_SUFFIXES) else MEDIA_COMPRESS_LEVEL
+        )
+        self._writer.write(new, blob, level)
+        self.compressed += 1
+
+    def close(self):
+        self._writer.close()
+        self._package.close()
+
+
+class CompiledTemplate:
+    """Parsed docx package with its Jinja-compiled body, headers and footers
+
+    Shared read-only between renders: every render works on a deep copy
+    of the parsed package and only calls Template.render on the compiled
+    parts.
+    """
+
+    def __init__(self, template_file, *, etag: str, jinja_env: Environment = None):
+        self.etag = etag
+        self.jinja_env = jinja_env or Environment()
+        self._source_bytes = 0
+        parser = DocxTemplate(template_file)
+        parser.init_docx()
+        self.docx = parser.docx
+        self.body = self._compile(parser.patch_xml(parser.get_xml()))
+        self.headers_footers = {}
+        for uri in (DocxTemplate.HEADER_URI, DocxTemplate.FOOTER_URI):
+            compiled_parts = {}
+            for relKey, part in parser.get_headers_footers(uri):
+                xml = parser.get_part_xml(part)
+                encoding = parser.get_headers_footers_encoding(xml)
+                compiled_parts[relKey] = (
+                    self._compile(parser.patch_xml(xml)),
+                    encoding,
+                )
+            self.headers_footers[uri] = compiled_parts
+        self.size = self._estimate_size(template_file)
+        self.pristine = self._pristine_members(template_file)
+
+    def _compile(self, src_xml: str) -> Template:
+        # same preprocessing DocxTemplate.render_xml_part does before compiling
+        src_xml = re.sub(r"<w:p([ >])", r"\n<w:p\1", src_xml)
+        self._source_bytes += len(src_xml)
+        return self.jinja_env.from_string(src_xml)
+
+    def _estimate_size(self, template_file) -> int:
+        # uncompressed package plus jinja sources, a rough in-memory footprint
+        with zipfile.ZipFile(template_file) as package:
+            unpacked = sum(info.file_size for info in package.infolist())
+        return unpacked + self._source_bytes
+
+    def _pristine_members(self, template_file) -> dict:
+        # (blob CRC, blob size, entry CRC) of every member python-docx writes
+        # for the unrendered template and that the package also has; XML is
+        # reserialized, so its blob rarely matches the entry byte for byte
+        digests = _BlobDigests()
+        write_package(digests, self.docx.part.package)
+        with zipfile.ZipFile(template_file) as package:
+            return {
+                zinfo.filename: (*digests.digests[zinfo.filename], zinfo.CRC)
+                for zinfo in package.infolist()
+                if zinfo.filename in digests.digests
+            }
+
+    def new_document(self) -> "CompiledDocxTemplate":
+        return CompiledDocxTemplate(self)
+
+
+class CompiledDocxTemplate(DocxTemplate):
+    """DocxTemplate rendering from a CompiledTemplate instead of the package"""
+
+    def __init__(self, compiled: CompiledTemplate):
+        super().__init__(template_file=None)
+        self.compiled = compiled
+        self.docx = copy.deepcopy(compiled.docx)
+
+    def init_docx(self, reload: bool = True):
+        if not self.docx or (self.is_rendered and reload):
+            self.docx = copy.deepcopy(self.compiled.docx)
+            self.is_rendered = False
+
+    def build_xml(self, context, jinja_env=None):
+        return self._render_compiled(self.compiled.body, self.docx._part, context)
+
+    def build_headers_footers_xml(self, context, uri, jinja_env=None):
+        for relKey, (template, encoding) in self.compiled.headers_footers[uri].items():
+            part = self.docx._part.rels[relKey].target_part
+            xml = self._render_compiled(template, part, context)
+            yield relKey, xml.encode(encoding)
+
+    def save(self, filename, *args, source: IO[bytes] = None, **kwargs):
+        # source - the package this template was compiled from, open for
+        # reading; without it, or with media to swap, docxtpl saves as usual
+        replacing = (
+            self.crc_to_new_media or self.crc_to_new_embedded or self.zipname_to_replace
+        )
+        if source is None or replacing:
+            return super().save(filename, *args, **kwargs)
+        if not hasattr(filename, "write"):
+            with open(filename, "wb") as fileobj:
+                return self.save(fileobj, source=source)
+        self.pre_processing()
+        writer = PassthroughPkgWriter(filename, source, self.compiled.pristine)
+        write_package(writer, self.docx.part.package)
+        self.is_saved = True
+        logger.debug(
+            f"saved {writer.copied} parts as they were, compressed {writer.compressed}"
+        )
+
+    def _render_compiled(self, template: Template, part, context) -> str:
+        # mirrors the post-processing of DocxTemplate.render_xml_part
+        self.current_rendering_part = part
+        dst_xml = template.render(context)
+        dst_xml = re.sub(r"\n<w:p([ >])", r"<w:p\1", dst_xml)
+        dst_xml = (
+            dst_xml.replace("{_{", "{{")
+            .replace("}_}", "}}")
+            .replace("{_%", "{%")
+            .replace("%_}", "%}")
+        )
+        return self.resolve_listing(dst_xml)
@@ -0,0 +1,153 @@
+import io
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from os import environ
+from botocore.exceptions import ClientError
+from .template_cache import NOT_FOUND_CODES
+
+logger = logging.getLogger()
+
+# {"$image": "<key in the templates bucket>", "width": mm, "height": mm}
+IMAGE_MARKER = "$image"
+IMAGE_MAX_WORKERS = int(environ.get("IMAGE_MAX_WORKERS", 8))
+
+
+class MissingImageError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class CachedImage:
+    etag: str
+    data: bytes
+    # time.monotonic() of the last check against S3
+    checked: float
+
+
+class ImageCache:
+    """LRU cache of images by (bucket, key), bounded by memory
+
+    Logos and signatures repeat across documents. An entry is used without
+    asking S3 for `ttl` seconds, then revalidated with a conditional GET.
+    """
+
+    def __init__(self, *, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.current_bytes = 0
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+        self._entries: OrderedDict[tuple, CachedImage] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fetch(self, s3resource, key: str) -> bytes:
+        cache_key = (s3resource.bucket_name, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry and time.monotonic() - entry.checked < self.ttl:
+                self._entries.move_to_end(cache_key)
+                self.stats["hits"] += 1
+                return entry.data
+        get_args = {"Bucket": s3resource.bucket_name, "Key": key}
+        if entry:
+            get_args["IfNoneMatch"] = entry.etag
+        try:
+            response = s3resource.client.get_object(**get_args)
+        except ClientError as e:
+            if entry and e.response["Error"]["Code"] == "304":
+                self._store(
+                    cache_key, replace(entry, checked=time.monotonic()), "revalidated"
+                )
+                return entry.data
+            raise e
+        entry = CachedImage(
+            etag=response["ETag"],
+            data=response["Body"].read(),
+            checked=time.monotonic(),
+        )
+        self._store(cache_key, entry, "misses")
+        return entry.data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _store(self, cache_key: tuple, entry: CachedImage, outcome: str):
+        with self._lock:
+            stale = self._entries.pop(cache_key, None)
+            if stale:
+                self.current_bytes -= len(stale.data)
+            self.stats[outcome] += 1
+            if len(entry.data) <= self.max_bytes:
+                self._entries[cache_key] = entry
+                self.current_bytes += len(entry.data)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted.data)
+                self.stats["evictions"] += 1
+
+
+def is_image(value) -> bool:
+    return isinstance(value, dict) and isinstance(value.get(IMAGE_MARKER), str)
+
+
+def image_keys(content) -> set:
+    # keys of every image referenced anywhere in the content
+    if is_image(content):
+        return {content[IMAGE_MARKER]}
+    if isinstance(content, dict):
+        values = content.values()
+    elif isinstance(content, list):
+        values = content
+    else:
+        return set()
+    return set().union(*(image_keys(value) for value in values))
+
+
+def fetch_images(cache: ImageCache, s3resource, keys: set) -> dict:
+    # all images at once, before rendering; a missing image is left out and
+    # reported by with_inline_images for the documents that use it
+    def fetch(key):
+        try:
+            return cache.fetch(s3resource, key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in NOT_FOUND_CODES:
+                raise e
+            logger.info(f"image not found: {key} in {s3resource.bucket_name}")
+
+    keys = sorted(keys)
+    if not keys:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(IMAGE_MAX_WORKERS, len(keys))) as pool:
+        images = dict(zip(keys, pool.map(fetch, keys)))
+    logger.info(f"{len(keys)} images fetched, image cache: {cache.stats}")
+    return {key: data for key, data in images.items() if data is not None}
+
+
+def with_inline_images(content, docxtemplate, images: dict):
+    # copy of the content with image references replaced by InlineImage
+    from docx.shared import Mm
+    from docxtpl import InlineImage
+
+    def resolve(value):
+        if is_image(value):
+            key = value[IMAGE_MARKER]
+            if key not in images:
+                raise MissingImageError(f"Image not found: {key}")
+            return InlineImage(
+                docxtemplate,
+                io.BytesIO(images[key]),
+                width=Mm(value["width"]) if value.get("width") else None,
+                height=Mm(value["height"]) if value.get("height") else None,
+            )
+        if isinstance(value, dict):
+            return {name: resolve(item) for name, item in value.items()}
+        if isinstance(value, list):
+            return [resolve(item) for item in value]
+        return value
+
+    return resolve(content)
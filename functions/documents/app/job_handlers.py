@@ -0,0 +1,133 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import TYPE_CHECKING
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from aws_lambda_powertools.utilities.validation import SchemaValidationError
+from webshell_common.request_logging import LOG_LEVEL
+from webshell_common.s3 import S3ResourceOutput, S3ResourceTemplates
+from webshell_common.telemetry import instrumented
+from .jobs import JOBS_MAX_RECEIVE_COUNT, JobStore, RUNNING, SUCCEEDED, FAILED
+from .lambda_file import (
+    BATCH_MAX_WORKERS,
+    DownloadFailBucketError,
+    DownloadFailTemplateError,
+    MissingImageError,
+    TemplateRenderError,
+    UploadFailError,
+    document_location,
+    render_or_copy_document,
+)
+from .validation import validate_job_status
+
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+
+logger = logging.getLogger()
+logger.setLevel(LOG_LEVEL)
+
+
+def run_job(job: dict):
+    # same pipeline as a synchronous request; failures that a retry cannot
+    # fix are recorded on the job instead of being raised
+    store = JobStore.from_env()
+    store.update(job["jobId"], RUNNING)
+    try:
+        s3resource_output = S3ResourceOutput.for_bucket(job["outputBucket"])
+        render_or_copy_document(
+            S3ResourceTemplates.for_bucket(job["templateBucket"]),
+            s3resource_output,
+            template_key=job["templateKey"],
+            key=job["documentKey"],
+            content=job["content"],
+        )
+    except (
+        DownloadFailTemplateError,
+        DownloadFailBucketError,
+        MissingImageError,
+        TemplateRenderError,
+        UploadFailError,
+    ) as e:
+        logger.error(e)
+        store.update(job["jobId"], FAILED, message=str(e))
+        return
+    store.update(
+        job["jobId"],
+        SUCCEEDED,
+        location=document_location(s3resource_output.bucket_name, job["documentKey"]),
+    )
+
+
+def give_up_job(job: dict):
+    # the last delivery failed and SQS moves the message to the dead-letter
+    # queue, the job would otherwise stay running
+    try:
+        JobStore.from_env().update(
+            job["jobId"],
+            FAILED,
+            message=f"Job failed after {JOBS_MAX_RECEIVE_COUNT} attempts",
+        )
+    except Exception as e:
+        logger.error(e, exc_info=True)
+
+
+@instrumented
+def worker_handler(event: dict, context: LambdaContext):
+    # SQS batch; messages that raise are reported back for redelivery
+    def process(record):
+        job = None
+        try:
+            job = json.loads(record["body"])
+            run_job(job)
+        except Exception as e:
+            logger.error(e, exc_info=True)
+            attempts = int(
+                record.get("attributes", {}).get("ApproximateReceiveCount", 1)
+            )
+            if job and attempts >= JOBS_MAX_RECEIVE_COUNT:
+                give_up_job(job)
+            return {"itemIdentifier": record["messageId"]}
+
+    records = event.get("Records", [])
+    if not records:
+        return {"batchItemFailures": []}
+    with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(records))) as pool:
+        failures = [failure for failure in pool.map(process, records) if failure]
+    logger.info(f"processed {len(records)} jobs, {len(failures)} failed")
+    return {"batchItemFailures": failures}
+
+
+def status_handler(event: "APIGatewayProxyEvent", context: LambdaContext):
+    headers = {"Content-Type": "application/json"}
+
+    try:
+        validate_job_status(event)
+        job_id = event["pathParameters"]["id"]
+        job = JobStore.from_env().get(job_id)
+        if job:
+            # DynamoDB numbers come back as Decimal
+            body = {
+                name: int(value) if isinstance(value, Decimal) else value
+                for name, value in job.items()
+            }
+            status_code = 200
+        else:
+            body = f"Job not found: {job_id}"
+            status_code = 404
+
+    except SchemaValidationError as e:
+        body = str(e)
+        status_code = 400
+
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        body = "Unhandled Server Error: " + str(e)
+        status_code = 500
+
+    finally:
+        return {
+            "statusCode": status_code,
+            "headers": headers,
+            "body": json.dumps(body),
+        }
@@ -0,0 +1,92 @@
+import functools
+import json
+import time
+from os import environ
+import boto3
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# finished jobs expire from the table after this many seconds
+JOB_TTL = int(environ.get("JOB_TTL_SECONDS", 7 * 24 * 60 * 60))
+# deliveries of a job message before SQS moves it to the dead-letter queue,
+# the queue's maxReceiveCount
+JOBS_MAX_RECEIVE_COUNT = int(environ.get("JOBS_MAX_RECEIVE_COUNT", 3))
+# SQS rejects message bodies over 256 KiB
+MAX_MESSAGE_BYTES = 256 * 1024
+
+
+class JobSizeError(Exception):
+    pass
+
+
+def message_body(job: dict) -> str:
+    # checked before the job is recorded, SQS would only reject it on send
+    body = json.dumps(job)
+    size = len(body.encode())
+    if size > MAX_MESSAGE_BYTES:
+        raise JobSizeError(
+            f"Job is {size} bytes, async jobs take at most {MAX_MESSAGE_BYTES}. "
+            "Please send the request with mode=sync."
+        )
+    return body
+
+
+class JobStore:
+    """Document job state in DynamoDB"""
+
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    @functools.cache
+    def from_env(cls):
+        return cls(boto3.resource("dynamodb").Table(environ["JOBS_TABLE"]))
+
+    def create(self, job: dict):
+        now = int(time.time())
+        self.table.put_item(
+            Item={
+                "jobId": job["jobId"],
+                "status": QUEUED,
+                "templateKey": job["templateKey"],
+                "documentKey": job["documentKey"],
+                "outputBucket": job["outputBucket"],
+                "createdAt": now,
+                "updatedAt": now,
+                "expiresAt": now + JOB_TTL,
+            }
+        )
+
+    def update(self, job_id: str, status: str, **attributes):
+        attributes = {"status": status, "updatedAt": int(time.time()), **attributes}
+        self.table.update_item(
+            Key={"jobId": job_id},
+            UpdateExpression="SET "
+            + ", ".join(f"#{name} = :{name}" for name in attributes),
+            ExpressionAttributeNames={f"#{name}": name for name in attributes},
+            ExpressionAttributeValues={
+                f":{name}": value for name, value in attributes.items()
+            },
+        )
+
+    def get(self, job_id: str):
+        return self.table.get_item(Key={"jobId": job_id}).get("Item")
+
+
+class JobQueue:
+    """SQS queue feeding the document job workers"""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    @classmethod
+    @functools.cache
+    def from_env(cls):
+        return cls(boto3.resource("sqs").Queue(environ["JOBS_QUEUE_URL"]))
+
+    def send(self, body: str):
+        # body - see message_body
+        self.queue.send_message(MessageBody=body)
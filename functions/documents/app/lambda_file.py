@@ -1,86 +1,218 @@
+import base64
+import io
 import json
 import logging
+import tempfile
 import uuid
-from boto3 import resource
-from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import BotoCoreError, ClientError
 from boto3.exceptions import S3UploadFailedError
 from os import environ
 from pathlib import Path
-from docxtpl import DocxTemplate
-from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
+from typing import IO, TYPE_CHECKING, Optional
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from aws_lambda_powertools.utilities.validation import validate, SchemaValidationError
-from .schemas import INPUT_SCHEMA
+from aws_lambda_powertools.utilities.validation import SchemaValidationError
+from webshell_common.request_logging import LOG_LEVEL, Payload, log_request
+from webshell_common.s3 import (
+    S3Resource,
+    S3ResourceOutput,
+    S3ResourceTemplates,
+    transfer_profile,
+    upload_stream,
+)
+from webshell_common.telemetry import (
+    add_bytes,
+    add_count,
+    instrumented,
+    metrics,
+    stage,
+)
+from .validation import DocumentRequest, parse_document_request
+from .profiling import profiled
+from .template_cache import TemplateCache, CachedTemplate, NOT_FOUND_CODES
+from .compiled_cache import CompiledTemplateCache
+from .jobs import FAILED, JobQueue, JobSizeError, JobStore, QUEUED, message_body
+from .render_index import HASH_METADATA, RenderIndex, render_hash
+from .template_schema import MissingVariablesError, check_content
+from .images import (
+    ImageCache,
+    MissingImageError,
+    fetch_images,
+    image_keys,
+    with_inline_images,
+)
+
+if TYPE_CHECKING:
+    # the data classes cost ~40ms of cold start and are only annotations
+    from aws_lambda_powertools.utilities.data_classes import APIGatewayProxyEvent
 
 REGION = environ.get("AWS_REGION")
+BATCH_MAX_WORKERS = int(environ.get("BATCH_MAX_WORKERS", 4))
 logger = logging.getLogger()
-logger.setLevel("INFO")
+logger.setLevel(LOG_LEVEL)
+
+# files up to this size never touch /tmp, larger ones spool to disk
+IN_MEMORY_MAX_BYTES = int(environ.get("IN_MEMORY_MAX_BYTES", 8 * 1024 * 1024))
+# response=inline returns documents up to this size in the body; base64 adds
+# a third and a Lambda response is at most 6MB
+INLINE_MAX_BYTES = int(environ.get("INLINE_RESPONSE_MAX_BYTES", 4 * 1024 * 1024))
+PRESIGNED_URL_EXPIRES = int(environ.get("PRESIGNED_URL_EXPIRES", 15 * 60))
+DOCX_CONTENT_TYPE = (
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+)
+
+# survives between invocations of a warm container
+template_cache = TemplateCache(
+    Path(environ.get("TEMPLATE_CACHE_DIR", "/tmp/templates")),
+    max_bytes=int(environ.get("TEMPLATE_CACHE_MAX_BYTES", 100 * 1024 * 1024)),
+    max_memory_bytes=int(
+        environ.get("TEMPLATE_CACHE_MAX_MEMORY_BYTES", 16 * 1024 * 1024)
+    ),
+    memory_threshold=IN_MEMORY_MAX_BYTES,
+    ranged_min_bytes=int(environ.get("RANGED_FETCH_MIN_BYTES", 0)),
+    passthrough_min_bytes=int(environ.get("RANGED_PASSTHROUGH_MIN_BYTES", 64 * 1024)),
+    negative_ttl=float(environ.get("TEMPLATE_CACHE_NEGATIVE_TTL", 30)),
+)
+
+compiled_templates = CompiledTemplateCache(
+    max_bytes=int(environ.get("COMPILED_TEMPLATE_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+)
+
+# images referenced by content, see images.py
+image_cache = ImageCache(
+    max_bytes=int(environ.get("IMAGE_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+    ttl=float(environ.get("IMAGE_CACHE_TTL", 300)),
+)
 
 
-class S3Resource:
-    """AWS S3 Resource"""
-
-    def __init__(self, lambda_s3_resource: dict):
-        self.resource = lambda_s3_resource["resource"]
-        self.bucket_name = lambda_s3_resource["bucket_name"]
-        self.bucket = self.resource.Bucket(self.bucket_name)
-
-
-class S3ResoureOutput(S3Resource):
-    # separate classes for patching
+class DownloadFailTemplateError(Exception):
     pass
 
 
-class S3ResourceTemplates(S3Resource):
-    # separate classes for patching
+class DownloadFailBucketError(Exception):
     pass
 
 
-class DownloadFailTemplateError(Exception):
+class UploadFailError(Exception):
     pass
 
 
-class DownloadFailBucketError(Exception):
+class TemplateRenderError(Exception):
     pass
 
 
-class UploadFailError(Exception):
+class JobSubmitError(Exception):
     pass
 
 
-class TemplateRenderError(Exception):
-    pass
+def raise_template_error(e: ClientError, s3resource: S3Resource, key: str):
+    error_code = e.response["Error"]["Code"]
+    if error_code in NOT_FOUND_CODES:
+        raise DownloadFailTemplateError(
+            f"Failed to get template: {key} from {s3resource.bucket_name}. "
+            "Please verify template name and its existance."
+        )
+    elif (error_code == "NoSuchBucket") or (error_code == "403"):
+        raise DownloadFailBucketError(
+            f"Failed to get template: {key} from {s3resource.bucket_name}. "
+            "Please verify bucket name and your access to it."
+        )
+    else:
+        raise e
 
 
-def download_template(s3resource: S3Resource, *, key: str, filename: str):
+def download_template(s3resource: S3Resource, *, key: str) -> CachedTemplate:
     # key - name of key in source bucket
-    # filename - path for downloaded file
+    # returns the cached local copy, downloaded only if missing or changed
     try:
-        s3resource.bucket.download_file(key, filename)
-        logger.info(f"template: {key} downloaded from {s3resource.bucket_name}")
+        with stage("download_template", template=key):
+            template = template_cache.fetch(s3resource, key)
+        add_bytes("template_bytes", template.size)
+        logger.info(f"template: {key} available from {s3resource.bucket_name}")
+        return template
     except ClientError as e:
-        error_code = e.response["Error"]["Code"]
-        if error_code == "404":
-            raise DownloadFailTemplateError(
-                f"Failed to get template: {key} from {s3resource.bucket_name}. "
-                "Please verify template name and its existance."
-            )
-        elif (error_code == "NoSuchBucket") or (error_code == "403"):
-            raise DownloadFailBucketError(
-                f"Failed to get template: {key} from {s3resource.bucket_name}. "
-                "Please verify bucket name and your access to it."
+        raise_template_error(e, s3resource, key)
+
+
+def render_digests(s3resource: S3Resource, *, template_key: str, items: list) -> list:
+    # items - [{"documentKey", "content"}]; one render hash per item, all None
+    # when deduplication is off. Only the template's ETag is read, not the file
+    if not RenderIndex.from_env():
+        return [None] * len(items)
+    # the hash does not cover referenced images, which can change in place
+    if all(image_keys(item["content"]) for item in items):
+        return [None] * len(items)
+    try:
+        etag = s3resource.client.head_object(
+            Bucket=s3resource.bucket_name, Key=template_key
+        )["ETag"]
+    except ClientError as e:
+        raise_template_error(e, s3resource, template_key)
+    return [
+        (
+            None
+            if image_keys(item["content"])
+            else render_hash(template_etag=etag, content=item["content"])
+        )
+        for item in items
+    ]
+
+
+def copy_rendered_document(s3resource: S3Resource, *, key: str, digest: str) -> bool:
+    # answers from an identical earlier render with a server-side copy;
+    # False when there is none and the document has to be rendered
+    if digest is None:
+        return False
+    index = RenderIndex.from_env()
+    try:
+        entry = index.get(digest)
+    except (ClientError, BotoCoreError) as e:
+        # the index only saves renders, a failed lookup is a miss
+        logger.error(f"render index lookup failed: {e}")
+        entry = None
+    if entry:
+        try:
+            # the index can be stale, the object's own hash is what counts
+            source = s3resource.client.head_object(
+                Bucket=entry["bucket"], Key=entry["key"]
             )
-        else:
-            raise e
+            if source["Metadata"].get(HASH_METADATA) == digest:
+                if (entry["bucket"], entry["key"]) != (s3resource.bucket_name, key):
+                    s3resource.client.copy_object(
+                        Bucket=s3resource.bucket_name,
+                        Key=key,
+                        CopySource={"Bucket": entry["bucket"], "Key": entry["key"]},
+                        CopySourceIfMatch=source["ETag"],
+                        MetadataDirective="COPY",
+                    )
+                stats = index.record(hit=True, size=source["ContentLength"])
+                logger.info(f"{key} copied from {entry['key']}, dedup: {stats}")
+                return True
+        except ClientError as e:
+            logger.info(f"earlier render {entry['key']} not reusable: {e}")
+    stats = index.record(hit=False)
+    logger.info(f"{key} has no earlier render, dedup: {stats}")
+    return False
 
 
 def upload_generated_document(
-    s3resource: S3Resource, *, key: str, filename: str
+    s3resource: S3Resource, *, key: str, fileobj: IO[bytes], metadata: dict = None
 ) -> bool:
     # key - name of key in target bucket
-    # filename - path of file to upload
+    # fileobj - generated document, read from the start
+    # multipart settings follow the document's size, see transfer_profile
     try:
-        s3resource.bucket.upload_file(filename, key)
+        size = fileobj.seek(0, io.SEEK_END)
+        fileobj.seek(0)
+        config = transfer_profile(size).config()
+        with stage("upload_generated_document"):
+            if metadata:
+                s3resource.bucket.upload_fileobj(
+                    fileobj, key, ExtraArgs={"Metadata": metadata}, Config=config
+                )
+            else:
+                s3resource.bucket.upload_fileobj(fileobj, key, Config=config)
+        add_bytes("document_bytes", size)
         logger.info(f"{key} created in {s3resource.bucket_name} bucket")
     except (ClientError, S3UploadFailedError) as e:
         raise UploadFailError(
@@ -88,69 +220,416 @@ def upload_generated_document(
         )
 
 
-def generate_document(documentpath: Path, templatepath: Path, *args, **kwargs):
+def render_template(
+    template: CachedTemplate, content, images: dict = None, jinja_env=None
+):
+    # rendered DocxTemplate; the template is parsed and compiled once per
+    # version, then reused
+    compiled = compiled_templates.get(template, jinja_env)
+    docxtemplate = compiled.new_document()
+    if images is not None:
+        docxtemplate.render(with_inline_images(content, docxtemplate, images))
+    else:
+        docxtemplate.render(content)
+    return docxtemplate
+
+
+def upload_streamed_document(s3resource: S3Resource, *, key: str, write):
+    # write(fileobj) - writes the document, uploaded in parts as it is written
+    try:
+        with stage("upload_generated_document"):
+            upload_stream(s3resource.bucket, key, write)
+        logger.info(f"{key} streamed to {s3resource.bucket_name} bucket")
+    except (ClientError, S3UploadFailedError) as e:
+        raise UploadFailError(
+            f"Failed to upload generated document: {key} to {s3resource.bucket_name}"
+        )
+
+
+def generate_document(document: IO[bytes], template: CachedTemplate, *args, **kwargs):
+    # document - writable file object the rendered docx is saved to
+    # images - fetched images by key, for content with image references
     content = kwargs.get("content", {})
     try:
-        docxtemplate = DocxTemplate(templatepath)
-        docxtemplate.render(content, jinja_env=kwargs.get("jinja_env"))
-        docxtemplate.save(documentpath)
-        logger.info(f"Rendered {str(templatepath)} template with {json.dumps(content)}")
+        with stage("generate_document", template=template.key):
+            docxtemplate = render_template(
+                template, content, kwargs.get("images"), kwargs.get("jinja_env")
+            )
+            # parts the render did not change are copied from the template
+            # without being inflated and deflated again
+            with template.open() as source:
+                if template.partial:
+                    # binary parts left in S3 are streamed into the package
+                    with io.BytesIO() as rendered:
+                        docxtemplate.save(rendered, source=source)
+                        template.partial.assemble(rendered, document)
+                else:
+                    docxtemplate.save(document, source=source)
+        logger.info(f"Rendered {template.key} template")
+        logger.debug("Rendered %s template with %s", template.key, Payload(content))
+    except MissingImageError:
+        raise
     except Exception as e:
         raise TemplateRenderError(
             f"Failed to render error: {str(e)} "
-            f"template: {str(templatepath)} "
-            f"content: {json.dumps(content)}"
+            f"template: {template.key} "
+            f"content: {Payload(content)}"
         )
 
 
-def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext):
-    logger.info("###EVENT RECIEVED")
-    logger.info(json.dumps(event, indent=2))
-
-    headers = {"Content-Type": "application/json"}
+def render_part(template: CachedTemplate, content: dict, images: dict = None):
+    # one part of a packet as a python-docx Document, kept in memory for the
+    # composer. Nothing is replaced in the package, so the rendered document
+    # needs none of DocxTemplate.save's post-processing
+    from docx import Document
 
+    if template.partial:
+        # binary parts left in S3 have to be put back first
+        with tempfile.SpooledTemporaryFile(max_size=IN_MEMORY_MAX_BYTES) as document:
+            generate_document(document, template, content=content, images=images)
+            document.seek(0)
+            return Document(document)
     try:
-        validate(event=event, schema=INPUT_SCHEMA)
-
-        template_bucket = event["queryStringParameters"]["templateBucket"].split(":::")[
-            1
-        ]
-        output_bucket = event["queryStringParameters"]["outputBucket"].split(":::")[1]
-        s3resource_templates = S3ResourceTemplates(
-            {
-                "resource": resource("s3"),
-                "bucket_name": template_bucket,
-            }
-        )
-        s3resource_output = S3ResoureOutput(
-            {
-                "resource": resource("s3"),
-                "bucket_name": output_bucket,
-            }
-        )
-        download_path = Path(f"/tmp/template-{uuid.uuid4()}.docx")
-        template_key = event["path"][1:]
-        download_template(
-            s3resource_templates, key=template_key, filename=download_path
+        return render_template(template, content, images).docx
+    except MissingImageError:
+        raise
+    except Exception as e:
+        raise TemplateRenderError(
+            f"Failed to render error: {str(e)} "
+            f"template: {template.key} "
+            f"content: {Payload(content)}"
         )
 
-        upload_path = Path(f"/tmp/generated-{uuid.uuid4()}.docx")
-        content = json.loads(event["body"])
+
+def document_location(bucket: str, key: str) -> str:
+    return f"https://{bucket}.s3.{REGION}.amazonaws.com/{key}"
+
+
+def presigned_url(s3resource: S3Resource, *, key: str) -> str:
+    # signed locally with the function's credentials, no request to S3
+    return s3resource.client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": s3resource.bucket_name, "Key": key},
+        ExpiresIn=PRESIGNED_URL_EXPIRES,
+    )
+
+
+def read_small_document(s3resource: S3Resource, *, key: str) -> Optional[bytes]:
+    # a document that was copied rather than rendered, None above the cap
+    response = s3resource.client.get_object(Bucket=s3resource.bucket_name, Key=key)
+    if response["ContentLength"] > INLINE_MAX_BYTES:
+        response["Body"].close()
+        return None
+    return response["Body"].read()
+
+
+def create_document(
+    template: CachedTemplate,
+    s3resource: S3Resource,
+    *,
+    key: str,
+    content: dict,
+    digest: str = None,
+    inline_max_bytes: int = 0,
+    images: dict = None,
+) -> Optional[bytes]:
+    # render one document and upload it to the output bucket; with a render
+    # hash the document is tagged with it and indexed for later copies.
+    # Returns the document when it is at most inline_max_bytes
+    metadata = {HASH_METADATA: digest} if digest else None
+    data = None
+    with tempfile.SpooledTemporaryFile(max_size=IN_MEMORY_MAX_BYTES) as document:
         generate_document(
-            documentpath=upload_path, templatepath=download_path, content=content
+            document=document, template=template, content=content, images=images
         )
-        generated_document_key = event["queryStringParameters"]["documentKey"]
+        # read before the upload, which closes the file
+        if document.seek(0, io.SEEK_END) <= inline_max_bytes:
+            document.seek(0)
+            data = document.read()
         upload_generated_document(
+            s3resource, key=key, fileobj=document, metadata=metadata
+        )
+    if digest:
+        try:
+            RenderIndex.from_env().put(digest, bucket=s3resource.bucket_name, key=key)
+        except (ClientError, BotoCoreError) as e:
+            # the document is uploaded, it is only not reused later
+            logger.error(f"render index write failed for {key}: {e}")
+    return data
+
+
+def referenced_images(s3resource: S3Resource, contents: list) -> Optional[dict]:
+    # images of every content, fetched together; None when there are none
+    keys = set().union(*(image_keys(content) for content in contents))
+    return fetch_images(image_cache, s3resource, keys) if keys else None
+
+
+def render_or_copy_document(
+    s3resource_templates: S3Resource,
+    s3resource_output: S3Resource,
+    *,
+    template_key: str,
+    key: str,
+    content: dict,
+    inline_max_bytes: int = 0,
+) -> Optional[bytes]:
+    # the template is only downloaded and rendered without an earlier copy;
+    # returns the rendered document when it is at most inline_max_bytes
+    [digest] = render_digests(
+        s3resource_templates,
+        template_key=template_key,
+        items=[{"documentKey": key, "content": content}],
+    )
+    if copy_rendered_document(s3resource_output, key=key, digest=digest):
+        return None
+    images = referenced_images(s3resource_templates, [content])
+    # the worker renders jobs concurrently from the same cache
+    with template_cache.hold():
+        template = download_template(s3resource_templates, key=template_key)
+        return create_document(
+            template,
             s3resource_output,
-            key=generated_document_key,
-            filename=upload_path,
+            key=key,
+            content=content,
+            digest=digest,
+            inline_max_bytes=inline_max_bytes,
+            images=images,
         )
 
-        bucket = s3resource_output.bucket_name
-        key = generated_document_key
-        headers["Location"] = f"https://{bucket}.s3.{REGION}.amazonaws.com/{key}"
-        status_code = 201
-        body = "OK"
+
+def create_documents(
+    s3resource_templates: S3Resource,
+    s3resource_output: S3Resource,
+    *,
+    template_key: str,
+    items: list,
+) -> list:
+    # copies, renders and uploads run in a worker pool sharing the S3
+    # connection pool; a failed item is reported in its status and does not
+    # stop the others. The template is downloaded once, if anything is rendered
+    digests = render_digests(
+        s3resource_templates, template_key=template_key, items=items
+    )
+    template = images = None
+
+    def created(key):
+        return {
+            "documentKey": key,
+            "statusCode": 201,
+            "location": document_location(s3resource_output.bucket_name, key),
+        }
+
+    def copy(item, digest):
+        key = item["documentKey"]
+        try:
+            if copy_rendered_document(s3resource_output, key=key, digest=digest):
+                return created(key)
+        except ClientError as e:
+            logger.error(e)
+
+    def create(item, digest):
+        key = item["documentKey"]
+        try:
+            create_document(
+                template,
+                s3resource_output,
+                key=key,
+                content=item["content"],
+                digest=digest,
+                images=images,
+            )
+            return created(key)
+        except MissingImageError as e:
+            return {"documentKey": key, "statusCode": 400, "message": str(e)}
+        except (UploadFailError, TemplateRenderError, ClientError) as e:
+            # e.g. a passthrough part no longer readable, only this item fails
+            logger.error(e)
+            return {"documentKey": key, "statusCode": 500, "message": str(e)}
+
+    with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(items))) as pool:
+        results = list(pool.map(copy, items, digests))
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            images = referenced_images(
+                s3resource_templates, [items[i]["content"] for i in missing]
+            )
+            template = download_template(s3resource_templates, key=template_key)
+            rendered = pool.map(
+                create,
+                [items[i] for i in missing],
+                [digests[i] for i in missing],
+            )
+            for i, result in zip(missing, rendered):
+                results[i] = result
+    return results
+
+
+def create_packet(
+    s3resource_templates: S3Resource,
+    s3resource_output: S3Resource,
+    *,
+    key: str,
+    parts: list,
+):
+    # parts - [{"template", "content", "pageBreak"}] merged in order into one
+    # document. Each template is downloaded once however often it is used;
+    # parts render in parallel and are appended as soon as their turn comes,
+    # and the merged package is streamed to S3 without a local copy
+    from docxcompose.composer import Composer
+
+    template_keys = list(dict.fromkeys(part["template"] for part in parts))
+    images = referenced_images(s3resource_templates, [p["content"] for p in parts])
+    # every template is downloaded before the first part renders, none of
+    # them may be evicted by the next one's download
+    with template_cache.hold(), ThreadPoolExecutor(
+        max_workers=min(BATCH_MAX_WORKERS, len(parts))
+    ) as pool:
+        templates = dict(
+            zip(
+                template_keys,
+                pool.map(
+                    lambda template_key: download_template(
+                        s3resource_templates, key=template_key
+                    ),
+                    template_keys,
+                ),
+            )
+        )
+        rendered = pool.map(
+            lambda part: render_part(
+                templates[part["template"]], part["content"], images
+            ),
+            parts,
+        )
+        composer = Composer(next(rendered))
+        for part, document in zip(parts[1:], rendered):
+            if part.get("pageBreak", True):
+                composer.doc.add_page_break()
+            composer.append(document)
+    upload_streamed_document(s3resource_output, key=key, write=composer.save)
+    logger.info(f"{key} assembled from {len(parts)} parts")
+
+
+def submit_job(request: DocumentRequest) -> str:
+    # records the job as queued and hands it to the worker queue; a job that
+    # cannot be queued is recorded as failed rather than left queued
+    job = {
+        "jobId": str(uuid.uuid4()),
+        "templateBucket": request.template_bucket,
+        "outputBucket": request.output_bucket,
+        "templateKey": request.template_key,
+        "documentKey": request.document_key,
+        "content": request.content,
+    }
+    body = message_body(job)
+    store = JobStore.from_env()
+    store.create(job)
+    try:
+        JobQueue.from_env().send(body)
+    except (ClientError, BotoCoreError) as e:
+        logger.error(e)
+        store.update(job["jobId"], FAILED, message="Failed to queue job")
+        raise JobSubmitError(f"Failed to queue job {job['jobId']}, please retry")
+    logger.info(f"job {job['jobId']} queued for {request.template_key}")
+    return job["jobId"]
+
+
+def cache_stats() -> dict:
+    return {
+        "template_cache": dict(template_cache.stats),
+        "compiled_template_cache": dict(compiled_templates.stats),
+    }
+
+
+def add_cache_metrics(before: dict):
+    # hits and misses of this request; a container handles one at a time
+    for name, stats in cache_stats().items():
+        for outcome in ("hits", "misses"):
+            add_count(f"{name}_{outcome}", stats[outcome] - before[name][outcome])
+
+
+@instrumented
+@profiled
+def lambda_handler(event: "APIGatewayProxyEvent", context: LambdaContext):
+    log_request(logger, event)
+
+    headers = {"Content-Type": "application/json"}
+    is_base64 = False
+    stats = cache_stats()
+    add_bytes("request_bytes", len(event.get("body") or ""))
+
+    try:
+        with stage("validate"):
+            request = parse_document_request(event)
+        metrics.add_dimension(name="template", value=request.template_key or "packet")
+        if request.strict and not request.is_batch:
+            check_content(
+                S3ResourceTemplates.for_bucket(request.template_bucket),
+                request.template_key,
+                request.content,
+            )
+
+        if request.is_async and not request.is_batch:
+            job_id = submit_job(request)
+            headers["Location"] = f"/jobs/{job_id}"
+            status_code = 202
+            body = {"jobId": job_id, "status": QUEUED}
+        else:
+            s3resource_templates = S3ResourceTemplates.for_bucket(
+                request.template_bucket
+            )
+            s3resource_output = S3ResourceOutput.for_bucket(request.output_bucket)
+            if request.is_packet:
+                create_packet(
+                    s3resource_templates,
+                    s3resource_output,
+                    key=request.document_key,
+                    parts=request.content,
+                )
+                headers["Location"] = document_location(
+                    s3resource_output.bucket_name, request.document_key
+                )
+                status_code = 201
+                body = "OK"
+            elif request.is_batch:
+                body = create_documents(
+                    s3resource_templates,
+                    s3resource_output,
+                    template_key=request.template_key,
+                    items=request.content,
+                )
+                status_code = 200
+            else:
+                inline = request.response == "inline"
+                data = render_or_copy_document(
+                    s3resource_templates,
+                    s3resource_output,
+                    template_key=request.template_key,
+                    key=request.document_key,
+                    content=request.content,
+                    inline_max_bytes=INLINE_MAX_BYTES if inline else 0,
+                )
+                if inline and data is None:
+                    data = read_small_document(
+                        s3resource_output, key=request.document_key
+                    )
+                headers["Location"] = document_location(
+                    s3resource_output.bucket_name, request.document_key
+                )
+                status_code = 201
+                body = "OK"
+                if data is not None:
+                    headers["Content-Type"] = DOCX_CONTENT_TYPE
+                    headers["Content-Disposition"] = (
+                        f'attachment; filename="{Path(request.document_key).name}"'
+                    )
+                    body = base64.b64encode(data).decode()
+                    is_base64 = True
+                elif request.response != "location":
+                    # presigned, or inline over the size cap
+                    url = presigned_url(s3resource_output, key=request.document_key)
+                    headers["Location"] = url
+                    body = {"url": url, "expiresIn": PRESIGNED_URL_EXPIRES}
 
     except DownloadFailTemplateError as e:
         logger.error(e)
@@ -162,10 +641,18 @@ def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext):
         body = str(e)
         status_code = 403
 
-    except SchemaValidationError as e:
+    except (SchemaValidationError, MissingVariablesError, MissingImageError) as e:
         body = str(e)
         status_code = 400
 
+    except JobSizeError as e:
+        body = str(e)
+        status_code = 413
+
+    except JobSubmitError as e:
+        body = str(e)
+        status_code = 503
+
     except (UploadFailError, TemplateRenderError) as e:
         logger.error(e)
         body = str(e)
@@ -177,6 +664,14 @@ def lambda_handler(event: APIGatewayProxyEvent, context: LambdaContext):
         status_code = 500
 
     finally:
+        add_cache_metrics(stats)
+        if is_base64:
+            return {
+                "statusCode": status_code,
+                "headers": headers,
+                "body": body,
+                "isBase64Encoded": True,
+            }
         return {
             "statusCode": status_code,
             "headers": headers,
@@ -0,0 +1,161 @@
+import functools
+import logging
+import uuid
+from os import environ
+from typing import Optional
+from urllib.parse import urlencode
+from botocore.exceptions import BotoCoreError, ClientError
+from webshell_common.request_logging import LOG_LEVEL
+from webshell_common.s3 import S3ResourceOutput
+from .validation import ARN_PREFIX, BATCH_RESOURCE
+
+logger = logging.getLogger()
+logger.setLevel(LOG_LEVEL)
+
+# off unless set at deploy time; when off, profiled() leaves the handler as
+# it is and a request asking for a profile is rendered as usual
+PROFILING_ENABLED = environ.get("PROFILING_ENABLED", "false").lower() == "true"
+# profiles are written to the request's output bucket under this prefix,
+# which /resources leaves out of the documents it lists
+PROFILE_PREFIX = environ.get("PROFILE_PREFIX", "_diagnostics/profiles/")
+# frames kept per allocation in memory profiles
+PROFILE_TRACEMALLOC_FRAMES = int(environ.get("PROFILE_TRACEMALLOC_FRAMES", 32))
+# the one header read, besides ?profile=
+PROFILE_HEADER = "x-webshell-profile"
+PROFILE_MODES = ("cpu", "memory")
+
+
+def requested_profile(event: dict) -> Optional[str]:
+    # "cpu", "memory" or None; other values are ignored, never an error
+    query = event.get("queryStringParameters") or {}
+    headers = {
+        name.lower(): value for name, value in (event.get("headers") or {}).items()
+    }
+    mode = query.get("profile") or headers.get(PROFILE_HEADER)
+    return mode if mode in PROFILE_MODES else None
+
+
+def profile_cpu(handler, event, context) -> tuple:
+    # pstats file, as written by Stats.dump_stats: snakeviz, gprof2dot or
+    # pstats.Stats read it. Threads started by the handler, e.g. the pools
+    # rendering batch items and packet parts, get their own profiler and are
+    # merged into the handler's
+    import cProfile
+    import marshal
+    import pstats
+    import threading
+
+    profilers = []
+
+    def start_thread_profiler(frame, event, arg):
+        # called once per new thread, the profiler then replaces it
+        profiler = cProfile.Profile()
+        profilers.append(profiler)
+        profiler.enable()
+
+    profiler = cProfile.Profile()
+    threading.setprofile(start_thread_profiler)
+    try:
+        response = profiler.runcall(handler, event, context)
+    finally:
+        threading.setprofile(None)
+        stats = pstats.Stats(profiler)
+        for thread_profiler in profilers:
+            thread_profiler.create_stats()
+            if thread_profiler.stats:
+                stats.add(thread_profiler)
+    return response, marshal.dumps(stats.stats), "prof"
+
+
+def collapsed_stacks(snapshot) -> bytes:
+    # one "outer;...;inner bytes" line per allocation site, the input of
+    # flamegraph.pl and speedscope
+    lines = []
+    for stat in snapshot.statistics("traceback"):
+        frames = ";".join(
+            f"{frame.filename.rsplit('site-packages/', 1)[-1]}:{frame.lineno}"
+            for frame in stat.traceback
+        )
+        lines.append(f"{frames} {stat.size}")
+    return "\n".join(lines).encode()
+
+
+def profile_memory(handler, event, context) -> tuple:
+    # allocations still live when the handler returns, i.e. what the request
+    # leaves in the caches of a warm container; the peak is logged
+    import tracemalloc
+
+    tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+    try:
+        response = handler(event, context)
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    logger.info(f"traced allocations peaked at {peak} bytes")
+    snapshot = snapshot.filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),)
+    )
+    return response, collapsed_stacks(snapshot), "collapsed"
+
+
+PROFILERS = {"cpu": profile_cpu, "memory": profile_memory}
+
+
+def upload_profile(event: dict, context, *, mode: str, data: bytes, ext: str):
+    # the profile's S3 URI, or None when it could not be written; a failed
+    # upload never changes the response
+    query = event.get("queryStringParameters") or {}
+    bucket_name = (query.get("outputBucket") or "").removeprefix(ARN_PREFIX)
+    if not bucket_name:
+        logger.warning("profile dropped, the request has no output bucket")
+        return None
+    request_id = (event.get("requestContext") or {}).get("requestId") or getattr(
+        context, "aws_request_id", None
+    )
+    request_id = request_id or str(uuid.uuid4())
+    template = (event.get("path") or "")[1:]
+    if event.get("resource") == BATCH_RESOURCE:
+        template = template.removesuffix("/batch")
+    key = f"{PROFILE_PREFIX}{request_id}-{mode}.{ext}"
+    s3resource = S3ResourceOutput.for_bucket(bucket_name)
+    try:
+        s3resource.bucket.put_object(
+            Key=key,
+            Body=data,
+            ContentType="application/octet-stream",
+            Tagging=urlencode(
+                {"request-id": request_id, "template": template, "profile": mode}
+            ),
+        )
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"Failed to upload profile: {key} to {bucket_name}: {e}")
+        return None
+    logger.info(f"{mode} profile {key} uploaded to {s3resource.bucket_name}")
+    return f"s3://{s3resource.bucket_name}/{key}"
+
+
+def profiled(handler):
+    """Handler profiled per request, on demand
+
+    With PROFILING_ENABLED a request sending ?profile=cpu|memory, or the
+    X-Webshell-Profile header, runs under cProfile or tracemalloc and the
+    profile is written to PROFILE_PREFIX in its output bucket. The response
+    links it in X-Webshell-Profile-Location. Without PROFILING_ENABLED the
+    handler is returned unwrapped.
+    """
+    if not PROFILING_ENABLED:
+        return handler
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        mode = requested_profile(event)
+        if mode is None:
+            return handler(event, context)
+        response, data, ext = PROFILERS[mode](handler, event, context)
+        location = upload_profile(event, context, mode=mode, data=data, ext=ext)
+        if location:
+            response["headers"]["X-Webshell-Profile-Location"] = location
+        return response
+
+    return wrapper
@@ -0,0 +1,209 @@
+import io
+import logging
+import zipfile
+from dataclasses import dataclass, field
+from typing import IO, Iterator
+from .zip_package import RawZipWriter, local_entry_chunks, raw_entry_chunks
+
+logger = logging.getLogger()
+
+# end of central directory plus, for most templates, the central directory
+TAIL_BYTES = 64 * 1024
+# ranges closer than this are fetched with a single GET
+COALESCE_GAP = 64 * 1024
+TEMPLATED_SUFFIXES = (".xml", ".rels")
+
+
+class RangedObjectReader:
+    """Seekable, read-only view of an S3 object served by Range GETs
+
+    Every request carries IfMatch on the ETag, so the view never mixes bytes
+    from two versions of the object.
+    """
+
+    def __init__(self, obj, *, size: int, etag: str):
+        self.obj = obj
+        self.size = size
+        self.etag = etag
+        self.bytes_fetched = 0
+        self.requests = 0
+        self._spans: list[tuple[int, bytes]] = []
+        self._pos = 0
+
+    def add_span(self, start: int, data: bytes):
+        self._spans.append((start, data))
+
+    def prefetch(self, ranges: list[tuple[int, int]]):
+        # ranges - [start, end) byte ranges, merged when close together
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start - merged[-1][1] <= COALESCE_GAP:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        for start, end in merged:
+            if self._from_spans(start, end - start) is None:
+                self.add_span(start, self.open_range(start, end).read())
+
+    def open_range(self, start: int, end: int) -> IO[bytes]:
+        # streaming body for [start, end)
+        response = self.obj.get(Range=f"bytes={start}-{end - 1}", IfMatch=self.etag)
+        self.requests += 1
+        self.bytes_fetched += response["ContentLength"]
+        return response["Body"]
+
+    def read(self, n: int = -1) -> bytes:
+        if n is None or n < 0:
+            n = self.size - self._pos
+        n = min(n, self.size - self._pos)
+        data = self._from_spans(self._pos, n)
+        if data is None:
+            data = self.open_range(self._pos, self._pos + n).read()
+        self._pos += len(data)
+        return data
+
+    def _from_spans(self, start: int, n: int):
+        for span_start, data in self._spans:
+            if span_start <= start and start + n <= span_start + len(data):
+                return data[start - span_start : start - span_start + n]
+        return None
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._pos = offset
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seekable(self) -> bool:
+        return True
+
+
+@dataclass(frozen=True)
+class RemoteEntry:
+    """Package part left in S3, referenced by its byte range"""
+
+    zinfo: zipfile.ZipInfo
+    start: int
+    end: int
+
+
+@dataclass
+class PartialPackage:
+    """Template package with only its templated parts fetched
+
+    `stub` is a valid package in which every large binary part (media,
+    fonts, embeddings) is an empty placeholder. After rendering, `assemble`
+    swaps the placeholders for the original compressed bytes, streamed from
+    S3 by range.
+    """
+
+    source: object
+    size: int
+    etag: str
+    stub: bytes
+    remote_entries: dict = field(default_factory=dict)
+    bytes_fetched: int = 0
+
+    def assemble(self, rendered: IO[bytes], document: IO[bytes]):
+        reader = RangedObjectReader(self.source, size=self.size, etag=self.etag)
+        with zipfile.ZipFile(rendered) as package, RawZipWriter(document) as writer:
+            for zinfo in package.infolist():
+                remote = self.remote_entries.get(zinfo.filename)
+                if remote and zinfo.file_size == 0:
+                    writer.write_raw(remote.zinfo, self._remote_chunks(reader, remote))
+                else:
+                    writer.write_raw(zinfo, local_entry_chunks(rendered, zinfo))
+        logger.info(
+            f"assembled document with {len(self.remote_entries)} ranged parts "
+            f"in {reader.requests} requests, {reader.bytes_fetched} bytes"
+        )
+
+    @staticmethod
+    def _remote_chunks(reader: RangedObjectReader, remote: RemoteEntry) -> Iterator:
+        body = reader.open_range(remote.start, remote.end)
+        try:
+            yield from raw_entry_chunks(body, remote.zinfo)
+        finally:
+            body.close()
+
+
+def total_size(response: dict) -> int:
+    # "bytes 6-9/10" for a ranged response, ContentLength otherwise
+    content_range = response.get("ContentRange")
+    if content_range:
+        return int(content_range.rsplit("/", 1)[1])
+    return response["ContentLength"]
+
+
+def remaining_body(obj, response: dict) -> list[IO[bytes]]:
+    """Streams that together make up the whole object behind a tail response"""
+    tail = response["Body"]
+    size = total_size(response)
+    if response["ContentLength"] == size:
+        return [tail]
+    head = obj.get(
+        Range=f"bytes=0-{size - response['ContentLength'] - 1}",
+        IfMatch=response["ETag"],
+    )
+    return [head["Body"], tail]
+
+
+def is_passthrough(zinfo: zipfile.ZipInfo, min_bytes: int) -> bool:
+    return (
+        not zinfo.filename.endswith(TEMPLATED_SUFFIXES)
+        and zinfo.compress_size >= min_bytes
+    )
+
+
+def fetch_partial_package(obj, response: dict, *, min_bytes: int) -> PartialPackage:
+    """Fetch the central directory and templated parts of a package by range
+
+    obj - S3 object the tail `response` was read from
+    min_bytes - binary parts at least this large (compressed) stay in S3
+    """
+    size = total_size(response)
+    tail = response["Body"].read()
+    reader = RangedObjectReader(obj, size=size, etag=response["ETag"])
+    reader.add_span(size - len(tail), tail)
+    stub = io.BytesIO()
+    remote_entries = {}
+    with zipfile.ZipFile(reader) as package:
+        infos = package.infolist()
+        # each entry ends where the next one (or the central directory) starts
+        offsets = sorted({zinfo.header_offset for zinfo in infos} | {package.start_dir})
+        ends = {offset: end for offset, end in zip(offsets, offsets[1:])}
+        needed = [zinfo for zinfo in infos if not is_passthrough(zinfo, min_bytes)]
+        reader.prefetch([(z.header_offset, ends[z.header_offset]) for z in needed])
+        with RawZipWriter(stub) as writer:
+            for zinfo in infos:
+                if is_passthrough(zinfo, min_bytes):
+                    remote_entries[zinfo.filename] = RemoteEntry(
+                        zinfo=zinfo,
+                        start=zinfo.header_offset,
+                        end=ends[zinfo.header_offset],
+                    )
+                    writer.write(
+                        zipfile.ZipInfo(zinfo.filename, date_time=zinfo.date_time),
+                        b"",
+                    )
+                else:
+                    writer.write_raw(zinfo, local_entry_chunks(reader, zinfo))
+    partial = PartialPackage(
+        source=obj,
+        size=size,
+        etag=response["ETag"],
+        stub=stub.getvalue(),
+        remote_entries=remote_entries,
+        bytes_fetched=len(tail) + reader.bytes_fetched,
+    )
+    logger.info(
+        f"ranged fetch of {obj.key}: {partial.bytes_fetched} of {size} bytes "
+        f"in {reader.requests + 1} requests, "
+        f"{len(remote_entries)} parts left in S3"
+    )
+    return partial
@@ -0,0 +1,70 @@
+import functools
+import hashlib
+import json
+import threading
+import time
+from os import environ
+import boto3
+
+# bump when a change to rendering makes earlier output stale
+RENDER_VERSION = "1"
+# object metadata (x-amz-meta-render-hash) written on every rendered document
+HASH_METADATA = "render-hash"
+# index entries expire unless the document is rendered again
+INDEX_TTL = int(environ.get("RENDER_INDEX_TTL_SECONDS", 30 * 24 * 60 * 60))
+
+
+def render_hash(*, template_etag: str, content, options: dict = None) -> str:
+    # the same template version, content and options always render the same
+    # document; content is canonicalized so key order does not matter
+    canonical = json.dumps(
+        {
+            "version": RENDER_VERSION,
+            "template": template_etag,
+            "content": content,
+            "options": options or {},
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class RenderIndex:
+    """Location of an earlier render by render hash, in DynamoDB"""
+
+    def __init__(self, table):
+        self.table = table
+        self.stats = {"hits": 0, "misses": 0, "bytesSaved": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    @functools.cache
+    def from_env(cls):
+        # deduplication is off unless the index table is configured
+        name = environ.get("RENDER_INDEX_TABLE")
+        return cls(boto3.resource("dynamodb").Table(name)) if name else None
+
+    def get(self, digest: str):
+        return self.table.get_item(Key={"renderHash": digest}).get("Item")
+
+    def put(self, digest: str, *, bucket: str, key: str):
+        self.table.put_item(
+            Item={
+                "renderHash": digest,
+                "bucket": bucket,
+                "key": key,
+                "expiresAt": int(time.time()) + INDEX_TTL,
+            }
+        )
+
+    def record(self, *, hit: bool, size: int = 0):
+        with self._lock:
+            if hit:
+                self.stats["hits"] += 1
+                self.stats["bytesSaved"] += size
+            else:
+                self.stats["misses"] += 1
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {**self.stats, "hitRate": round(self.stats["hits"] / lookups, 3)}
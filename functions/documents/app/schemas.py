@@ -1,3 +1,4 @@
+# compiled once in validation.py, which also parses the JSON bodies
 INPUT_SCHEMA = {
     "$schema": "https://json-schema.org/draft/2020-12/schema",
     "$id": "https://example.com/documents.schema.json",
@@ -32,19 +33,267 @@ INPUT_SCHEMA = {
                 "templateBucket": {
                     "$id": "#/properties/queryStringParameters/templateBucket",
                     "type": "string",
-                    "pattern": "(?<=arn:aws:s3:::)[ a-zA-Z0-9!_.*'()-]+",
+                    "pattern": "^arn:aws:s3:::[ a-zA-Z0-9!_.*'()-]+$",
                 },
                 "outputBucket": {
                     "$id": "#/properties/queryStringParameters/outputBucket",
                     "type": "string",
-                    "pattern": "(?<=arn:aws:s3:::)[ a-zA-Z0-9!_.*'()-]+",
+                    "pattern": "^arn:aws:s3:::[ a-zA-Z0-9!_.*'()-]+$",
+                },
+                "mode": {
+                    "$id": "#/properties/queryStringParameters/mode",
+                    "description": "async queues the document and returns a job",
+                    "type": "string",
+                    "enum": ["sync", "async"],
+                },
+                "response": {
+                    "$id": "#/properties/queryStringParameters/response",
+                    "description": (
+                        "location (default) only links the document, inline "
+                        "returns it base64-encoded, presigned links it with a "
+                        "time-limited GET URL"
+                    ),
+                    "type": "string",
+                    "enum": ["location", "inline", "presigned"],
+                },
+                "strict": {
+                    "$id": "#/properties/queryStringParameters/strict",
+                    "description": (
+                        "true rejects content missing a template variable "
+                        "before anything is downloaded or rendered"
+                    ),
+                    "type": "string",
+                    "enum": ["true", "false"],
+                },
+                "profile": {
+                    "$id": "#/properties/queryStringParameters/profile",
+                    "description": (
+                        "cpu or memory profiles the request when PROFILING_ENABLED "
+                        "is set, see profiling.py"
+                    ),
+                    "type": "string",
+                    "enum": ["cpu", "memory"],
+                },
+            },
+        },
+        "body": {
+            "description": "Content for the template to render, a JSON object",
+            "type": "string",
+        },
+    },
+}
+
+_query_properties = INPUT_SCHEMA["properties"]["queryStringParameters"]["properties"]
+
+BATCH_INPUT_SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "$id": "https://example.com/documents-batch.schema.json",
+    "title": "Document Batch",
+    "description": "Content for a batch of documents from one template",
+    "type": "object",
+    "required": ["httpMethod", "pathParameters", "queryStringParameters", "body"],
+    "properties": {
+        "httpMethod": INPUT_SCHEMA["properties"]["httpMethod"],
+        "pathParameters": INPUT_SCHEMA["properties"]["pathParameters"],
+        "queryStringParameters": {
+            "type": "object",
+            "required": ["templateBucket", "outputBucket"],
+            "properties": {
+                "templateBucket": _query_properties["templateBucket"],
+                "outputBucket": _query_properties["outputBucket"],
+                "profile": _query_properties["profile"],
+                # a batch is rendered at once, checked only against the items
+                # schema and answered with a status per item, anything else is
+                # rejected rather than ignored
+                "mode": {**_query_properties["mode"], "enum": ["sync"]},
+                "strict": {**_query_properties["strict"], "enum": ["false"]},
+                "response": {**_query_properties["response"], "enum": ["location"]},
+            },
+        },
+        "body": {
+            "description": "Array of documents to render, see BATCH_ITEMS_SCHEMA",
+            "type": "string",
+        },
+    },
+}
+
+BATCH_ITEMS_SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "$id": "https://example.com/documents-batch-items.schema.json",
+    "title": "Document Batch Items",
+    "description": "Documents to render, one per item",
+    "type": "array",
+    "minItems": 1,
+    "maxItems": 500,
+    "items": {
+        "type": "object",
+        "required": ["documentKey", "content"],
+        "properties": {
+            "documentKey": {"type": "string"},
+            "content": {
+                "description": "Content for the template to render",
+                "type": "object",
+            },
+        },
+    },
+}
+
+PACKET_INPUT_SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "$id": "https://example.com/packets.schema.json",
+    "title": "Document Packet",
+    "description": "Templates rendered and merged, in order, into one document",
+    "type": "object",
+    "required": ["httpMethod", "queryStringParameters", "body"],
+    "properties": {
+        "httpMethod": INPUT_SCHEMA["properties"]["httpMethod"],
+        "queryStringParameters": {
+            "type": "object",
+            "required": ["documentKey", "templateBucket", "outputBucket"],
+            "properties": {
+                "documentKey": _query_properties["documentKey"],
+                "templateBucket": _query_properties["templateBucket"],
+                "outputBucket": _query_properties["outputBucket"],
+                "profile": _query_properties["profile"],
+                # a packet is neither queued as a job nor checked against a
+                # template's variables, both are rejected rather than ignored
+                "mode": {**_query_properties["mode"], "enum": ["sync"]},
+                "strict": {**_query_properties["strict"], "enum": ["false"]},
+            },
+        },
+        "body": {
+            "description": "Array of parts, see PACKET_PARTS_SCHEMA",
+            "type": "string",
+        },
+    },
+}
+
+PACKET_PARTS_SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "$id": "https://example.com/packet-parts.schema.json",
+    "title": "Document Packet Parts",
+    "description": "Parts of the packet, in document order",
+    "type": "array",
+    "minItems": 1,
+    "maxItems": 50,
+    "items": {
+        "type": "object",
+        "required": ["template", "content"],
+        "properties": {
+            "template": {
+                "description": "Key of the template in the templates bucket",
+                "type": "string",
+            },
+            "content": {
+                "description": "Content for the template to render",
+                "type": "object",
+            },
+            "pageBreak": {
+                "description": "Start the part on a new page, default true",
+                "type": "boolean",
+            },
+        },
+    },
+}
+
+BUNDLE_INPUT_SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "$id": "https://example.com/bundles.schema.json",
+    "title": "Document Bundle",
+    "description": "Generated documents zipped into one archive",
+    "type": "object",
+    "required": ["httpMethod", "queryStringParameters", "body"],
+    "properties": {
+        "httpMethod": INPUT_SCHEMA["properties"]["httpMethod"],
+        "queryStringParameters": {
+            "type": "object",
+            "required": ["documentKey", "outputBucket"],
+            "properties": {
+                "documentKey": _query_properties["documentKey"],
+                "outputBucket": _query_properties["outputBucket"],
+                "response": {
+                    "$id": "#/properties/queryStringParameters/response",
+                    "description": (
+                        "location (default) only links the bundle, presigned "
+                        "links it with a time-limited GET URL"
+                    ),
+                    "type": "string",
+                    "enum": ["location", "presigned"],
                 },
             },
         },
         "body": {
-            "description": "Content for the template to render",
+            "description": "Documents to bundle, see BUNDLE_CONTENT_SCHEMA",
+            "type": "string",
+        },
+    },
+}
+
+BUNDLE_CONTENT_SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "$id": "https://example.com/bundle-content.schema.json",
+    "title": "Document Bundle Content",
+    "description": "Every document under a prefix, or a list of keys",
+    "type": "object",
+    "oneOf": [{"required": ["prefix"]}, {"required": ["keys"]}],
+    "properties": {
+        "prefix": {
+            "description": "Key prefix in the output bucket, e.g. cases/123/",
+            "type": "string",
+            "minLength": 1,
+        },
+        "keys": {
+            "description": "Keys in the output bucket, in archive order",
+            "type": "array",
+            "minItems": 1,
+            "maxItems": 1000,
+            "items": {"type": "string", "minLength": 1},
+        },
+    },
+}
+
+JOB_STATUS_SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "$id": "https://example.com/jobs.schema.json",
+    "title": "Job Status Request",
+    "description": "Status of an asynchronous document job",
+    "type": "object",
+    "required": ["httpMethod", "pathParameters"],
+    "properties": {
+        "httpMethod": {
+            "description": "Endpoint only accepts GET method",
             "type": "string",
-            "contentMediaType": "application/json",
+            "pattern": "GET",
+        },
+        "pathParameters": {
+            "type": "object",
+            "required": ["id"],
+            "properties": {
+                "id": {
+                    "$id": "#/properties/pathParameters/id",
+                    "type": "string",
+                },
+            },
+        },
+    },
+}
+
+TEMPLATE_SCHEMA_REQUEST = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "$id": "https://example.com/template-schema.schema.json",
+    "title": "Template Schema Request",
+    "description": "Variables a template expects in its content",
+    "type": "object",
+    "required": ["httpMethod", "pathParameters", "queryStringParameters"],
+    "properties": {
+        "httpMethod": JOB_STATUS_SCHEMA["properties"]["httpMethod"],
+        "pathParameters": INPUT_SCHEMA["properties"]["pathParameters"],
+        "queryStringParameters": {
+            "type": "object",
+            "required": ["templateBucket"],
+            "properties": {
+                "templateBucket": _query_properties["templateBucket"],
+            },
         },
     },
 }
@@ -0,0 +1,306 @@
+import io
+import logging
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Optional
+from botocore.exceptions import ClientError
+from webshell_common.s3 import IO_CHUNK_BYTES, download_ranges, transfer_profile
+from .ranged_template import (
+    TAIL_BYTES,
+    PartialPackage,
+    fetch_partial_package,
+    remaining_body,
+    total_size,
+)
+
+logger = logging.getLogger()
+
+NOT_FOUND_CODES = ("404", "NoSuchKey")
+
+
+@dataclass(frozen=True)
+class CachedTemplate:
+    """Template held in the warm container cache, in memory or on disk"""
+
+    bucket_name: str
+    key: str
+    etag: str
+    size: int
+    data: Optional[bytes] = None
+    path: Optional[Path] = None
+    # set when only the templated parts were fetched, data is then the stub
+    partial: Optional[PartialPackage] = None
+
+    @property
+    def in_memory(self) -> bool:
+        return self.data is not None
+
+    def open(self) -> IO[bytes]:
+        if self.in_memory:
+            return io.BytesIO(self.data)
+        return self.path.open("rb")
+
+
+def download_to_file(obj, response: dict, fp: IO[bytes]):
+    """Write the whole object behind a GET `response` (full or tail) to fp
+
+    Below the transfer profile's multipart threshold the object is streamed;
+    above it the part already in flight is read from `response` and the rest
+    is fetched by range in parallel, pinned to the response's ETag.
+    """
+    size = total_size(response)
+    profile = transfer_profile(size)
+    if size < profile.multipart_threshold:
+        for body in remaining_body(obj, response):
+            shutil.copyfileobj(body, fp)
+        return
+    body = response["Body"]
+    start = size - response["ContentLength"]
+    if start:
+        # tail of a ranged GET, the head is missing
+        fp.seek(start)
+        shutil.copyfileobj(body, fp)
+        ranges = profile.ranges(0, start)
+    else:
+        read = 0
+        while read < profile.multipart_chunksize:
+            chunk = body.read(min(IO_CHUNK_BYTES, profile.multipart_chunksize - read))
+            if not chunk:
+                break
+            fp.write(chunk)
+            read += len(chunk)
+        body.close()
+        ranges = profile.ranges(read, size)
+    fp.flush()
+    download_ranges(
+        obj,
+        fp,
+        ranges,
+        etag=response["ETag"],
+        max_concurrency=profile.max_concurrency,
+    )
+
+
+class TemplateCache:
+    """LRU cache of templates, kept in memory or on local disk (/tmp)
+
+    Entries are keyed by (bucket, key) and revalidated against S3 with a
+    conditional GET on the stored ETag, so an unchanged template costs a
+    single 304 response. Templates up to `memory_threshold` bytes are kept
+    in memory under `max_memory_bytes`, larger ones are written to `root`
+    under `max_bytes`. Missing templates are remembered for `negative_ttl`
+    seconds.
+
+    With `ranged_min_bytes` set, every GET asks for the tail of the package
+    only. Templates at least that large are then fetched part by part and
+    their binary parts of `passthrough_min_bytes` or more are left in S3.
+
+    The file of an entry fetched inside `hold()` is not deleted before the
+    hold exits, even when the entry is replaced or evicted meanwhile.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        max_bytes: int,
+        negative_ttl: float,
+        max_memory_bytes: int = 0,
+        memory_threshold: int = 0,
+        ranged_min_bytes: int = 0,
+        passthrough_min_bytes: int = 0,
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.memory_threshold = memory_threshold
+        self.ranged_min_bytes = ranged_min_bytes
+        self.passthrough_min_bytes = passthrough_min_bytes
+        self.negative_ttl = negative_ttl
+        self.current_bytes = 0
+        self.current_memory_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "negative_hits": 0}
+        self._entries: OrderedDict[tuple, CachedTemplate] = OrderedDict()
+        self._missing: dict[tuple, float] = {}
+        # files fetched inside each open hold(), how many holds have them,
+        # and those dropped from the cache while held, deleted on release
+        self._holds: list[set] = []
+        self._held: Counter = Counter()
+        self._released: set[Path] = set()
+        self._lock = threading.Lock()
+        # files left behind by a previous init of this execution environment
+        # are not tracked, so start from an empty directory
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def fetch(self, s3resource, key: str) -> CachedTemplate:
+        cache_key = (s3resource.bucket_name, key)
+        self._check_missing(cache_key)
+        entry = self._entries.get(cache_key)
+        obj = s3resource.bucket.Object(key)
+        get_args = {}
+        if entry:
+            get_args["IfNoneMatch"] = entry.etag
+        if self.ranged_min_bytes:
+            get_args["Range"] = f"bytes=-{TAIL_BYTES}"
+        try:
+            response = obj.get(**get_args)
+        except ClientError as e:
+            error_code = e.response["Error"]["Code"]
+            if entry and error_code == "304":
+                return self._hit(cache_key, entry)
+            if error_code in NOT_FOUND_CODES:
+                self._remember_missing(cache_key)
+            raise e
+
+        size = total_size(response)
+        data = path = partial = None
+        if self.ranged_min_bytes and size >= self.ranged_min_bytes:
+            partial = fetch_partial_package(
+                obj, response, min_bytes=self.passthrough_min_bytes
+            )
+            data = partial.stub
+            size = len(data)
+        elif size <= min(self.memory_threshold, self.max_memory_bytes):
+            data = b"".join(body.read() for body in remaining_body(obj, response))
+        else:
+            path = self.root / f"template-{uuid.uuid4()}.docx"
+            self.root.mkdir(parents=True, exist_ok=True)
+            with path.open("wb") as fp:
+                download_to_file(obj, response, fp)
+        entry = CachedTemplate(
+            bucket_name=s3resource.bucket_name,
+            key=key,
+            etag=response["ETag"],
+            size=size,
+            data=data,
+            path=path,
+            partial=partial,
+        )
+        self._store(cache_key, entry)
+        return entry
+
+    @contextmanager
+    def hold(self):
+        # for templates read after fetch() returns, e.g. a packet's or by
+        # concurrent jobs: a download is not unlinked by another one
+        held = set()
+        with self._lock:
+            self._holds.append(held)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._holds.remove(held)
+                for path in held:
+                    self._held[path] -= 1
+                    if self._held[path]:
+                        continue
+                    del self._held[path]
+                    if path in self._released:
+                        self._released.remove(path)
+                        path.unlink(missing_ok=True)
+
+    def _hold(self, entry: CachedTemplate):
+        # under the lock; entries in memory are never unlinked
+        if entry.in_memory:
+            return
+        for held in self._holds:
+            if entry.path not in held:
+                held.add(entry.path)
+                self._held[entry.path] += 1
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                self._discard(entry)
+            self._entries.clear()
+            self._missing.clear()
+
+    def _hit(self, cache_key: tuple, entry: CachedTemplate) -> CachedTemplate:
+        with self._lock:
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+            self._hold(entry)
+            self.stats["hits"] += 1
+        self._log(cache_key, "hit")
+        return entry
+
+    def _store(self, cache_key: tuple, entry: CachedTemplate):
+        with self._lock:
+            stale = self._entries.pop(cache_key, None)
+            if stale:
+                self._discard(stale)
+            self._entries[cache_key] = entry
+            if entry.in_memory:
+                self.current_memory_bytes += entry.size
+            else:
+                self.current_bytes += entry.size
+            self._hold(entry)
+            self.stats["misses"] += 1
+            self._evict(in_memory=entry.in_memory, keep=cache_key)
+        self._log(cache_key, "miss")
+
+    def _evict(self, *, in_memory: bool, keep: tuple = None):
+        # least recently used entries of the same kind go first, never the
+        # entry that was just stored
+        candidates = [
+            cache_key
+            for cache_key, entry in self._entries.items()
+            if entry.in_memory == in_memory and cache_key != keep
+        ]
+        for cache_key in candidates:
+            if not self._over_budget(in_memory=in_memory):
+                break
+            self._discard(self._entries.pop(cache_key))
+            self.stats["evictions"] += 1
+
+    def _over_budget(self, *, in_memory: bool) -> bool:
+        if in_memory:
+            return self.current_memory_bytes > self.max_memory_bytes
+        return self.current_bytes > self.max_bytes
+
+    def _discard(self, entry: CachedTemplate):
+        if entry.in_memory:
+            self.current_memory_bytes -= entry.size
+        else:
+            if self._held[entry.path]:
+                self._released.add(entry.path)
+            else:
+                entry.path.unlink(missing_ok=True)
+            self.current_bytes -= entry.size
+
+    def _check_missing(self, cache_key: tuple):
+        with self._lock:
+            expires = self._missing.get(cache_key)
+            if expires is None:
+                return
+            if expires < time.monotonic():
+                del self._missing[cache_key]
+                return
+            self.stats["negative_hits"] += 1
+        self._log(cache_key, "negative hit")
+        raise ClientError(
+            error_response={"Error": {"Code": "404", "Message": "Not Found (cached)"}},
+            operation_name="GetObject",
+        )
+
+    def _remember_missing(self, cache_key: tuple):
+        with self._lock:
+            self._missing[cache_key] = time.monotonic() + self.negative_ttl
+            stale = self._entries.pop(cache_key, None)
+            if stale:
+                self._discard(stale)
+
+    def _log(self, cache_key: tuple, outcome: str):
+        logger.info(
+            f"template cache {outcome}: {cache_key[1]} from {cache_key[0]} "
+            f"stats={self.stats} "
+            f"disk={self.current_bytes}/{self.max_bytes} "
+            f"memory={self.current_memory_bytes}/{self.max_memory_bytes}"
+        )
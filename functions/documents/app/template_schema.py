@@ -0,0 +1,56 @@
+from os import environ
+from webshell_common.catalog import read_catalog
+from webshell_common.s3 import S3Resource
+
+# a warm container trusts its copy of the catalog this long before asking S3
+# again; only a rejection always revalidates, so a stale catalog can delay a
+# rejection but never cause a wrong one
+CATALOG_MAX_AGE = float(environ.get("CATALOG_MAX_AGE_SECONDS", 60))
+
+
+class MissingVariablesError(Exception):
+    def __init__(self, key: str, missing: list, unexpected: list):
+        self.missing = missing
+        self.unexpected = unexpected
+        message = (
+            f"Content for template {key} is missing variables: {', '.join(missing)}"
+        )
+        if unexpected:
+            message += f". Not used by the template: {', '.join(unexpected)}"
+        super().__init__(message)
+
+
+def cataloged_template(s3resource: S3Resource, key: str, *, max_age: float = 0):
+    # the template's catalog entry, with the variables extracted when this
+    # version was added; None when the bucket or template is not cataloged
+    catalog = read_catalog(s3resource, max_age=max_age)
+    return catalog["templates"].get(key) if catalog else None
+
+
+def content_schema(variables: list) -> dict:
+    # JSON schema of the content a template expects
+    return {
+        "$schema": "https://json-schema.org/draft/2020-12/schema",
+        "type": "object",
+        "required": variables,
+        "properties": {name: {} for name in variables},
+    }
+
+
+def missing_variables(entry, content) -> list:
+    if not entry or not isinstance(content, dict):
+        return []
+    return [name for name in entry["variables"] if name not in content]
+
+
+def check_content(s3resource: S3Resource, key: str, content: dict):
+    # raises MissingVariablesError without downloading or rendering the
+    # template; templates not in the catalog yet are not checked
+    entry = cataloged_template(s3resource, key, max_age=CATALOG_MAX_AGE)
+    if not missing_variables(entry, content):
+        return
+    entry = cataloged_template(s3resource, key)
+    missing = missing_variables(entry, content)
+    if missing:
+        unexpected = sorted(set(content) - set(entry["variables"]))
+        raise MissingVariablesError(key, missing, unexpected)
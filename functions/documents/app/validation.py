@@ -0,0 +1,84 @@
+from dataclasses import dataclass
+from typing import Any
+from webshell_common.validation import Validator, parse_json_body
+from .schemas import (
+    INPUT_SCHEMA,
+    BATCH_INPUT_SCHEMA,
+    BATCH_ITEMS_SCHEMA,
+    BUNDLE_CONTENT_SCHEMA,
+    BUNDLE_INPUT_SCHEMA,
+    JOB_STATUS_SCHEMA,
+    PACKET_INPUT_SCHEMA,
+    PACKET_PARTS_SCHEMA,
+    TEMPLATE_SCHEMA_REQUEST,
+)
+
+ARN_PREFIX = "arn:aws:s3:::"
+# API Gateway route templates (event["resource"]) of template.yaml; the path
+# alone cannot tell a batch from a template named batch
+BATCH_RESOURCE = "/documents/{template}/batch"
+PACKET_RESOURCE = "/packets"
+
+validate_input = Validator(INPUT_SCHEMA)
+validate_batch_input = Validator(BATCH_INPUT_SCHEMA)
+validate_batch_items = Validator(BATCH_ITEMS_SCHEMA)
+validate_packet_input = Validator(PACKET_INPUT_SCHEMA)
+validate_packet_parts = Validator(PACKET_PARTS_SCHEMA)
+validate_bundle_input = Validator(BUNDLE_INPUT_SCHEMA)
+validate_bundle_content = Validator(BUNDLE_CONTENT_SCHEMA)
+validate_job_status = Validator(JOB_STATUS_SCHEMA)
+validate_template_schema = Validator(TEMPLATE_SCHEMA_REQUEST)
+
+
+@dataclass(frozen=True)
+class DocumentRequest:
+    """Validated POST /documents or /packets request, parsed once"""
+
+    template_bucket: str
+    output_bucket: str
+    # None for a packet, whose parts name their templates
+    template_key: str
+    # the body: template content, the items of a batch or the parts of a packet
+    content: Any
+    document_key: str = None
+    is_batch: bool = False
+    is_packet: bool = False
+    is_async: bool = False
+    # how a rendered document is returned: location, inline or presigned
+    response: str = "location"
+    # content is checked against the template's variables before rendering
+    strict: bool = False
+
+
+def parse_document_request(event: dict) -> DocumentRequest:
+    # raises SchemaValidationError like powertools' validate
+    is_batch = event.get("resource") == BATCH_RESOURCE
+    is_packet = event.get("resource") == PACKET_RESOURCE
+    if is_packet:
+        validate_packet_input(event)
+        content = validate_packet_parts(parse_json_body(event))
+    elif is_batch:
+        validate_batch_input(event)
+        content = validate_batch_items(parse_json_body(event))
+    else:
+        validate_input(event)
+        content = parse_json_body(event)
+    query = event["queryStringParameters"]
+    template_key = None
+    if not is_packet:
+        template_key = event["path"][1:]
+        if is_batch:
+            template_key = template_key.removesuffix("/batch")
+    return DocumentRequest(
+        # the schema anchors both ARNs on ARN_PREFIX
+        template_bucket=query["templateBucket"].removeprefix(ARN_PREFIX),
+        output_bucket=query["outputBucket"].removeprefix(ARN_PREFIX),
+        template_key=template_key,
+        content=content,
+        document_key=query.get("documentKey"),
+        is_batch=is_batch,
+        is_packet=is_packet,
+        is_async=query.get("mode") == "async",
+        response=query.get("response", "location"),
+        strict=query.get("strict") == "true",
+    )
@@ -0,0 +1,170 @@
+import struct
+import zipfile
+import zlib
+from typing import IO, Iterable, Iterator
+
+CHUNK_SIZE = 1024 * 1024
+DATA_DESCRIPTOR_FLAG = 0x08
+UTF8_FLAG = 0x800
+ZIP_VERSION = 20
+# field positions in zipfile.structFileHeader
+FH_SIGNATURE = 0
+FH_FILENAME_LENGTH = 10
+FH_EXTRA_FIELD_LENGTH = 11
+
+
+def raw_entry_chunks(
+    stream: IO[bytes], zinfo: zipfile.ZipInfo, chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Compressed data of an entry, read from its local header onwards"""
+    header = stream.read(zipfile.sizeFileHeader)
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    if fields[FH_SIGNATURE] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local file header for {zinfo.filename}")
+    stream.read(fields[FH_FILENAME_LENGTH] + fields[FH_EXTRA_FIELD_LENGTH])
+    remaining = zinfo.compress_size
+    while remaining:
+        chunk = stream.read(min(chunk_size, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated data for {zinfo.filename}")
+        remaining -= len(chunk)
+        yield chunk
+
+
+def local_entry_chunks(fp: IO[bytes], zinfo: zipfile.ZipInfo) -> Iterator[bytes]:
+    fp.seek(zinfo.header_offset)
+    return raw_entry_chunks(fp, zinfo)
+
+
+class RawZipWriter:
+    """Zip writer that takes entries as already-compressed bytes
+
+    Parts copied from another package keep their original compressed data,
+    CRC and sizes, so they are never inflated or deflated again. Zip64 is not
+    supported, which is far beyond any docx this service renders.
+    """
+
+    def __init__(self, fileobj: IO[bytes]):
+        self.fileobj = fileobj
+        self._start = fileobj.tell()
+        self._central_directory = []
+
+    def write_raw(self, zinfo: zipfile.ZipInfo, chunks: Iterable[bytes]):
+        # zinfo must carry the CRC, sizes and compress_type of the chunks
+        header_offset = self.fileobj.tell() - self._start
+        if header_offset > zipfile.ZIP64_LIMIT:
+            raise zipfile.LargeZipFile("Zip64 packages are not supported")
+        filename = zinfo.filename.encode("utf-8")
+        flag_bits = zinfo.flag_bits & ~DATA_DESCRIPTOR_FLAG
+        if not zinfo.filename.isascii():
+            flag_bits |= UTF8_FLAG
+        dostime, dosdate = _dos_datetime(zinfo.date_time)
+        self.fileobj.write(
+            struct.pack(
+                zipfile.structFileHeader,
+                zipfile.stringFileHeader,
+                ZIP_VERSION,
+                0,
+                flag_bits,
+                zinfo.compress_type,
+                dostime,
+                dosdate,
+                zinfo.CRC,
+                zinfo.compress_size,
+                zinfo.file_size,
+                len(filename),
+                0,
+            )
+        )
+        self.fileobj.write(filename)
+        written = 0
+        for chunk in chunks:
+            self.fileobj.write(chunk)
+            written += len(chunk)
+        if written != zinfo.compress_size:
+            raise zipfile.BadZipFile(
+                f"Expected {zinfo.compress_size} bytes for {zinfo.filename}, "
+                f"got {written}"
+            )
+        self._central_directory.append(
+            struct.pack(
+                zipfile.structCentralDir,
+                zipfile.stringCentralDir,
+                ZIP_VERSION,
+                zinfo.create_system,
+                ZIP_VERSION,
+                0,
+                flag_bits,
+                zinfo.compress_type,
+                dostime,
+                dosdate,
+                zinfo.CRC,
+                zinfo.compress_size,
+                zinfo.file_size,
+                len(filename),
+                0,
+                0,
+                0,
+                zinfo.internal_attr,
+                zinfo.external_attr,
+                header_offset,
+            )
+            + filename
+        )
+
+    def write(
+        self,
+        zinfo: zipfile.ZipInfo,
+        data: bytes,
+        compresslevel: int = zlib.Z_DEFAULT_COMPRESSION,
+    ):
+        # compresses new data with the entry's compress_type
+        if zinfo.compress_type == zipfile.ZIP_DEFLATED:
+            compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+            compressed = compressor.compress(data) + compressor.flush()
+        elif zinfo.compress_type == zipfile.ZIP_STORED:
+            compressed = data
+        else:
+            raise zipfile.BadZipFile(
+                f"Unsupported compression for {zinfo.filename}: {zinfo.compress_type}"
+            )
+        zinfo.CRC = zlib.crc32(data)
+        zinfo.file_size = len(data)
+        zinfo.compress_size = len(compressed)
+        self.write_raw(zinfo, (compressed,))
+
+    def close(self):
+        directory_offset = self.fileobj.tell() - self._start
+        for record in self._central_directory:
+            self.fileobj.write(record)
+        directory_size = self.fileobj.tell() - self._start - directory_offset
+        count = len(self._central_directory)
+        if count > zipfile.ZIP_FILECOUNT_LIMIT:
+            raise zipfile.LargeZipFile("Zip64 packages are not supported")
+        self.fileobj.write(
+            struct.pack(
+                zipfile.structEndArchive,
+                zipfile.stringEndArchive,
+                0,
+                0,
+                count,
+                count,
+                directory_size,
+                directory_offset,
+                0,
+            )
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+def _dos_datetime(date_time: tuple) -> tuple:
+    year, month, day, hour, minute, second = date_time
+    dosdate = (max(year, 1980) - 1980) << 9 | month << 5 | day
+    dostime = hour << 11 | minute << 5 | (second // 2)
+    return dostime, dosdate
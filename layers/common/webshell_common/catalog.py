@@ -0,0 +1,64 @@
+import json
+import threading
+import time
+from os import environ
+from botocore.exceptions import ClientError
+from .s3 import S3Resource
+
+# kept in the templates bucket itself, outside the template prefixes
+CATALOG_KEY = environ.get("CATALOG_KEY", "_catalog.json")
+CATALOG_VERSION = 1
+
+# bucket name -> (etag, catalog, time read), survives between invocations
+_catalogs: dict = {}
+_lock = threading.Lock()
+
+
+def empty_catalog() -> dict:
+    return {"version": CATALOG_VERSION, "templates": {}}
+
+
+def read_catalog(s3resource: S3Resource, *, max_age: float = 0):
+    # returns the catalog of a bucket, or None if it has not been built yet;
+    # a warm container only downloads it again when its ETag has changed,
+    # and does not ask S3 at all within max_age seconds of the last check
+    bucket_name = s3resource.bucket_name
+    with _lock:
+        cached = _catalogs.get(bucket_name)
+    if cached and time.monotonic() - cached[2] < max_age:
+        return cached[1]
+    request = {"Bucket": bucket_name, "Key": CATALOG_KEY}
+    if cached:
+        request["IfNoneMatch"] = cached[0]
+    try:
+        response = s3resource.client.get_object(**request)
+    except ClientError as e:
+        error_code = e.response["Error"]["Code"]
+        if error_code == "304":
+            with _lock:
+                _catalogs[bucket_name] = (cached[0], cached[1], time.monotonic())
+            return cached[1]
+        if error_code in ("NoSuchKey", "404"):
+            with _lock:
+                _catalogs.pop(bucket_name, None)
+            return None
+        raise
+    catalog = json.loads(response["Body"].read())
+    with _lock:
+        _catalogs[bucket_name] = (response["ETag"], catalog, time.monotonic())
+    return catalog
+
+
+def write_catalog(s3resource: S3Resource, catalog: dict):
+    response = s3resource.client.put_object(
+        Bucket=s3resource.bucket_name,
+        Key=CATALOG_KEY,
+        Body=json.dumps(catalog, separators=(",", ":"), sort_keys=True).encode(),
+        ContentType="application/json",
+    )
+    with _lock:
+        _catalogs[s3resource.bucket_name] = (
+            response["ETag"],
+            catalog,
+            time.monotonic(),
+        )
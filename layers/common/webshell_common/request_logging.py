@@ -0,0 +1,57 @@
+import json
+import logging
+import random
+from os import environ
+
+# ApplicationLogLevel of the function's LoggingConfig, when it is set
+LOG_LEVEL = environ.get("AWS_LAMBDA_LOG_LEVEL", "INFO")
+# full request payloads are logged for this share of requests, or for all of
+# them with LOG_PAYLOADS=true; everything else only logs a summary
+PAYLOAD_SAMPLE_RATE = float(environ.get("LOG_PAYLOAD_SAMPLE_RATE", 0))
+LOG_PAYLOADS = environ.get("LOG_PAYLOADS", "false").lower() == "true"
+PAYLOAD_MAX_CHARS = int(environ.get("LOG_PAYLOAD_MAX_CHARS", 2048))
+
+
+class Payload:
+    """Serialized and truncated only when a log record is actually formatted
+
+    Pass as a %-style logging argument, never in an f-string.
+    """
+
+    def __init__(self, value, max_chars: int = None):
+        self.value = value
+        self.max_chars = max_chars or PAYLOAD_MAX_CHARS
+
+    def __str__(self) -> str:
+        try:
+            text = json.dumps(self.value, separators=(",", ":"), default=str)
+        except (TypeError, ValueError):
+            text = repr(self.value)
+        if len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}...[{len(text)} chars]"
+        return text
+
+
+def payload_sampled() -> bool:
+    return LOG_PAYLOADS or random.random() < PAYLOAD_SAMPLE_RATE
+
+
+def request_summary(event: dict) -> dict:
+    # what is needed to find a request again, without its content
+    query = event.get("queryStringParameters") or {}
+    return {
+        "method": event.get("httpMethod"),
+        "path": event.get("path"),
+        "requestId": (event.get("requestContext") or {}).get("requestId"),
+        "bodyBytes": len(event.get("body") or ""),
+        "query": {name: value[:256] for name, value in query.items()},
+    }
+
+
+def log_request(logger: logging.Logger, event: dict):
+    # replaces logging json.dumps(event, indent=2) on every invocation
+    logger.info("request received", extra={"request": request_summary(event)})
+    if payload_sampled():
+        logger.info("request payload: %s", Payload(event))
+    else:
+        logger.debug("request payload: %s", Payload(event))
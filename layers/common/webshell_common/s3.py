@@ -0,0 +1,219 @@
+import functools
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from os import environ
+import boto3
+from botocore.config import Config
+
+MB = 1024 * 1024
+# size of each read from a part's stream while it is written to disk
+IO_CHUNK_BYTES = 256 * 1024
+
+# one connection pool per container, shared by every bucket handle
+S3_CONFIG = Config(
+    max_pool_connections=int(environ.get("S3_MAX_POOL_CONNECTIONS", 32)),
+    tcp_keepalive=True,
+    # presigned URLs default to SigV2, which newer regions reject
+    signature_version="s3v4",
+    retries={
+        "mode": "adaptive",
+        "max_attempts": int(environ.get("S3_MAX_ATTEMPTS", 5)),
+    },
+)
+
+
+@functools.cache
+def s3_resource():
+    """S3 resource created once and reused across invocations"""
+    return boto3.session.Session().resource("s3", config=S3_CONFIG)
+
+
+class S3Resource:
+    """AWS S3 Resource"""
+
+    _handles: dict = {}
+
+    def __init__(self, lambda_s3_resource: dict):
+        self.resource = lambda_s3_resource["resource"]
+        self.bucket_name = lambda_s3_resource["bucket_name"]
+        self.bucket = self.resource.Bucket(self.bucket_name)
+
+    @property
+    def client(self):
+        return self.resource.meta.client
+
+    @classmethod
+    def for_bucket(cls, bucket_name: str):
+        # handles are cached per class and bucket for the life of the container
+        handle_key = (cls, bucket_name)
+        if handle_key not in cls._handles:
+            cls._handles[handle_key] = cls(
+                {"resource": s3_resource(), "bucket_name": bucket_name}
+            )
+        return cls._handles[handle_key]
+
+
+class S3ResourceOutput(S3Resource):
+    # separate classes for patching
+    pass
+
+
+class S3ResourceTemplates(S3Resource):
+    # separate classes for patching
+    pass
+
+
+@dataclass(frozen=True)
+class TransferProfile:
+    """Multipart settings for one S3 transfer, see transfer_profile"""
+
+    multipart_threshold: int
+    multipart_chunksize: int
+    max_concurrency: int
+    # "classic", "crt" or "auto"; CRT needs awscrt in the deployment package
+    transfer_client: str = "classic"
+
+    def config(self):
+        # s3transfer is only imported once something is transferred
+        from boto3.s3.transfer import TransferConfig
+
+        config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_chunksize,
+            max_concurrency=self.max_concurrency,
+            preferred_transfer_client=self.transfer_client,
+        )
+        # parts of a file object are read into memory before they are sent;
+        # keep at most one per thread, concurrency x chunksize must fit
+        # the function's MemorySize
+        config.max_in_memory_upload_chunks = self.max_concurrency
+        return config
+
+    def ranges(self, start: int, end: int) -> list[tuple[int, int]]:
+        # inclusive byte ranges of at most one chunk covering [start, end)
+        return [
+            (offset, min(offset + self.multipart_chunksize, end) - 1)
+            for offset in range(start, end, self.multipart_chunksize)
+        ]
+
+
+TRANSFER_PROFILES = {
+    "default": TransferProfile(
+        multipart_threshold=int(environ.get("S3_MULTIPART_THRESHOLD", 8 * MB)),
+        multipart_chunksize=int(environ.get("S3_MULTIPART_CHUNKSIZE", 8 * MB)),
+        max_concurrency=int(environ.get("S3_MAX_CONCURRENCY", 4)),
+        transfer_client=environ.get("S3_TRANSFER_CLIENT", "classic"),
+    ),
+    # generated documents with embedded scans, 30MB and more
+    "large": TransferProfile(
+        multipart_threshold=int(environ.get("S3_MULTIPART_THRESHOLD", 8 * MB)),
+        multipart_chunksize=int(environ.get("S3_LARGE_CHUNKSIZE", 16 * MB)),
+        max_concurrency=int(environ.get("S3_LARGE_MAX_CONCURRENCY", 4)),
+        transfer_client=environ.get("S3_TRANSFER_CLIENT", "classic"),
+    ),
+}
+# objects of this size or more use the large profile
+LARGE_OBJECT_BYTES = int(environ.get("S3_LARGE_OBJECT_BYTES", 32 * MB))
+
+
+def transfer_profile(size: int) -> TransferProfile:
+    if size >= LARGE_OBJECT_BYTES:
+        return TRANSFER_PROFILES["large"]
+    return TRANSFER_PROFILES["default"]
+
+
+def download_ranges(obj, fp, ranges: list, *, etag: str, max_concurrency: int):
+    """Ranged GETs of one object version in parallel, each written in place
+
+    obj - boto3 Object; fp - file opened for writing, at least as large as
+    the ranges; ranges - inclusive (first, last) byte offsets. IfMatch makes
+    a GET fail instead of mixing in a newer version of the object.
+    """
+
+    def download(byte_range):
+        first, last = byte_range
+        body = obj.get(Range=f"bytes={first}-{last}", IfMatch=etag)["Body"]
+        offset = first
+        for chunk in iter(lambda: body.read(IO_CHUNK_BYTES), b""):
+            os.pwrite(fp.fileno(), chunk, offset)
+            offset += len(chunk)
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_concurrency, len(ranges)))
+    ) as pool:
+        # list() re-raises the first failed part
+        list(pool.map(download, ranges))
+
+
+class _PipeReader(io.RawIOBase):
+    """Read end of an upload pipe that fails, rather than ending, on error
+
+    Without this a writer that raised would look like the end of the object
+    and the upload would complete truncated.
+    """
+
+    def __init__(self, fd: int):
+        self._file = os.fdopen(fd, "rb")
+        self.error = None
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        if not data and self.error:
+            raise self.error
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def upload_stream(bucket, key: str, write, *, config=None, extra_args: dict = None):
+    """Upload whatever write(fileobj) writes, never holding all of it
+
+    write runs in its own thread into a pipe that the upload reads from, so
+    the object goes up in parts while it is being written. If write raises,
+    the upload fails with that error and no object is created.
+    """
+    read_fd, write_fd = os.pipe()
+    reader = _PipeReader(read_fd)
+
+    def produce():
+        fileobj = os.fdopen(write_fd, "wb")
+        try:
+            write(fileobj)
+            fileobj.flush()
+        except BaseException as e:
+            reader.error = e
+        finally:
+            # only once the error is set may the reader see the end of the
+            # pipe, or it would take a failed write for a complete one
+            try:
+                fileobj.close()
+            except OSError:
+                pass
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        writing = pool.submit(produce)
+        try:
+            bucket.upload_fileobj(
+                reader,
+                key,
+                ExtraArgs=extra_args,
+                Config=config or TRANSFER_PROFILES["default"].config(),
+            )
+        finally:
+            # unblocks the writer if the upload stopped reading early
+            reader.close()
+            writing.result()
+    if reader.error:
+        raise reader.error
@@ -0,0 +1,87 @@
+import functools
+import time
+from contextlib import contextmanager, nullcontext
+from os import environ
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+
+# EMF documents printed to stdout after every invocation, which CloudWatch
+# turns into metrics; locally the same lines can be read by the benchmarks
+metrics = Metrics(
+    namespace=environ.get("POWERTOOLS_METRICS_NAMESPACE", "sam-webshell"),
+    service=environ.get("POWERTOOLS_SERVICE_NAME", "sam-webshell"),
+)
+
+
+def tracing_enabled(env) -> bool:
+    # the X-Ray SDK costs ~170ms of cold start, so stage subsegments are
+    # opt-in per function: in Lambda, with TRACE_STAGES=true and unless
+    # POWERTOOLS_TRACE_DISABLED=true. Tracing: Active traces the invocation
+    # either way
+    return (
+        "AWS_LAMBDA_FUNCTION_NAME" in env
+        and env.get("TRACE_STAGES", "false").lower() == "true"
+        and env.get("POWERTOOLS_TRACE_DISABLED", "false").lower() != "true"
+    )
+
+
+TRACING = tracing_enabled(environ)
+if TRACING:
+    from aws_lambda_powertools import Tracer
+
+    tracer = Tracer()
+else:
+    tracer = None
+
+_cold_start = True
+
+
+@contextmanager
+def stage(name: str, **annotations):
+    # one subsegment and one {name}_ms sample per stage; a stage that runs
+    # more than once in a request, e.g. per batch item, adds a sample each
+    # time and CloudWatch keeps the distribution
+    start = time.perf_counter()
+    span = tracer.provider.in_subsegment(f"## {name}") if tracer else nullcontext()
+    with span as subsegment:
+        if subsegment:
+            for key, value in annotations.items():
+                subsegment.put_annotation(key, value)
+        try:
+            yield
+        finally:
+            metrics.add_metric(
+                name=f"{name}_ms",
+                unit=MetricUnit.Milliseconds,
+                value=(time.perf_counter() - start) * 1000,
+            )
+
+
+def add_bytes(name: str, value: int):
+    metrics.add_metric(name=name, unit=MetricUnit.Bytes, value=value)
+
+
+def add_count(name: str, value: int = 1):
+    metrics.add_metric(name=name, unit=MetricUnit.Count, value=value)
+
+
+def instrumented(handler):
+    """Handler flushing its metrics after every invocation
+
+    Records whether the invocation was a cold start and, when tracing, wraps
+    it in a subsegment. Responses are not added to traces, they can hold
+    whole documents.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _cold_start
+        cold_start, _cold_start = _cold_start, False
+        metrics.add_metadata(key="is_cold_start", value=cold_start)
+        if cold_start:
+            add_count("cold_start")
+        return handler(event, context)
+
+    if tracer:
+        wrapper = tracer.capture_lambda_handler(wrapper, capture_response=False)
+    return metrics.log_metrics(wrapper)
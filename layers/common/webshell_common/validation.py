@@ -0,0 +1,46 @@
+import json
+import fastjsonschema
+from aws_lambda_powertools.utilities.validation import SchemaValidationError
+
+
+class Validator:
+    """JSON schema compiled once, at import, instead of on every call
+
+    Raises the same SchemaValidationError as powertools' validate.
+    """
+
+    def __init__(self, schema: dict):
+        self.schema = schema
+        self._validate = fastjsonschema.compile(schema)
+
+    def __call__(self, data):
+        try:
+            return self._validate(data)
+        except fastjsonschema.JsonSchemaValueException as e:
+            raise SchemaValidationError(
+                f"Failed schema validation. Error: {e.message}, "
+                f"Path: {e.path}, Data: {e.value}",
+                validation_message=e.message,
+                name=e.name,
+                path=e.path,
+                value=e.value,
+                definition=e.definition,
+                rule=e.rule,
+                rule_definition=e.rule_definition,
+            )
+
+
+def parse_json_body(event: dict):
+    # the body is parsed once here rather than by the schema and again by
+    # the handler; errors read like the schema's contentMediaType check
+    try:
+        return json.loads(event["body"])
+    except (TypeError, ValueError):
+        raise SchemaValidationError(
+            "Failed schema validation. Error: data.body must be JSON, "
+            f"Path: ['data', 'body'], Data: {event['body']}",
+            validation_message="data.body must be JSON",
+            name="data.body",
+            path=["data", "body"],
+            value=event["body"],
+        )
@@ -2,10 +2,12 @@ import os
 import pytest
 import boto3
 from moto import mock_aws
-from functions.documents.app.lambda_file import (
-    S3ResourceTemplates,
-    S3ResoureOutput,
-)
+from webshell_common.s3 import S3ResourceTemplates, S3ResourceOutput
+from functions.documents.app.template_cache import TemplateCache
+from functions.documents.app.compiled_cache import CompiledTemplateCache
+from functions.documents.app.images import ImageCache
+from functions.documents.app.jobs import JobQueue, JobStore
+from functions.documents.app.render_index import RenderIndex
 
 
 @pytest.fixture(scope="function")
@@ -69,7 +71,7 @@ def mock_s3_resource_templates_with_wrong_bucket_name(
 
 @pytest.fixture
 def mock_s3_resource_output(mock_output_bucket, mock_s3_resource):
-    return S3ResoureOutput(
+    return S3ResourceOutput(
         {
             "resource": mock_s3_resource,
             "bucket_name": mock_output_bucket,
@@ -80,12 +82,7 @@ def mock_s3_resource_output(mock_output_bucket, mock_s3_resource):
 @pytest.fixture
 def patched_s3_resource_output(monkeypatch, mock_s3_resource_output):
     monkeypatch.setattr(
-        "functions.documents.app.lambda_file.S3ResoureOutput",
-        lambda _: mock_s3_resource_output,
-    )
-    monkeypatch.setattr(
-        "functions.app_resources.app.lambda_file.S3ResoureOutput",
-        lambda _: mock_s3_resource_output,
+        S3ResourceOutput, "for_bucket", lambda _: mock_s3_resource_output
     )
     return mock_s3_resource_output
 
@@ -93,12 +90,7 @@ def patched_s3_resource_output(monkeypatch, mock_s3_resource_output):
 @pytest.fixture
 def patched_s3_resource_templates(monkeypatch, mock_s3_resource_templates):
     monkeypatch.setattr(
-        "functions.documents.app.lambda_file.S3ResourceTemplates",
-        lambda _: mock_s3_resource_templates,
-    )
-    monkeypatch.setattr(
-        "functions.app_resources.app.lambda_file.S3ResourceTemplates",
-        lambda _: mock_s3_resource_templates,
+        S3ResourceTemplates, "for_bucket", lambda _: mock_s3_resource_templates
     )
     return mock_s3_resource_templates
 
@@ -108,12 +100,44 @@ def patched_s3_resource_templates_with_wrong_bucket_name(
     monkeypatch, mock_s3_resource_templates_with_wrong_bucket_name
 ):
     monkeypatch.setattr(
-        "functions.documents.app.lambda_file.S3ResourceTemplates",
+        S3ResourceTemplates,
+        "for_bucket",
         lambda _: mock_s3_resource_templates_with_wrong_bucket_name,
     )
     return mock_s3_resource_templates_with_wrong_bucket_name
 
 
+@pytest.fixture
+def template_cache(tmp_path):
+    return TemplateCache(
+        tmp_path / "templates", max_bytes=10 * 1024 * 1024, negative_ttl=30
+    )
+
+
+@pytest.fixture
+def patched_template_cache(monkeypatch, template_cache):
+    monkeypatch.setattr(
+        "functions.documents.app.lambda_file.template_cache", template_cache
+    )
+    return template_cache
+
+
+@pytest.fixture
+def patched_image_cache(monkeypatch):
+    image_cache = ImageCache(max_bytes=1024 * 1024, ttl=300)
+    monkeypatch.setattr("functions.documents.app.lambda_file.image_cache", image_cache)
+    return image_cache
+
+
+@pytest.fixture
+def patched_compiled_templates(monkeypatch):
+    compiled_templates = CompiledTemplateCache(max_bytes=10 * 1024 * 1024)
+    monkeypatch.setattr(
+        "functions.documents.app.lambda_file.compiled_templates", compiled_templates
+    )
+    return compiled_templates
+
+
 @pytest.fixture
 def mock_template_bucket_with_templates(
     patched_s3_resource_templates, request, pytestconfig
@@ -140,3 +164,53 @@ def mock_output_bucket_with_documents(
         patched_s3_resource_output.bucket.upload_file(
             docx_file, f"{prefix}/{filename}.docx"
         )
+
+
+@pytest.fixture
+def mock_jobs_table(mock_s3_client):
+    # shares the mock_aws context of mock_s3_client
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    return dynamodb.create_table(
+        TableName="test_jobs_table",
+        KeySchema=[{"AttributeName": "jobId", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "jobId", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+@pytest.fixture
+def mock_jobs_queue(mock_s3_client):
+    sqs = boto3.resource("sqs", region_name="us-east-1")
+    return sqs.create_queue(QueueName="test_jobs_queue")
+
+
+@pytest.fixture
+def patched_job_store(monkeypatch, mock_jobs_table):
+    store = JobStore(mock_jobs_table)
+    monkeypatch.setattr(JobStore, "from_env", lambda: store)
+    return store
+
+
+@pytest.fixture
+def patched_job_queue(monkeypatch, mock_jobs_queue):
+    queue = JobQueue(mock_jobs_queue)
+    monkeypatch.setattr(JobQueue, "from_env", lambda: queue)
+    return queue
+
+
+@pytest.fixture
+def mock_render_index_table(mock_s3_client):
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    return dynamodb.create_table(
+        TableName="test_render_index_table",
+        KeySchema=[{"AttributeName": "renderHash", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "renderHash", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+@pytest.fixture
+def patched_render_index(monkeypatch, mock_render_index_table):
+    index = RenderIndex(mock_render_index_table)
+    monkeypatch.setattr(RenderIndex, "from_env", lambda: index)
+    return index
@@ -1,5 +1,9 @@
 import pytest
 import json
+import time
+from botocore.exceptions import EndpointConnectionError
+from webshell_common.s3 import S3ResourceTemplates
+from functions.app_resources.app import lambda_file as app_resources
 from functions.app_resources.app.lambda_file import lambda_handler
 
 
@@ -50,6 +54,34 @@ class TestHappyPath:
         ), "Did not find document in bucket"
         assert response["statusCode"] == 200
 
+    @pytest.mark.parametrize(
+        "mock_output_bucket_with_documents",
+        [("general_amdt_doc",)],
+        indirect=True,
+    )
+    @pytest.mark.parametrize("delimiter", [None, "/"])
+    def test_diagnostics_are_not_listed_as_documents(
+        self,
+        patched_s3_resource_templates,
+        patched_s3_resource_output,
+        mock_output_bucket_with_documents,
+        event,
+        monkeypatch,
+        delimiter,
+    ):
+        monkeypatch.setenv("TEMPLATES_BUCKET", "doesnt-matter")
+        monkeypatch.setenv("OUTPUT_BUCKET", "doesnt-matter")
+        patched_s3_resource_output.bucket.put_object(
+            Key="_diagnostics/profiles/request-cpu.prof", Body=b"profile"
+        )
+        if delimiter:
+            event["queryStringParameters"] = {"documentsDelimiter": delimiter}
+        response = lambda_handler(event=event, context=None)
+        [entry] = json.loads(response["body"])["output_buckets"]
+        listed = entry["documents"] + entry["prefixes"]
+        assert listed
+        assert not [key for key in listed if key.startswith("_diagnostics/")]
+
 
 @pytest.mark.parametrize("event", ["list_docs"], indirect=True)
 class TestServerErrors:
@@ -70,3 +102,134 @@ class TestServerErrors:
             json_response == "Missing env OUTPUT_BUCKET"
         ), "Did not find document in bucket"
         assert response["statusCode"] == 500
+
+
+@pytest.mark.parametrize("event", ["list_docs"], indirect=True)
+class TestPagination:
+    @pytest.fixture(autouse=True)
+    def buckets(self, monkeypatch, patched_s3_resource_templates):
+        monkeypatch.setenv("TEMPLATES_BUCKET", "doesnt-matter")
+        monkeypatch.setenv("OUTPUT_BUCKET", "doesnt-matter")
+        for key in ["documents/a.docx", "documents/b.docx", "emails/c.docx"]:
+            patched_s3_resource_templates.bucket.put_object(Key=key, Body=b"")
+
+    def list_templates(self, event, **params):
+        event["queryStringParameters"] = params
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 200
+        return json.loads(response["body"])["template_buckets"][0]
+
+    @pytest.mark.usefixtures("patched_s3_resource_output")
+    def test_pages_follow_continuation_token(self, event):
+        first = self.list_templates(event, templatesLimit="2")
+        assert first["templates"] == ["documents/a.docx", "documents/b.docx"]
+        assert first["next_token"]
+        last = self.list_templates(
+            event, templatesLimit="2", templatesToken=first["next_token"]
+        )
+        assert last["templates"] == ["emails/c.docx"]
+        assert last["next_token"] is None
+
+    @pytest.mark.usefixtures("patched_s3_resource_output")
+    def test_delimiter_groups_keys_into_folders(self, event):
+        page = self.list_templates(event, templatesDelimiter="/")
+        assert page["templates"] == []
+        assert page["prefixes"] == ["documents/", "emails/"]
+        page = self.list_templates(
+            event, templatesPrefix="emails/", templatesDelimiter="/"
+        )
+        assert page["templates"] == ["emails/c.docx"]
+
+    @pytest.mark.usefixtures("patched_s3_resource_output")
+    def test_limit_above_list_objects_maximum_is_rejected(self, event):
+        event["queryStringParameters"] = {"documentsLimit": "1001"}
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 400
+
+
+@pytest.mark.parametrize("event", ["list_docs"], indirect=True)
+class TestMultipleBuckets:
+    @pytest.fixture(autouse=True)
+    def buckets(self, monkeypatch, mock_s3_client):
+        # real bucket handles, one template and output bucket per tenant
+        for tenant in ["tenant-a", "tenant-b"]:
+            for kind in ["templates", "output"]:
+                mock_s3_client.create_bucket(Bucket=f"{tenant}-{kind}")
+            mock_s3_client.put_object(
+                Bucket=f"{tenant}-templates", Key=f"{tenant}.docx", Body=b""
+            )
+        monkeypatch.setenv("TEMPLATES_BUCKET", "tenant-a-templates, tenant-b-templates")
+        monkeypatch.setenv("OUTPUT_BUCKET", "tenant-a-output,tenant-b-output")
+
+    def test_every_bucket_is_listed_in_configured_order(self, event):
+        response = lambda_handler(event=event, context=None)
+        body = json.loads(response["body"])
+        assert response["statusCode"] == 200
+        assert [entry["templates"] for entry in body["template_buckets"]] == [
+            ["tenant-a.docx"],
+            ["tenant-b.docx"],
+        ]
+        assert [entry["bucket_name"] for entry in body["output_buckets"]] == [
+            "tenant-a-output",
+            "tenant-b-output",
+        ]
+
+    def test_token_continues_its_own_bucket(self, event):
+        event["queryStringParameters"] = {"templatesLimit": "1"}
+        for key in ["tenant-b-2.docx", "tenant-b-3.docx"]:
+            S3ResourceTemplates.for_bucket("tenant-b-templates").bucket.put_object(
+                Key=key, Body=b""
+            )
+        body = json.loads(lambda_handler(event=event, context=None)["body"])
+        token = body["template_buckets"][1]["next_token"]
+        event["queryStringParameters"]["templatesToken"] = token
+        body = json.loads(lambda_handler(event=event, context=None)["body"])
+        # keys list in lexical order: tenant-b-2, tenant-b-3, tenant-b
+        assert [entry["bucket_name"] for entry in body["template_buckets"]] == [
+            "tenant-b-templates"
+        ]
+        assert body["template_buckets"][0]["templates"] == ["tenant-b-3.docx"]
+        assert len(body["output_buckets"]) == 2
+
+    def test_tampered_token_is_rejected(self, event):
+        event["queryStringParameters"] = {"templatesToken": "not-a-token"}
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 400
+
+    def test_missing_bucket_is_reported_in_its_entry(self, event, monkeypatch):
+        monkeypatch.setenv("OUTPUT_BUCKET", "tenant-a-output,tenant-c-output")
+        body = json.loads(lambda_handler(event=event, context=None)["body"])
+        assert "error" not in body["output_buckets"][0]
+        assert body["output_buckets"][1]["error"] == "NoSuchBucket"
+
+    def test_unreachable_bucket_is_reported_in_its_entry(self, event, monkeypatch):
+        list_page = app_resources.list_page
+
+        def unreachable_list_page(s3resource, listing, params):
+            if s3resource.bucket_name == "tenant-b-templates":
+                raise EndpointConnectionError(endpoint_url="https://s3.amazonaws.com")
+            return list_page(s3resource, listing, params)
+
+        monkeypatch.setattr(app_resources, "list_page", unreachable_list_page)
+        response = lambda_handler(event=event, context=None)
+        body = json.loads(response["body"])
+        assert response["statusCode"] == 200
+        assert body["template_buckets"][0]["templates"] == ["tenant-a.docx"]
+        assert body["template_buckets"][1]["error"] == "EndpointConnectionError"
+
+    def test_slow_bucket_does_not_stall_response(self, event, monkeypatch):
+        list_page = app_resources.list_page
+
+        def slow_list_page(s3resource, listing, params):
+            if s3resource.bucket_name == "tenant-b-templates":
+                time.sleep(1)
+            return list_page(s3resource, listing, params)
+
+        monkeypatch.setattr(app_resources, "list_page", slow_list_page)
+        monkeypatch.setattr(app_resources, "LISTING_TIMEOUT", 0.2)
+        start = time.monotonic()
+        body = json.loads(lambda_handler(event=event, context=None)["body"])
+        assert time.monotonic() - start < 1
+        assert body["template_buckets"][0]["templates"] == ["tenant-a.docx"]
+        assert "Timed out" in body["template_buckets"][1]["error"]
+        assert "documents" in body["output_buckets"][1]
@@ -0,0 +1,129 @@
+import io
+import json
+import zipfile
+import pytest
+from functions.documents.app import bundle_handlers
+from functions.documents.app.bundle_handlers import bundle_handler
+
+BUNDLE_KEY = "bundles/documents.zip"
+
+
+@pytest.fixture(autouse=True)
+def patched_region(monkeypatch):
+    monkeypatch.setattr("functions.documents.app.lambda_file.REGION", "us-east-1")
+
+
+def read_bundle(s3resource) -> zipfile.ZipFile:
+    data = s3resource.bucket.Object(BUNDLE_KEY).get()["Body"].read()
+    return zipfile.ZipFile(io.BytesIO(data))
+
+
+@pytest.mark.parametrize("event", ["bundle"], indirect=True)
+@pytest.mark.parametrize(
+    "mock_output_bucket_with_documents",
+    [("general_amdt_doc", "blank_template_doc")],
+    indirect=True,
+)
+class TestBundle:
+    def test_prefix_is_zipped_into_one_archive(
+        self, event, patched_s3_resource_output, mock_output_bucket_with_documents
+    ):
+        response = bundle_handler(event=event, context=None)
+        assert response["statusCode"] == 201
+        assert response["headers"]["Location"].endswith(f"/{BUNDLE_KEY}")
+        bundle = read_bundle(patched_s3_resource_output)
+        assert bundle.testzip() is None
+        assert bundle.namelist() == [
+            "documents/blank_template_doc.docx",
+            "documents/general_amdt_doc.docx",
+        ]
+        original = patched_s3_resource_output.bucket.Object(
+            "documents/general_amdt_doc.docx"
+        ).get()["Body"]
+        assert bundle.read("documents/general_amdt_doc.docx") == original.read()
+
+    def test_keys_keep_their_order(
+        self,
+        event,
+        monkeypatch,
+        patched_s3_resource_output,
+        mock_output_bucket_with_documents,
+    ):
+        # larger documents are streamed rather than read ahead
+        monkeypatch.setattr(bundle_handlers, "BUNDLE_PREFETCH_BYTES", 0)
+        keys = ["documents/general_amdt_doc.docx", "documents/blank_template_doc.docx"]
+        event["body"] = json.dumps({"keys": keys})
+        response = bundle_handler(event=event, context=None)
+        assert response["statusCode"] == 201
+        assert read_bundle(patched_s3_resource_output).namelist() == keys
+
+    def test_missing_key_creates_no_bundle(
+        self, event, patched_s3_resource_output, mock_output_bucket_with_documents
+    ):
+        keys = ["documents/general_amdt_doc.docx", "documents/missing.docx"]
+        event["body"] = json.dumps({"keys": keys})
+        response = bundle_handler(event=event, context=None)
+        assert response["statusCode"] == 404
+        assert "documents/missing.docx" in json.loads(response["body"])
+        client = patched_s3_resource_output.client
+        bucket_name = patched_s3_resource_output.bucket_name
+        assert "Contents" not in client.list_objects_v2(
+            Bucket=bucket_name, Prefix="bundles/"
+        )
+        assert "Uploads" not in client.list_multipart_uploads(Bucket=bucket_name)
+
+    def test_rebundled_prefix_leaves_out_old_bundle(
+        self, event, patched_s3_resource_output, mock_output_bucket_with_documents
+    ):
+        event["queryStringParameters"]["documentKey"] = "documents/all.zip"
+        bundle_handler(event=event, context=None)
+        bundle_handler(event=event, context=None)
+        data = patched_s3_resource_output.bucket.Object("documents/all.zip").get()
+        names = zipfile.ZipFile(io.BytesIO(data["Body"].read())).namelist()
+        assert "documents/all.zip" not in names
+        assert len(names) == 2
+
+    @pytest.mark.parametrize(
+        "content",
+        [
+            {"prefix": "documents/"},
+            {"keys": ["documents/general_amdt_doc.docx", "documents/other.docx"]},
+        ],
+    )
+    def test_too_many_documents_return_400(
+        self,
+        event,
+        content,
+        monkeypatch,
+        patched_s3_resource_output,
+        mock_output_bucket_with_documents,
+    ):
+        monkeypatch.setattr(bundle_handlers, "BUNDLE_MAX_DOCUMENTS", 1)
+        event["body"] = json.dumps(content)
+        response = bundle_handler(event=event, context=None)
+        assert response["statusCode"] == 400
+        assert "More than 1 documents" in response["body"]
+
+    def test_empty_prefix_returns_404(
+        self, event, patched_s3_resource_output, mock_output_bucket_with_documents
+    ):
+        event["body"] = json.dumps({"prefix": "cases/"})
+        response = bundle_handler(event=event, context=None)
+        assert response["statusCode"] == 404
+
+    def test_presigned_response_returns_url(
+        self, event, patched_s3_resource_output, mock_output_bucket_with_documents
+    ):
+        event["queryStringParameters"]["response"] = "presigned"
+        response = bundle_handler(event=event, context=None)
+        body = json.loads(response["body"])
+        assert response["statusCode"] == 201
+        assert response["headers"]["Location"] == body["url"]
+        assert BUNDLE_KEY in body["url"]
+
+    def test_prefix_and_keys_together_return_400(
+        self, event, patched_s3_resource_output, mock_output_bucket_with_documents
+    ):
+        event["body"] = json.dumps({"prefix": "documents/", "keys": ["a.docx"]})
+        response = bundle_handler(event=event, context=None)
+        assert response["statusCode"] == 400
@@ -0,0 +1,195 @@
+import json
+from pathlib import Path
+import pytest
+from webshell_common import catalog as catalog_module
+from webshell_common.catalog import CATALOG_KEY, read_catalog
+from functions.app_resources.app.lambda_file import lambda_handler
+from functions.documents.app import catalog_handlers
+from functions.documents.app.catalog_handlers import catalog_handler, schema_handler
+
+
+@pytest.fixture(autouse=True)
+def fresh_catalogs(monkeypatch):
+    monkeypatch.setattr(catalog_module, "_catalogs", {})
+
+
+def s3_event(key: str, event_name: str = "ObjectCreated:Put") -> dict:
+    with (Path(__file__).parents[2] / "events" / "template_created.json").open() as fp:
+        event = json.load(fp)
+    event["Records"][0]["eventName"] = event_name
+    event["Records"][0]["s3"]["object"]["key"] = key
+    return event
+
+
+@pytest.mark.parametrize(
+    "mock_template_bucket_with_templates",
+    [("general_amdt_doc", "blank_template_doc")],
+    indirect=True,
+)
+class TestCatalogMaintenance:
+    def test_created_template_is_added_with_its_variables(
+        self, patched_s3_resource_templates, mock_template_bucket_with_templates
+    ):
+        catalog_handler(s3_event("documents/general_amdt_doc.docx"), None)
+        entry = read_catalog(patched_s3_resource_templates)["templates"][
+            "documents/general_amdt_doc.docx"
+        ]
+        assert entry["variables"] == ["docket_number"]
+        assert entry["size"] == 5428
+        assert entry["etag"]
+
+    def test_removed_template_is_dropped(
+        self, patched_s3_resource_templates, mock_template_bucket_with_templates
+    ):
+        key = "documents/general_amdt_doc.docx"
+        catalog_handler(s3_event(key), None)
+        patched_s3_resource_templates.bucket.Object(key).delete()
+        catalog_handler(s3_event(key, "ObjectRemoved:Delete"), None)
+        assert read_catalog(patched_s3_resource_templates)["templates"] == {}
+
+    def test_late_remove_event_keeps_template_that_exists(
+        self, patched_s3_resource_templates, mock_template_bucket_with_templates
+    ):
+        key = "documents/general_amdt_doc.docx"
+        catalog_handler(s3_event(key, "ObjectRemoved:Delete"), None)
+        assert key in read_catalog(patched_s3_resource_templates)["templates"]
+
+    def test_catalog_object_does_not_trigger_itself(
+        self, patched_s3_resource_templates, mock_template_bucket_with_templates
+    ):
+        assert catalog_handler(s3_event(CATALOG_KEY), None) == {"updated": 0}
+        assert read_catalog(patched_s3_resource_templates) is None
+
+    def test_writing_the_catalog_does_not_rebuild_it(
+        self,
+        monkeypatch,
+        patched_s3_resource_templates,
+        mock_template_bucket_with_templates,
+    ):
+        catalog_handler(s3_event("documents/general_amdt_doc.docx"), None)
+        written = patched_s3_resource_templates.bucket.Object(CATALOG_KEY).e_tag
+
+        def fail(*args, **kwargs):
+            raise AssertionError("the catalog was updated again")
+
+        monkeypatch.setattr(catalog_handlers, "apply_events", fail)
+        monkeypatch.setattr(catalog_handlers, "rebuild_catalog", fail)
+        # the notification S3 sends for that write
+        notification = s3_event(CATALOG_KEY)
+        assert catalog_handler(notification, None) == {"updated": 0}
+        catalog = patched_s3_resource_templates.bucket.Object(CATALOG_KEY)
+        assert catalog.e_tag == written
+
+    def test_rebuild_only_downloads_changed_templates(
+        self,
+        monkeypatch,
+        patched_s3_resource_templates,
+        mock_template_bucket_with_templates,
+    ):
+        catalog_handler(s3_event("documents/general_amdt_doc.docx"), None)
+        fetched = []
+        fetch_entry = catalog_handlers.fetch_entry
+        monkeypatch.setattr(
+            catalog_handlers,
+            "fetch_entry",
+            lambda s3resource, key: fetched.append(key) or fetch_entry(s3resource, key),
+        )
+        result = catalog_handler({"rebuild": "doesnt-matter"}, None)
+        assert result == {"templates": 2}
+        assert fetched == ["documents/blank_template_doc.docx"]
+
+    def test_unchanged_catalog_is_served_from_memory(
+        self, patched_s3_resource_templates, mock_template_bucket_with_templates
+    ):
+        catalog_handler({"rebuild": "doesnt-matter"}, None)
+        catalog_module._catalogs.clear()
+        first = read_catalog(patched_s3_resource_templates)
+        assert read_catalog(patched_s3_resource_templates) is first
+
+
+@pytest.mark.parametrize("event", ["list_docs"], indirect=True)
+@pytest.mark.usefixtures("patched_s3_resource_output")
+class TestResourcesFromCatalog:
+    @pytest.fixture(autouse=True)
+    def templates(self, monkeypatch, patched_s3_resource_templates):
+        monkeypatch.setenv("TEMPLATES_BUCKET", "doesnt-matter")
+        monkeypatch.setenv("OUTPUT_BUCKET", "doesnt-matter")
+        for key in ["documents/a.docx", "documents/b.docx", "emails/c.docx", "d.docx"]:
+            patched_s3_resource_templates.bucket.put_object(Key=key, Body=b"")
+        catalog_handler({"rebuild": "doesnt-matter"}, None)
+
+        def no_listing(**kwargs):
+            raise AssertionError("templates bucket was listed")
+
+        client = patched_s3_resource_templates.client
+        list_objects_v2 = client.list_objects_v2
+        monkeypatch.setattr(
+            client,
+            "list_objects_v2",
+            lambda **kwargs: (
+                no_listing(**kwargs)
+                if kwargs["Bucket"] == patched_s3_resource_templates.bucket_name
+                else list_objects_v2(**kwargs)
+            ),
+        )
+
+    def list_templates(self, event, **params):
+        event["queryStringParameters"] = params
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 200
+        return json.loads(response["body"])["template_buckets"][0]
+
+    def test_templates_are_read_from_catalog(self, event):
+        page = self.list_templates(event)
+        assert page["templates"] == [
+            "d.docx",
+            "documents/a.docx",
+            "documents/b.docx",
+            "emails/c.docx",
+        ]
+        assert page["next_token"] is None
+
+    def test_catalog_pages_group_folders(self, event):
+        first = self.list_templates(event, templatesDelimiter="/", templatesLimit="2")
+        assert first["templates"] == ["d.docx"]
+        assert first["prefixes"] == ["documents/"]
+        last = self.list_templates(
+            event,
+            templatesDelimiter="/",
+            templatesLimit="2",
+            templatesToken=first["next_token"],
+        )
+        assert last["prefixes"] == ["emails/"]
+        assert last["next_token"] is None
+
+
+@pytest.mark.usefixtures("patched_s3_resource_templates")
+@pytest.mark.parametrize("event", ["template_schema"], indirect=True)
+@pytest.mark.parametrize(
+    "mock_template_bucket_with_templates",
+    [("general_amdt_doc",)],
+    indirect=True,
+)
+class TestTemplateSchema:
+    def test_schema_lists_cataloged_variables(
+        self, event, mock_template_bucket_with_templates
+    ):
+        catalog_handler(s3_event("documents/general_amdt_doc.docx"), None)
+        response = schema_handler(event, None)
+        body = json.loads(response["body"])
+        assert response["statusCode"] == 200
+        assert body["variables"] == ["docket_number"]
+        assert body["schema"]["required"] == ["docket_number"]
+        assert response["headers"]["ETag"] == body["etag"]
+
+    def test_uncataloged_template_is_analyzed(
+        self, event, mock_template_bucket_with_templates
+    ):
+        response = schema_handler(event, None)
+        assert json.loads(response["body"])["variables"] == ["docket_number"]
+
+    def test_missing_template_returns_404(
+        self, event, mock_template_bucket_with_templates
+    ):
+        event["pathParameters"]["template"] = "missing.docx"
+        assert schema_handler(event, None)["statusCode"] == 404
@@ -0,0 +1,121 @@
+import io
+import zipfile
+import pytest
+from docx import Document
+from docx.shared import Inches
+from benchmarks.synthetic import png
+from functions.documents.app.compiled_cache import CompiledTemplateCache
+from functions.documents.app.template_cache import CachedTemplate
+
+
+@pytest.fixture
+def template(tmp_path):
+    path = tmp_path / "template.docx"
+    document = Document()
+    document.add_paragraph("Dear {{ name }}")
+    document.sections[0].header.paragraphs[0].text = "Ref {{ reference }}"
+    document.save(path)
+    return CachedTemplate(
+        bucket_name="test_s3_template_bucket",
+        key="documents/template.docx",
+        path=path,
+        etag='"1"',
+        size=path.stat().st_size,
+    )
+
+
+def render(compiled, content, path):
+    docxtemplate = compiled.new_document()
+    docxtemplate.render(content)
+    docxtemplate.save(path)
+    document = Document(path)
+    return document.paragraphs[0].text, document.sections[0].header.paragraphs[0].text
+
+
+class TestCompiledTemplateCache:
+    def test_renders_body_and_header(self, template, tmp_path):
+        compiled = CompiledTemplateCache(max_bytes=10 * 1024 * 1024).get(template)
+        body, header = render(
+            compiled, {"name": "Ada", "reference": "A-1"}, tmp_path / "out.docx"
+        )
+        assert body == "Dear Ada"
+        assert header == "Ref A-1"
+
+    def test_renders_do_not_mutate_cached_template(self, template, tmp_path):
+        compiled = CompiledTemplateCache(max_bytes=10 * 1024 * 1024).get(template)
+        render(compiled, {"name": "Ada", "reference": "A-1"}, tmp_path / "1.docx")
+        body, header = render(
+            compiled, {"name": "Grace", "reference": "B-2"}, tmp_path / "2.docx"
+        )
+        assert body == "Dear Grace"
+        assert header == "Ref B-2"
+        assert compiled.docx.paragraphs[0].text == "Dear {{ name }}"
+
+    def test_same_etag_is_a_hit(self, template):
+        cache = CompiledTemplateCache(max_bytes=10 * 1024 * 1024)
+        assert cache.get(template) is cache.get(template)
+        assert cache.stats == {"hits": 1, "misses": 1, "evictions": 0}
+
+    def test_changed_etag_recompiles(self, template):
+        cache = CompiledTemplateCache(max_bytes=10 * 1024 * 1024)
+        first = cache.get(template)
+        changed = CachedTemplate(**{**template.__dict__, "etag": '"2"'})
+        second = cache.get(changed)
+        assert first is not second
+        assert cache.current_bytes == second.size
+
+    def test_cache_is_bounded_by_memory(self, template):
+        cache = CompiledTemplateCache(max_bytes=1)
+        cache.get(template)
+        assert cache.current_bytes == 0
+        assert cache.stats["misses"] == 1
+
+
+class TestPassthroughSave:
+    @pytest.fixture
+    def image_template(self, tmp_path):
+        path = tmp_path / "image.docx"
+        document = Document()
+        document.add_paragraph("Dear {{ name }}")
+        for _ in range(2):
+            document.add_picture(io.BytesIO(png(64 * 1024)), width=Inches(1))
+        document.save(path)
+        return CachedTemplate(
+            bucket_name="test_s3_template_bucket",
+            key="documents/image.docx",
+            path=path,
+            etag='"1"',
+            size=path.stat().st_size,
+        )
+
+    def save(self, template, content, path):
+        compiled = CompiledTemplateCache(max_bytes=10 * 1024 * 1024).get(template)
+        docxtemplate = compiled.new_document()
+        docxtemplate.render(content)
+        with template.open() as source:
+            docxtemplate.save(path, source=source)
+
+    def test_renders_body_and_header(self, template, tmp_path):
+        path = tmp_path / "out.docx"
+        self.save(template, {"name": "Ada", "reference": "A-1"}, path)
+        document = Document(path)
+        assert document.paragraphs[0].text == "Dear Ada"
+        assert document.sections[0].header.paragraphs[0].text == "Ref A-1"
+
+    def test_untouched_parts_are_copied_compressed(self, image_template, tmp_path):
+        path = tmp_path / "out.docx"
+        self.save(image_template, {"name": "Ada"}, path)
+        with zipfile.ZipFile(image_template.path) as source, zipfile.ZipFile(
+            path
+        ) as output:
+            assert output.testzip() is None
+            before = {zinfo.filename: zinfo for zinfo in source.infolist()}
+            after = {zinfo.filename: zinfo for zinfo in output.infolist()}
+        media = [name for name in before if name.startswith("word/media/")]
+        assert len(media) == 2
+        for name in media + ["word/styles.xml"]:
+            assert after[name].CRC == before[name].CRC
+            assert after[name].compress_size == before[name].compress_size
+            assert after[name].date_time == before[name].date_time
+        assert after["word/document.xml"].CRC != before["word/document.xml"].CRC
+        assert Document(path).paragraphs[0].text == "Dear Ada"
@@ -1,9 +1,18 @@
+import base64
+import io
 import pytest
+from functions.documents.app import lambda_file
 from functions.documents.app.lambda_file import (
+    DOCX_CONTENT_TYPE,
+    PRESIGNED_URL_EXPIRES,
     lambda_handler,
+    generate_document,
     TemplateRenderError,
 )
 from botocore.exceptions import ClientError
+from webshell_common import catalog as catalog_module
+from webshell_common.catalog import CATALOG_KEY, read_catalog
+from functions.documents.app.catalog_handlers import catalog_handler
 import json
 from docx import Document
 
@@ -13,6 +22,11 @@ def patched_region(monkeypatch):
     monkeypatch.setattr("functions.documents.app.lambda_file.REGION", "us-east-1")
 
 
+@pytest.fixture(autouse=True)
+def fresh_template_caches(patched_template_cache, patched_compiled_templates):
+    return patched_template_cache, patched_compiled_templates
+
+
 def get_text_from_generated_document(s3resource, key, tmp_path):
     # setup
     p = tmp_path / "generated.docx"
@@ -115,10 +129,10 @@ class TestServerErrors:
         event,
         mock_template_bucket_with_templates,
     ):
-        def mock_upload_file(*args, **kwargs):
+        def mock_upload_fileobj(*args, **kwargs):
             raise ClientError(error_response={}, operation_name="")
 
-        patched_s3_resource_output.bucket.upload_file = mock_upload_file
+        patched_s3_resource_output.bucket.upload_fileobj = mock_upload_fileobj
         response = lambda_handler(event=event, context=None)
         assert "Failed to upload generated document" in response["body"]
         assert response["statusCode"] == 500
@@ -152,6 +166,295 @@ class TestServerErrors:
         assert response["statusCode"] == 500
 
 
+@pytest.mark.usefixtures("patched_s3_resource_output")
+@pytest.mark.parametrize("event", ["batch_general_amdt_doc"], indirect=True)
+@pytest.mark.parametrize(
+    "mock_template_bucket_with_templates",
+    [("general_amdt_doc",)],
+    indirect=True,
+)
+class TestBatch:
+    def test_every_item_is_rendered_and_uploaded(
+        self,
+        patched_s3_resource_output,
+        mock_template_bucket_with_templates,
+        event,
+        tmp_path,
+    ):
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 200
+        statuses = json.loads(response["body"])
+        assert [status["statusCode"] for status in statuses] == [201, 201]
+        for number in (1, 2):
+            text = get_text_from_generated_document(
+                s3resource=patched_s3_resource_output,
+                key=f"documents/batch-{number}.docx",
+                tmp_path=tmp_path,
+            )
+            assert f"ABC-{number}" in text
+
+    def test_failed_item_does_not_fail_the_batch(
+        self, mock_template_bucket_with_templates, event, monkeypatch
+    ):
+        def fail_second_item(*args, **kwargs):
+            if kwargs["content"]["docket_number"] == "ABC-2":
+                raise TemplateRenderError("render fail")
+            return generate_document(*args, **kwargs)
+
+        monkeypatch.setattr(
+            "functions.documents.app.lambda_file.generate_document", fail_second_item
+        )
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 200
+        first, second = json.loads(response["body"])
+        assert first["statusCode"] == 201
+        assert second == {
+            "documentKey": "documents/batch-2.docx",
+            "statusCode": 500,
+            "message": "render fail",
+        }
+
+    def test_client_error_fails_only_its_item(
+        self, mock_template_bucket_with_templates, event, monkeypatch
+    ):
+        def fail_second_item(*args, **kwargs):
+            if kwargs["content"]["docket_number"] == "ABC-2":
+                raise ClientError({"Error": {"Code": "SlowDown"}}, "GetObject")
+            return generate_document(*args, **kwargs)
+
+        monkeypatch.setattr(
+            "functions.documents.app.lambda_file.generate_document", fail_second_item
+        )
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 200
+        first, second = json.loads(response["body"])
+        assert first["statusCode"] == 201
+        assert second["statusCode"] == 500
+        assert "SlowDown" in second["message"]
+
+    def test_item_without_document_key_returns_400(
+        self, mock_template_bucket_with_templates, event
+    ):
+        event["body"] = json.dumps([{"content": {}}])
+        response = lambda_handler(event=event, context=None)
+        assert "Failed schema validation" in response["body"]
+        assert response["statusCode"] == 400
+
+    @pytest.mark.parametrize(
+        "param, value",
+        [("mode", "async"), ("strict", "true"), ("response", "inline")],
+    )
+    def test_unsupported_batch_option_returns_400(
+        self,
+        patched_s3_resource_output,
+        mock_template_bucket_with_templates,
+        event,
+        param,
+        value,
+    ):
+        event["queryStringParameters"][param] = value
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 400
+        assert param in response["body"]
+        assert list(patched_s3_resource_output.bucket.objects.all()) == []
+
+
+@pytest.mark.usefixtures("patched_s3_resource_output")
+@pytest.mark.parametrize("event", ["general_amdt_doc"], indirect=True)
+@pytest.mark.parametrize(
+    "mock_template_bucket_with_templates",
+    [("general_amdt_doc",)],
+    indirect=True,
+)
+class TestResponseModes:
+    def test_inline_returns_the_document(
+        self, event, mock_template_bucket_with_templates
+    ):
+        event["queryStringParameters"]["response"] = "inline"
+        event["body"] = json.dumps({"docket_number": "ABC-123US01"})
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 201
+        assert response["isBase64Encoded"]
+        assert response["headers"]["Content-Type"] == DOCX_CONTENT_TYPE
+        document = Document(io.BytesIO(base64.b64decode(response["body"])))
+        assert "ABC-123US01" in document.paragraphs[0].text
+
+    def test_inline_over_the_cap_returns_a_presigned_url(
+        self, event, monkeypatch, mock_template_bucket_with_templates
+    ):
+        monkeypatch.setattr(
+            "functions.documents.app.lambda_file.INLINE_MAX_BYTES", 1024
+        )
+        event["queryStringParameters"]["response"] = "inline"
+        response = lambda_handler(event=event, context=None)
+        body = json.loads(response["body"])
+        assert "isBase64Encoded" not in response
+        assert response["headers"]["Location"] == body["url"]
+        assert "Signature=" in body["url"]
+
+    def test_presigned_url_reads_the_document(
+        self, event, patched_s3_resource_output, mock_template_bucket_with_templates
+    ):
+        event["queryStringParameters"]["response"] = "presigned"
+        response = lambda_handler(event=event, context=None)
+        body = json.loads(response["body"])
+        assert response["statusCode"] == 201
+        assert body["expiresIn"] == PRESIGNED_URL_EXPIRES
+        assert "/documents/test.docx?" in body["url"]
+
+    def test_unknown_mode_returns_400(self, event, mock_template_bucket_with_templates):
+        event["queryStringParameters"]["response"] = "email"
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 400
+
+
+@pytest.mark.usefixtures("patched_s3_resource_output")
+@pytest.mark.parametrize("event", ["general_amdt_doc"], indirect=True)
+@pytest.mark.parametrize(
+    "mock_template_bucket_with_templates",
+    [("general_amdt_doc",)],
+    indirect=True,
+)
+class TestStrictContent:
+    @pytest.fixture(autouse=True)
+    def cataloged(self, monkeypatch, event, mock_template_bucket_with_templates):
+        monkeypatch.setattr(catalog_module, "_catalogs", {})
+        catalog_handler({"rebuild": "doesnt-matter"}, None)
+        event["queryStringParameters"]["strict"] = "true"
+
+    def test_missing_variable_is_rejected_before_download(
+        self, event, monkeypatch, mock_template_bucket_with_templates
+    ):
+        def fail(*args, **kwargs):
+            raise AssertionError("template should not be downloaded")
+
+        monkeypatch.setattr(
+            "functions.documents.app.lambda_file.download_template", fail
+        )
+        event["body"] = json.dumps({"docket_numbr": "ABC-123US01"})
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 400
+        assert "missing variables: docket_number" in response["body"]
+        assert "Not used by the template: docket_numbr" in response["body"]
+
+    def test_complete_content_is_rendered(
+        self, event, mock_template_bucket_with_templates
+    ):
+        event["body"] = json.dumps({"docket_number": "ABC-123US01"})
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 201
+
+    def test_stale_catalog_is_checked_again_before_rejecting(
+        self,
+        event,
+        patched_s3_resource_templates,
+        mock_template_bucket_with_templates,
+    ):
+        # a newer catalog without the variable, not yet seen by this container
+        key = "documents/general_amdt_doc.docx"
+        catalog = read_catalog(patched_s3_resource_templates)
+        catalog["templates"][key] = {**catalog["templates"][key], "variables": []}
+        patched_s3_resource_templates.client.put_object(
+            Bucket=patched_s3_resource_templates.bucket_name,
+            Key=CATALOG_KEY,
+            Body=json.dumps(catalog).encode(),
+        )
+        event["body"] = "{}"
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 201
+
+
+@pytest.mark.usefixtures("patched_s3_resource_output")
+@pytest.mark.parametrize("event", ["packet"], indirect=True)
+@pytest.mark.parametrize(
+    "mock_template_bucket_with_templates",
+    [("general_amdt_doc", "blank_template_doc")],
+    indirect=True,
+)
+class TestPacket:
+    def test_parts_are_merged_in_order(
+        self,
+        event,
+        patched_s3_resource_output,
+        mock_template_bucket_with_templates,
+        tmp_path,
+    ):
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 201
+        assert response["headers"]["Location"].endswith("/documents/packet.docx")
+        path = tmp_path / "packet.docx"
+        patched_s3_resource_output.bucket.download_file("documents/packet.docx", path)
+        text = "\n".join(p.text for p in Document(path).paragraphs)
+        assert text.index("ABC-123US01") < text.index("ABC-123US02")
+
+    def test_repeated_template_is_downloaded_once(
+        self, event, monkeypatch, mock_template_bucket_with_templates
+    ):
+        downloaded = []
+        download_template = lambda_file.download_template
+        monkeypatch.setattr(
+            lambda_file,
+            "download_template",
+            lambda s3resource, key: downloaded.append(key)
+            or download_template(s3resource, key=key),
+        )
+        lambda_handler(event=event, context=None)
+        assert sorted(downloaded) == [
+            "documents/blank_template_doc.docx",
+            "documents/general_amdt_doc.docx",
+        ]
+
+    def test_templates_over_the_cache_budget_are_all_rendered(
+        self,
+        event,
+        monkeypatch,
+        patched_template_cache,
+        mock_template_bucket_with_templates,
+    ):
+        # the second download would evict the first before it is rendered
+        monkeypatch.setattr(patched_template_cache, "max_bytes", 1)
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 201
+        # and the evicted downloads are deleted once the packet is done
+        on_disk = patched_template_cache.root.iterdir()
+        assert sum(path.stat().st_size for path in on_disk) == (
+            patched_template_cache.current_bytes
+        )
+
+    def test_failed_part_creates_no_document(
+        self,
+        event,
+        patched_s3_resource_output,
+        mock_template_bucket_with_templates,
+    ):
+        parts = json.loads(event["body"])
+        parts[1]["template"] = "documents/missing.docx"
+        event["body"] = json.dumps(parts)
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 404
+        assert list(patched_s3_resource_output.bucket.objects.all()) == []
+
+    def test_part_without_template_returns_400(
+        self, event, mock_template_bucket_with_templates
+    ):
+        event["body"] = json.dumps([{"content": {}}])
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 400
+
+    @pytest.mark.parametrize("param, value", [("mode", "async"), ("strict", "true")])
+    def test_async_or_strict_packet_returns_400(
+        self, event, monkeypatch, mock_template_bucket_with_templates, param, value
+    ):
+        def fail(request):
+            raise AssertionError("packet should not be queued")
+
+        monkeypatch.setattr(lambda_file, "submit_job", fail)
+        event["queryStringParameters"][param] = value
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 400
+        assert param in response["body"]
+
+
 # TODO: get generated document key name from parameter store
 # See: https://docs.powertools.aws.dev/lambda/python/latest/utilities/parameters/
 # TODO: write recreatable content to a dynamodb table
@@ -0,0 +1,124 @@
+import io
+import json
+import pytest
+from docx import Document
+from benchmarks.synthetic import png
+from functions.documents.app import images as images_module
+from functions.documents.app.images import ImageCache, image_keys
+from functions.documents.app.lambda_file import lambda_handler
+
+
+@pytest.fixture
+def image_template(mock_s3_resource_templates):
+    document = Document()
+    document.add_paragraph("Signed {{ signature }}")
+    document.add_paragraph("{% for logo in logos %}{{ logo }}{% endfor %}")
+    data = io.BytesIO()
+    document.save(data)
+    key = "documents/signed.docx"
+    mock_s3_resource_templates.bucket.put_object(Key=key, Body=data.getvalue())
+    for name in ("signature", "logo-a", "logo-b"):
+        mock_s3_resource_templates.bucket.put_object(
+            Key=f"images/{name}.png", Body=png(0)
+        )
+    return key
+
+
+class TestImageCache:
+    def test_fresh_entry_is_served_without_s3(
+        self, mock_s3_resource_templates, image_template, monkeypatch
+    ):
+        cache = ImageCache(max_bytes=1024, ttl=300)
+        first = cache.fetch(mock_s3_resource_templates, "images/signature.png")
+
+        def fail(*args, **kwargs):
+            raise AssertionError("S3 should not be called")
+
+        monkeypatch.setattr(mock_s3_resource_templates.client, "get_object", fail)
+        assert cache.fetch(mock_s3_resource_templates, "images/signature.png") == first
+        assert cache.stats["hits"] == 1
+
+    def test_expired_entry_is_revalidated(
+        self, mock_s3_resource_templates, image_template
+    ):
+        cache = ImageCache(max_bytes=1024, ttl=0)
+        cache.fetch(mock_s3_resource_templates, "images/signature.png")
+        cache.fetch(mock_s3_resource_templates, "images/signature.png")
+        assert cache.stats == {
+            "hits": 0,
+            "revalidated": 1,
+            "misses": 1,
+            "evictions": 0,
+        }
+
+    def test_least_recently_used_image_is_evicted(
+        self, mock_s3_resource_templates, image_template
+    ):
+        cache = ImageCache(max_bytes=len(png(0)) * 2, ttl=300)
+        for name in ("signature", "logo-a", "logo-b"):
+            cache.fetch(mock_s3_resource_templates, f"images/{name}.png")
+        assert cache.stats["evictions"] == 1
+        assert cache.current_bytes == len(png(0)) * 2
+
+
+def test_image_keys_are_collected_from_nested_content():
+    content = {
+        "name": "x",
+        "signature": {"$image": "images/signature.png"},
+        "rows": [{"logo": {"$image": "images/logo-a.png", "width": 20}}],
+    }
+    assert image_keys(content) == {"images/signature.png", "images/logo-a.png"}
+
+
+@pytest.mark.usefixtures("patched_s3_resource_templates", "patched_image_cache")
+class TestInlineImages:
+    @pytest.fixture(autouse=True)
+    def caches(self, patched_template_cache, patched_compiled_templates, monkeypatch):
+        monkeypatch.setattr("functions.documents.app.lambda_file.REGION", "us-east-1")
+
+    def request(self, event: dict, content: dict) -> dict:
+        event["path"] = "/documents/signed.docx"
+        event["pathParameters"]["template"] = "signed.docx"
+        event["body"] = json.dumps(content)
+        return event
+
+    @pytest.mark.parametrize("event", ["general_amdt_doc"], indirect=True)
+    def test_images_are_fetched_together_and_inlined(
+        self,
+        event,
+        image_template,
+        patched_s3_resource_output,
+        monkeypatch,
+        tmp_path,
+    ):
+        fetched = []
+        fetch_images = images_module.fetch_images
+        monkeypatch.setattr(
+            "functions.documents.app.lambda_file.fetch_images",
+            lambda cache, s3resource, keys: fetched.append(keys)
+            or fetch_images(cache, s3resource, keys),
+        )
+        content = {
+            "signature": {"$image": "images/signature.png", "width": 40},
+            "logos": [
+                {"$image": "images/logo-a.png", "height": 10},
+                {"$image": "images/logo-b.png", "height": 10},
+            ],
+        }
+        response = lambda_handler(self.request(event, content), None)
+        assert response["statusCode"] == 201
+        assert fetched == [
+            {"images/signature.png", "images/logo-a.png", "images/logo-b.png"}
+        ]
+        path = tmp_path / "signed.docx"
+        patched_s3_resource_output.bucket.download_file("documents/test.docx", path)
+        assert len(Document(path).inline_shapes) == 3
+
+    @pytest.mark.parametrize("event", ["general_amdt_doc"], indirect=True)
+    def test_missing_image_returns_400(
+        self, event, image_template, patched_s3_resource_output
+    ):
+        content = {"signature": {"$image": "images/missing.png"}, "logos": []}
+        response = lambda_handler(self.request(event, content), None)
+        assert response["statusCode"] == 400
+        assert "Image not found: images/missing.png" in response["body"]
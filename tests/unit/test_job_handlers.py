@@ -0,0 +1,181 @@
+import json
+import time
+from pathlib import Path
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+from functions.documents.app import job_handlers
+from functions.documents.app.job_handlers import status_handler, worker_handler
+from functions.documents.app.jobs import JOBS_MAX_RECEIVE_COUNT, MAX_MESSAGE_BYTES
+from functions.documents.app.lambda_file import lambda_handler
+from functions.documents.app import template_cache as template_cache_module
+from functions.documents.app.template_cache import download_to_file
+
+
+@pytest.fixture(autouse=True)
+def patched_region(monkeypatch):
+    monkeypatch.setattr("functions.documents.app.lambda_file.REGION", "us-east-1")
+
+
+@pytest.fixture(autouse=True)
+def fresh_template_caches(patched_template_cache, patched_compiled_templates):
+    return patched_template_cache, patched_compiled_templates
+
+
+def submit(event) -> str:
+    event["queryStringParameters"]["mode"] = "async"
+    response = lambda_handler(event=event, context=None)
+    assert response["statusCode"] == 202
+    return json.loads(response["body"])["jobId"]
+
+
+def drain(queue, **receive_args) -> dict:
+    messages = queue.receive_messages(
+        MaxNumberOfMessages=10,
+        AttributeNames=["ApproximateReceiveCount"],
+        **receive_args,
+    )
+    records = [
+        {
+            "messageId": message.message_id,
+            "body": message.body,
+            "attributes": message.attributes,
+        }
+        for message in messages
+    ]
+    return worker_handler(event={"Records": records}, context=None)
+
+
+def job_status(job_id) -> dict:
+    with (Path(__file__).parents[2] / "events" / "job_status.json").open() as fp:
+        event = json.load(fp)
+    event["pathParameters"]["id"] = job_id
+    return status_handler(event=event, context=None)
+
+
+@pytest.mark.usefixtures("patched_s3_resource_output", "patched_job_store")
+@pytest.mark.parametrize("event", ["general_amdt_doc"], indirect=True)
+@pytest.mark.parametrize(
+    "mock_template_bucket_with_templates",
+    [("general_amdt_doc",)],
+    indirect=True,
+)
+class TestAsyncJobs:
+    def test_submit_queues_job_and_returns_202(
+        self, event, patched_job_queue, mock_template_bucket_with_templates
+    ):
+        event["queryStringParameters"]["mode"] = "async"
+        response = lambda_handler(event=event, context=None)
+        body = json.loads(response["body"])
+        assert response["statusCode"] == 202
+        assert response["headers"]["Location"] == f"/jobs/{body['jobId']}"
+        message = patched_job_queue.queue.receive_messages()[0]
+        assert json.loads(message.body)["jobId"] == body["jobId"]
+        assert json.loads(job_status(body["jobId"])["body"])["status"] == "queued"
+
+    def test_worker_renders_document_and_reports_location(
+        self,
+        event,
+        filenames,
+        patched_job_queue,
+        patched_s3_resource_output,
+        mock_template_bucket_with_templates,
+    ):
+        job_id = submit(event)
+        assert drain(patched_job_queue.queue) == {"batchItemFailures": []}
+        job = json.loads(job_status(job_id)["body"])
+        assert job["status"] == "succeeded"
+        assert job["location"] == (
+            f"https://{filenames.output_bucket_name}.s3.us-east-1.amazonaws.com/"
+            "documents/test.docx"
+        )
+        keys = [obj.key for obj in patched_s3_resource_output.bucket.objects.all()]
+        assert "documents/test.docx" in keys
+
+    def test_concurrent_jobs_share_a_template_on_disk(
+        self,
+        event,
+        monkeypatch,
+        patched_job_store,
+        patched_job_queue,
+        mock_template_bucket_with_templates,
+    ):
+        # each job downloads the template before any has stored it, so each
+        # download replaces one that another job is still rendering from
+        def slow_download(*args):
+            time.sleep(0.2)
+            download_to_file(*args)
+
+        monkeypatch.setattr(template_cache_module, "download_to_file", slow_download)
+        for number in range(4):
+            event["queryStringParameters"]["documentKey"] = f"documents/{number}.docx"
+            submit(event)
+        assert drain(patched_job_queue.queue) == {"batchItemFailures": []}
+        jobs = patched_job_store.table.scan()["Items"]
+        assert [job["status"] for job in jobs] == ["succeeded"] * 4
+
+    def test_missing_template_fails_job_without_retry(
+        self, event, patched_job_queue, mock_template_bucket_with_templates
+    ):
+        event["path"] = "/documents/missing.docx"
+        job_id = submit(event)
+        assert drain(patched_job_queue.queue) == {"batchItemFailures": []}
+        job = json.loads(job_status(job_id)["body"])
+        assert job["status"] == "failed"
+        assert "Failed to get template" in job["message"]
+
+    def test_job_failing_every_delivery_fails_on_the_last(
+        self, event, monkeypatch, patched_job_queue, mock_template_bucket_with_templates
+    ):
+        def unreachable(*args, **kwargs):
+            raise EndpointConnectionError(endpoint_url="https://s3.amazonaws.com")
+
+        monkeypatch.setattr(job_handlers, "render_or_copy_document", unreachable)
+        job_id = submit(event)
+        for _ in range(JOBS_MAX_RECEIVE_COUNT - 1):
+            # redelivered at once
+            assert drain(patched_job_queue.queue, VisibilityTimeout=0)[
+                "batchItemFailures"
+            ]
+            assert json.loads(job_status(job_id)["body"])["status"] == "running"
+        assert drain(patched_job_queue.queue)["batchItemFailures"]
+        job = json.loads(job_status(job_id)["body"])
+        assert job["status"] == "failed"
+        assert f"after {JOBS_MAX_RECEIVE_COUNT} attempts" in job["message"]
+
+    def test_oversized_job_returns_413_and_records_nothing(
+        self,
+        event,
+        patched_job_store,
+        patched_job_queue,
+        mock_template_bucket_with_templates,
+    ):
+        event["queryStringParameters"]["mode"] = "async"
+        event["body"] = json.dumps({"docket_number": "x" * MAX_MESSAGE_BYTES})
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 413
+        assert patched_job_store.table.scan()["Items"] == []
+
+    def test_failed_send_marks_job_failed(
+        self,
+        event,
+        monkeypatch,
+        patched_job_store,
+        patched_job_queue,
+        mock_template_bucket_with_templates,
+    ):
+        def fail(body):
+            raise ClientError({"Error": {"Code": "ServiceUnavailable"}}, "SendMessage")
+
+        monkeypatch.setattr(patched_job_queue, "send", fail)
+        event["queryStringParameters"]["mode"] = "async"
+        response = lambda_handler(event=event, context=None)
+        assert response["statusCode"] == 503
+        [job] = patched_job_store.table.scan()["Items"]
+        assert job["status"] == "failed"
+
+
+@pytest.mark.usefixtures("patched_job_store")
+class TestJobStatus:
+    def test_unknown_job_returns_404(self):
+        response = job_status("does-not-exist")
+        assert response["statusCode"] == 404
@@ -0,0 +1,132 @@
+import marshal
+from types import SimpleNamespace
+import pytest
+from botocore.exceptions import EndpointConnectionError
+from functions.documents.app import profiling
+from functions.documents.app.lambda_file import lambda_handler
+from functions.documents.app.profiling import profiled, requested_profile
+
+
+class TestRequestedProfile:
+    @pytest.mark.parametrize(
+        "event, mode",
+        [
+            ({"queryStringParameters": {"profile": "cpu"}}, "cpu"),
+            ({"headers": {"X-Webshell-Profile": "memory"}}, "memory"),
+            ({"queryStringParameters": {"profile": "wall"}}, None),
+            ({"queryStringParameters": None, "headers": None}, None),
+        ],
+    )
+    def test_only_known_modes_are_read(self, event, mode):
+        assert requested_profile(event) == mode
+
+    def test_disabled_profiling_leaves_the_handler_unwrapped(self):
+        def handler(event, context):
+            pass
+
+        assert profiled(handler) is handler
+
+
+@pytest.mark.usefixtures(
+    "patched_s3_resource_output", "patched_template_cache", "patched_compiled_templates"
+)
+@pytest.mark.parametrize("event", ["general_amdt_doc"], indirect=True)
+@pytest.mark.parametrize(
+    "mock_template_bucket_with_templates",
+    [("general_amdt_doc",)],
+    indirect=True,
+)
+class TestProfiledHandler:
+    @pytest.fixture(autouse=True)
+    def enabled(self, monkeypatch):
+        monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+
+    def read_profile(self, s3resource, response) -> tuple:
+        location = response["headers"]["X-Webshell-Profile-Location"]
+        key = location.removeprefix(f"s3://{s3resource.bucket_name}/")
+        data = s3resource.bucket.Object(key).get()["Body"].read()
+        tags = s3resource.client.get_object_tagging(
+            Bucket=s3resource.bucket_name, Key=key
+        )["TagSet"]
+        return key, data, {tag["Key"]: tag["Value"] for tag in tags}
+
+    def test_cpu_profile_is_uploaded_as_pstats(
+        self, event, patched_s3_resource_output, mock_template_bucket_with_templates
+    ):
+        event["queryStringParameters"]["profile"] = "cpu"
+        response = profiled(lambda_handler)(event=event, context=None)
+        assert response["statusCode"] == 201
+        key, data, tags = self.read_profile(patched_s3_resource_output, response)
+        assert key.startswith(profiling.PROFILE_PREFIX)
+        assert tags == {
+            "request-id": event["requestContext"]["requestId"],
+            "template": "documents/general_amdt_doc.docx",
+            "profile": "cpu",
+        }
+        functions = {function for _, _, function in marshal.loads(data)}
+        assert "generate_document" in functions
+
+    def test_memory_profile_is_uploaded_as_collapsed_stacks(
+        self, event, patched_s3_resource_output, mock_template_bucket_with_templates
+    ):
+        event["headers"] = {"X-Webshell-Profile": "memory"}
+        response = profiled(lambda_handler)(event=event, context=None)
+        assert response["statusCode"] == 201
+        _, data, tags = self.read_profile(patched_s3_resource_output, response)
+        assert tags["profile"] == "memory"
+        assert data
+        for line in data.decode().splitlines():
+            stack, size = line.rsplit(" ", 1)
+            assert stack and int(size) > 0
+
+    def test_unreachable_output_bucket_drops_only_the_profile(
+        self, event, monkeypatch, mock_template_bucket_with_templates
+    ):
+        def unreachable(**kwargs):
+            raise EndpointConnectionError(endpoint_url="https://s3.amazonaws.com")
+
+        s3resource = SimpleNamespace(
+            bucket_name="output", bucket=SimpleNamespace(put_object=unreachable)
+        )
+        monkeypatch.setattr(
+            profiling,
+            "S3ResourceOutput",
+            SimpleNamespace(for_bucket=lambda name: s3resource),
+        )
+        event["queryStringParameters"]["profile"] = "cpu"
+        response = profiled(lambda_handler)(event=event, context=None)
+        assert response["statusCode"] == 201
+        assert "X-Webshell-Profile-Location" not in response["headers"]
+
+    def test_unprofiled_request_writes_nothing(
+        self, event, patched_s3_resource_output, mock_template_bucket_with_templates
+    ):
+        response = profiled(lambda_handler)(event=event, context=None)
+        assert "X-Webshell-Profile-Location" not in response["headers"]
+        listed = patched_s3_resource_output.bucket.objects.filter(
+            Prefix=profiling.PROFILE_PREFIX
+        )
+        assert not list(listed)
+
+
+@pytest.mark.usefixtures(
+    "patched_s3_resource_output", "patched_template_cache", "patched_compiled_templates"
+)
+@pytest.mark.parametrize("event", ["batch_general_amdt_doc"], indirect=True)
+@pytest.mark.parametrize(
+    "mock_template_bucket_with_templates",
+    [("general_amdt_doc",)],
+    indirect=True,
+)
+def test_cpu_profile_covers_batch_workers(
+    event, monkeypatch, patched_s3_resource_output, mock_template_bucket_with_templates
+):
+    # batch items are rendered in pool threads
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    event["queryStringParameters"]["profile"] = "cpu"
+    response = profiled(lambda_handler)(event=event, context=None)
+    location = response["headers"]["X-Webshell-Profile-Location"]
+    key = location.removeprefix(f"s3://{patched_s3_resource_output.bucket_name}/")
+    data = patched_s3_resource_output.bucket.Object(key).get()["Body"].read()
+    functions = {function for _, _, function in marshal.loads(data)}
+    assert "generate_document" in functions
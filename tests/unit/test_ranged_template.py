@@ -0,0 +1,92 @@
+import io
+import zipfile
+import pytest
+from docx import Document
+from docx.shared import Inches
+from benchmarks.synthetic import png
+from functions.documents.app.compiled_cache import CompiledTemplateCache
+from functions.documents.app.template_cache import TemplateCache
+from functions.documents.app.zip_package import RawZipWriter
+
+
+@pytest.fixture
+def image_heavy_template(tmp_path, mock_s3_resource_templates):
+    key = "documents/image_heavy.docx"
+    document = Document()
+    document.add_paragraph("Dear {{ name }}")
+    for _ in range(3):
+        document.add_picture(io.BytesIO(png(256 * 1024)), width=Inches(1))
+    path = tmp_path / "image_heavy.docx"
+    document.save(path)
+    mock_s3_resource_templates.bucket.upload_file(path, key)
+    return key, path
+
+
+@pytest.fixture
+def ranged_cache(tmp_path):
+    return TemplateCache(
+        tmp_path / "templates",
+        max_bytes=10 * 1024 * 1024,
+        max_memory_bytes=10 * 1024 * 1024,
+        memory_threshold=10 * 1024 * 1024,
+        ranged_min_bytes=64 * 1024,
+        passthrough_min_bytes=64 * 1024,
+        negative_ttl=30,
+    )
+
+
+class TestRangedTemplate:
+    def test_media_parts_stay_in_s3(
+        self, ranged_cache, mock_s3_resource_templates, image_heavy_template
+    ):
+        key, path = image_heavy_template
+        template = ranged_cache.fetch(mock_s3_resource_templates, key)
+        assert template.partial
+        assert len(template.partial.remote_entries) == 3
+        assert template.partial.bytes_fetched < path.stat().st_size / 4
+        assert template.size < 64 * 1024
+
+    def test_assembled_document_has_original_media(
+        self, ranged_cache, mock_s3_resource_templates, image_heavy_template
+    ):
+        key, path = image_heavy_template
+        template = ranged_cache.fetch(mock_s3_resource_templates, key)
+        docxtemplate = (
+            CompiledTemplateCache(max_bytes=10 * 1024 * 1024)
+            .get(template)
+            .new_document()
+        )
+        docxtemplate.render({"name": "Ada"})
+        rendered, document = io.BytesIO(), io.BytesIO()
+        docxtemplate.save(rendered)
+        template.partial.assemble(rendered, document)
+
+        with zipfile.ZipFile(document) as output, zipfile.ZipFile(path) as source:
+            assert output.testzip() is None
+            for name in template.partial.remote_entries:
+                assert output.read(name) == source.read(name)
+        assert Document(document).paragraphs[0].text == "Dear Ada"
+
+    def test_template_below_threshold_is_fetched_whole(
+        self, tmp_path, mock_s3_resource_templates
+    ):
+        cache = TemplateCache(
+            tmp_path / "templates",
+            max_bytes=10 * 1024 * 1024,
+            ranged_min_bytes=1024 * 1024,
+            negative_ttl=30,
+        )
+        mock_s3_resource_templates.bucket.put_object(
+            Key="small.docx", Body=b"0123456789" * 10000
+        )
+        template = cache.fetch(mock_s3_resource_templates, "small.docx")
+        assert template.partial is None
+        assert template.open().read() == b"0123456789" * 10000
+
+
+class TestRawZipWriter:
+    def test_unsupported_compression_is_a_bad_package(self):
+        zinfo = zipfile.ZipInfo("word/document.xml")
+        zinfo.compress_type = zipfile.ZIP_LZMA
+        with pytest.raises(zipfile.BadZipFile):
+            RawZipWriter(io.BytesIO()).write(zinfo, b"<w:document/>")
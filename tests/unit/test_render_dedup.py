@@ -0,0 +1,154 @@
+import json
+import pytest
+from functions.documents.app.lambda_file import lambda_handler
+from functions.documents.app.render_index import HASH_METADATA, render_hash
+
+
+@pytest.fixture(autouse=True)
+def patched_region(monkeypatch):
+    monkeypatch.setattr("functions.documents.app.lambda_file.REGION", "us-east-1")
+
+
+@pytest.fixture(autouse=True)
+def fresh_template_caches(patched_template_cache, patched_compiled_templates):
+    return patched_template_cache, patched_compiled_templates
+
+
+@pytest.fixture
+def no_render(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("document was rendered")
+
+    monkeypatch.setattr("functions.documents.app.lambda_file.generate_document", fail)
+
+
+def post(event, document_key, content):
+    event = json.loads(json.dumps(event))
+    event["queryStringParameters"]["documentKey"] = document_key
+    event["body"] = json.dumps(content)
+    return lambda_handler(event=event, context=None)
+
+
+class TestRenderHash:
+    def test_key_order_does_not_change_hash(self):
+        first = render_hash(template_etag='"abc"', content={"a": 1, "b": [1, 2]})
+        second = render_hash(template_etag='"abc"', content={"b": [1, 2], "a": 1})
+        assert first == second
+
+    def test_template_version_changes_hash(self):
+        content = {"a": 1}
+        assert render_hash(template_etag='"abc"', content=content) != render_hash(
+            template_etag='"abd"', content=content
+        )
+
+
+@pytest.mark.usefixtures("patched_s3_resource_output")
+@pytest.mark.parametrize("event", ["general_amdt_doc"], indirect=True)
+@pytest.mark.parametrize(
+    "mock_template_bucket_with_templates",
+    [("general_amdt_doc",)],
+    indirect=True,
+)
+class TestDeduplication:
+    def test_identical_render_is_copied(
+        self,
+        event,
+        monkeypatch,
+        patched_render_index,
+        patched_s3_resource_output,
+        mock_template_bucket_with_templates,
+    ):
+        content = {"docket_number": "42"}
+        assert post(event, "documents/first.docx", content)["statusCode"] == 201
+        monkeypatch.setattr(
+            "functions.documents.app.lambda_file.download_template",
+            lambda *args, **kwargs: pytest.fail("template was downloaded"),
+        )
+        assert post(event, "documents/second.docx", content)["statusCode"] == 201
+
+        bucket = patched_s3_resource_output.bucket
+        first = bucket.Object("documents/first.docx").get()["Body"].read()
+        second = bucket.Object("documents/second.docx")
+        assert second.get()["Body"].read() == first
+        assert HASH_METADATA in second.metadata
+        assert patched_render_index.stats == {
+            "hits": 1,
+            "misses": 1,
+            "bytesSaved": len(first),
+        }
+
+    def test_different_content_is_rendered(
+        self, event, patched_render_index, mock_template_bucket_with_templates
+    ):
+        post(event, "documents/first.docx", {"docket_number": "42"})
+        post(event, "documents/second.docx", {"docket_number": "43"})
+        assert patched_render_index.stats["misses"] == 2
+
+    def test_overwritten_earlier_render_is_not_reused(
+        self,
+        event,
+        patched_render_index,
+        patched_s3_resource_output,
+        mock_template_bucket_with_templates,
+    ):
+        content = {"docket_number": "42"}
+        post(event, "documents/first.docx", content)
+        patched_s3_resource_output.bucket.put_object(
+            Key="documents/first.docx", Body=b"replaced"
+        )
+        post(event, "documents/second.docx", content)
+        second = patched_s3_resource_output.bucket.Object("documents/second.docx")
+        assert second.get()["Body"].read() != b"replaced"
+        assert patched_render_index.stats["hits"] == 0
+
+    def test_regenerating_same_key_is_a_hit_without_copy(
+        self, event, request, patched_render_index, mock_template_bucket_with_templates
+    ):
+        content = {"docket_number": "42"}
+        post(event, "documents/first.docx", content)
+        request.getfixturevalue("no_render")
+        assert post(event, "documents/first.docx", content)["statusCode"] == 201
+        assert patched_render_index.stats["hits"] == 1
+
+    def test_unavailable_index_is_a_miss(
+        self,
+        event,
+        mock_render_index_table,
+        patched_render_index,
+        patched_s3_resource_output,
+        mock_template_bucket_with_templates,
+    ):
+        mock_render_index_table.delete()
+        response = post(event, "documents/first.docx", {"docket_number": "42"})
+        assert response["statusCode"] == 201
+        first = patched_s3_resource_output.bucket.Object("documents/first.docx")
+        assert first.get()["Body"].read()
+        assert patched_render_index.stats["misses"] == 1
+
+
+@pytest.mark.usefixtures("patched_s3_resource_output")
+@pytest.mark.parametrize("event", ["batch_general_amdt_doc"], indirect=True)
+@pytest.mark.parametrize(
+    "mock_template_bucket_with_templates",
+    [("general_amdt_doc",)],
+    indirect=True,
+)
+class TestBatchDeduplication:
+    def test_batch_copies_duplicates_and_renders_the_rest(
+        self, event, patched_render_index, mock_template_bucket_with_templates
+    ):
+        items = [
+            {"documentKey": "documents/a.docx", "content": {"docket_number": "1"}},
+            {"documentKey": "documents/b.docx", "content": {"docket_number": "2"}},
+        ]
+        event["body"] = json.dumps(items[:1])
+        lambda_handler(event=event, context=None)
+        event["body"] = json.dumps(
+            items
+            + [{"documentKey": "documents/c.docx", "content": items[0]["content"]}]
+        )
+        response = lambda_handler(event=event, context=None)
+        statuses = json.loads(response["body"])
+        assert [status["statusCode"] for status in statuses] == [201, 201, 201]
+        assert patched_render_index.stats["hits"] == 2
+        assert patched_render_index.stats["misses"] == 2
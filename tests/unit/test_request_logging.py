@@ -0,0 +1,52 @@
+import logging
+import pytest
+from webshell_common import request_logging
+from webshell_common.request_logging import Payload, log_request
+
+logger = logging.getLogger("test_request_logging")
+
+
+@pytest.fixture
+def event():
+    return {
+        "httpMethod": "POST",
+        "path": "/documents/general_amdt_doc.docx",
+        "queryStringParameters": {"documentKey": "documents/test.docx"},
+        "requestContext": {"requestId": "c6af9ac6"},
+        "body": '{"rows": [' + ",".join(["1"] * 5000) + "]}",
+    }
+
+
+class TestPayload:
+    def test_long_payload_is_truncated(self):
+        text = str(Payload({"rows": list(range(5000))}, max_chars=100))
+        assert text.startswith('{"rows":[0,1,2')
+        assert text.endswith("chars]")
+        assert len(text) < 130
+
+    def test_nothing_is_serialized_below_log_level(self, monkeypatch, caplog):
+        calls = []
+        monkeypatch.setattr(Payload, "__str__", lambda self: calls.append(1) or "")
+        with caplog.at_level(logging.INFO):
+            logger.debug("payload: %s", Payload({"a": 1}))
+        assert calls == []
+
+
+class TestLogRequest:
+    def test_summary_only_by_default(self, event, caplog):
+        with caplog.at_level(logging.INFO):
+            log_request(logger, event)
+        assert [record.getMessage() for record in caplog.records] == [
+            "request received"
+        ]
+        summary = caplog.records[0].request
+        assert summary["requestId"] == "c6af9ac6"
+        assert summary["bodyBytes"] == len(event["body"])
+
+    def test_sampled_request_logs_truncated_payload(self, event, caplog, monkeypatch):
+        monkeypatch.setattr(request_logging, "LOG_PAYLOADS", True)
+        with caplog.at_level(logging.INFO):
+            log_request(logger, event)
+        payload = caplog.records[1].getMessage()
+        assert payload.startswith("request payload: {")
+        assert len(payload) < request_logging.PAYLOAD_MAX_CHARS + 100
@@ -0,0 +1,73 @@
+import time
+import pytest
+from webshell_common.s3 import (
+    LARGE_OBJECT_BYTES,
+    TRANSFER_PROFILES,
+    S3ResourceOutput,
+    S3ResourceTemplates,
+    TransferProfile,
+    s3_resource,
+    transfer_profile,
+    upload_stream,
+)
+
+
+@pytest.mark.usefixtures("aws_credentials")
+class TestBucketHandles:
+    def test_handle_is_reused_for_same_bucket(self):
+        first = S3ResourceTemplates.for_bucket("test_s3_template_bucket")
+        second = S3ResourceTemplates.for_bucket("test_s3_template_bucket")
+        assert first is second
+
+    def test_handles_share_one_resource(self):
+        templates = S3ResourceTemplates.for_bucket("test_s3_template_bucket")
+        output = S3ResourceOutput.for_bucket("test_s3_output_bucket")
+        assert isinstance(output, S3ResourceOutput)
+        assert templates.resource is output.resource is s3_resource()
+
+    def test_presigned_urls_are_signed_with_sigv4(self):
+        url = s3_resource().meta.client.generate_presigned_url(
+            "get_object", Params={"Bucket": "test_s3_output_bucket", "Key": "a.docx"}
+        )
+        assert "X-Amz-Signature=" in url
+
+
+class TestTransferProfiles:
+    def test_large_objects_use_the_large_profile(self):
+        assert transfer_profile(1024) is TRANSFER_PROFILES["default"]
+        assert transfer_profile(LARGE_OBJECT_BYTES) is TRANSFER_PROFILES["large"]
+
+    def test_ranges_cover_the_object_in_chunks(self):
+        profile = TransferProfile(
+            multipart_threshold=8, multipart_chunksize=4, max_concurrency=2
+        )
+        assert profile.ranges(2, 11) == [(2, 5), (6, 9), (10, 10)]
+
+    def test_config_carries_the_profile(self):
+        config = TRANSFER_PROFILES["large"].config()
+        assert (
+            config.multipart_chunksize == TRANSFER_PROFILES["large"].multipart_chunksize
+        )
+        assert config.max_concurrency == TRANSFER_PROFILES["large"].max_concurrency
+
+
+class TestUploadStream:
+    def test_written_object_is_uploaded(self, mock_s3_resource_output):
+        bucket = mock_s3_resource_output.bucket
+        upload_stream(bucket, "out.bin", lambda fileobj: fileobj.write(b"data" * 1000))
+        assert bucket.Object("out.bin").get()["Body"].read() == b"data" * 1000
+
+    def test_failed_write_uploads_nothing(self, mock_s3_resource_output):
+        def write(fileobj):
+            fileobj.write(b"partial")
+            fileobj.flush()
+            # the upload is now waiting on the pipe
+            time.sleep(0.01)
+            raise ValueError("render failed")
+
+        bucket = mock_s3_resource_output.bucket
+        # the failure used to race the end of the pipe, so try it a few times
+        for _ in range(10):
+            with pytest.raises(ValueError):
+                upload_stream(bucket, "out.bin", write)
+        assert list(bucket.objects.all()) == []
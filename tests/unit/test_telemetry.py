@@ -0,0 +1,137 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from webshell_common import telemetry
+from webshell_common.telemetry import instrumented, stage, tracing_enabled
+from functions.documents.app.lambda_file import lambda_handler
+
+
+def emf_documents(out: str) -> list:
+    return [json.loads(line) for line in out.splitlines() if '"_aws"' in line]
+
+
+def metric_names(document: dict) -> set:
+    return {
+        metric["Name"]
+        for directive in document["_aws"]["CloudWatchMetrics"]
+        for metric in directive["Metrics"]
+    }
+
+
+@pytest.fixture(autouse=True)
+def cold_container(monkeypatch):
+    monkeypatch.setattr(telemetry, "_cold_start", True)
+    telemetry.metrics.clear_metrics()
+
+
+class TestInstrumented:
+    def test_stages_are_flushed_after_the_invocation(self, capsys):
+        @instrumented
+        def handler(event, context):
+            with stage("render"):
+                pass
+            with stage("render"):
+                pass
+
+        handler({}, None)
+        (document,) = emf_documents(capsys.readouterr().out)
+        assert metric_names(document) == {"cold_start", "render_ms"}
+        assert len(document["render_ms"]) == 2
+
+    def test_only_the_first_invocation_is_a_cold_start(self, capsys):
+        @instrumented
+        def handler(event, context):
+            with stage("render"):
+                pass
+
+        handler({}, None)
+        handler({}, None)
+        first, second = emf_documents(capsys.readouterr().out)
+        assert first["is_cold_start"] is True
+        assert "cold_start" in metric_names(first)
+        assert second["is_cold_start"] is False
+        assert "cold_start" not in metric_names(second)
+
+
+class TestTracingEnabled:
+    @pytest.mark.parametrize(
+        "env, enabled",
+        [
+            ({}, False),
+            ({"AWS_LAMBDA_FUNCTION_NAME": "f"}, False),
+            ({"AWS_LAMBDA_FUNCTION_NAME": "f", "TRACE_STAGES": "true"}, True),
+            (
+                {
+                    "AWS_LAMBDA_FUNCTION_NAME": "f",
+                    "TRACE_STAGES": "true",
+                    "POWERTOOLS_TRACE_DISABLED": "true",
+                },
+                False,
+            ),
+            ({"TRACE_STAGES": "true"}, False),
+        ],
+    )
+    def test_stages_are_traced_only_on_request(self, env, enabled):
+        assert tracing_enabled(env) is enabled
+
+    def test_lambda_without_stage_tracing_skips_the_xray_sdk(self):
+        env = {
+            **os.environ,
+            "AWS_LAMBDA_FUNCTION_NAME": "f",
+            "PYTHONPATH": "layers/common",
+        }
+        env.pop("TRACE_STAGES", None)
+        imported = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, webshell_common.telemetry; "
+                "print('aws_xray_sdk' in sys.modules)",
+            ],
+            env=env,
+            cwd=Path(__file__).parents[2],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        assert imported == "False"
+
+
+@pytest.mark.usefixtures(
+    "patched_s3_resource_output", "patched_template_cache", "patched_compiled_templates"
+)
+@pytest.mark.parametrize("event", ["general_amdt_doc"], indirect=True)
+@pytest.mark.parametrize(
+    "mock_template_bucket_with_templates",
+    [("general_amdt_doc",)],
+    indirect=True,
+)
+class TestDocumentMetrics:
+    def test_every_stage_is_measured(
+        self, event, capsys, mock_template_bucket_with_templates
+    ):
+        lambda_handler(event=event, context=None)
+        (document,) = emf_documents(capsys.readouterr().out)
+        assert {
+            "validate_ms",
+            "download_template_ms",
+            "generate_document_ms",
+            "upload_generated_document_ms",
+            "template_bytes",
+            "document_bytes",
+        } <= metric_names(document)
+        assert document["template"] == "documents/general_amdt_doc.docx"
+
+    def test_cache_outcomes_are_per_request(
+        self, event, capsys, mock_template_bucket_with_templates
+    ):
+        lambda_handler(event=event, context=None)
+        lambda_handler(event=event, context=None)
+        first, second = emf_documents(capsys.readouterr().out)
+        assert first["template_cache_misses"] == [1.0]
+        assert second["template_cache_misses"] == [0.0]
+        assert second["template_cache_hits"] == [1.0]
+        assert second["compiled_template_cache_hits"] == [1.0]
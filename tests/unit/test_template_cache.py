@@ -0,0 +1,164 @@
+import pytest
+from botocore.exceptions import ClientError
+from webshell_common.s3 import TRANSFER_PROFILES, TransferProfile
+from functions.documents.app import template_cache as template_cache_module
+from functions.documents.app.template_cache import TemplateCache
+
+
+@pytest.fixture
+def template_key(mock_s3_resource_templates):
+    key = "documents/template.docx"
+    mock_s3_resource_templates.bucket.put_object(Key=key, Body=b"version 1")
+    return key
+
+
+class TestTemplateCache:
+    def test_first_fetch_is_a_miss_and_downloads(
+        self, template_cache, mock_s3_resource_templates, template_key
+    ):
+        template = template_cache.fetch(mock_s3_resource_templates, template_key)
+        assert template.open().read() == b"version 1"
+        assert template_cache.stats["misses"] == 1
+        assert template_cache.stats["hits"] == 0
+
+    def test_unchanged_template_is_a_hit(
+        self, template_cache, mock_s3_resource_templates, template_key
+    ):
+        first = template_cache.fetch(mock_s3_resource_templates, template_key)
+        second = template_cache.fetch(mock_s3_resource_templates, template_key)
+        assert first == second
+        assert template_cache.stats["hits"] == 1
+
+    def test_changed_template_is_downloaded_again(
+        self, template_cache, mock_s3_resource_templates, template_key
+    ):
+        first = template_cache.fetch(mock_s3_resource_templates, template_key)
+        mock_s3_resource_templates.bucket.put_object(
+            Key=template_key, Body=b"version 2"
+        )
+        second = template_cache.fetch(mock_s3_resource_templates, template_key)
+        assert second.open().read() == b"version 2"
+        assert not first.path.exists()
+        assert template_cache.stats["misses"] == 2
+
+    def test_least_recently_used_entry_is_evicted(
+        self, tmp_path, mock_s3_resource_templates
+    ):
+        cache = TemplateCache(tmp_path, max_bytes=20, negative_ttl=30)
+        for key in ("a.docx", "b.docx", "c.docx"):
+            mock_s3_resource_templates.bucket.put_object(Key=key, Body=b"0123456789")
+        a = cache.fetch(mock_s3_resource_templates, "a.docx")
+        cache.fetch(mock_s3_resource_templates, "b.docx")
+        cache.fetch(mock_s3_resource_templates, "a.docx")
+        cache.fetch(mock_s3_resource_templates, "c.docx")
+        assert a.path.exists()
+        assert cache.stats["evictions"] == 1
+        assert cache.current_bytes == 20
+
+    def test_held_files_are_deleted_only_after_the_hold(
+        self, tmp_path, mock_s3_resource_templates
+    ):
+        cache = TemplateCache(tmp_path, max_bytes=10, negative_ttl=30)
+        for key in ("a.docx", "b.docx"):
+            mock_s3_resource_templates.bucket.put_object(Key=key, Body=b"0123456789")
+        with cache.hold():
+            a = cache.fetch(mock_s3_resource_templates, "a.docx")
+            b = cache.fetch(mock_s3_resource_templates, "b.docx")
+            assert cache.stats["evictions"] == 1
+            assert cache.current_bytes == 10
+            assert a.path.exists() and b.path.exists()
+        assert not a.path.exists()
+        assert b.path.exists()
+
+    def test_replaced_file_outlives_the_hold_of_its_reader(
+        self, template_cache, mock_s3_resource_templates, template_key
+    ):
+        with template_cache.hold():
+            first = template_cache.fetch(mock_s3_resource_templates, template_key)
+            with template_cache.hold():
+                mock_s3_resource_templates.bucket.put_object(
+                    Key=template_key, Body=b"version 2"
+                )
+                template_cache.fetch(mock_s3_resource_templates, template_key)
+            assert first.open().read() == b"version 1"
+        assert not first.path.exists()
+
+    def test_missing_template_is_negatively_cached(
+        self, template_cache, mock_s3_resource_templates, monkeypatch
+    ):
+        with pytest.raises(ClientError):
+            template_cache.fetch(mock_s3_resource_templates, "missing.docx")
+
+        def fail_get(*args, **kwargs):
+            raise AssertionError("S3 should not be called")
+
+        monkeypatch.setattr(mock_s3_resource_templates.bucket, "Object", fail_get)
+        with pytest.raises(ClientError) as e:
+            template_cache.fetch(mock_s3_resource_templates, "missing.docx")
+        assert e.value.response["Error"]["Code"] == "404"
+        assert template_cache.stats["negative_hits"] == 1
+
+    def test_small_template_is_kept_in_memory(
+        self, tmp_path, mock_s3_resource_templates, template_key
+    ):
+        cache = TemplateCache(
+            tmp_path / "templates",
+            max_bytes=1024,
+            max_memory_bytes=1024,
+            memory_threshold=1024,
+            negative_ttl=30,
+        )
+        template = cache.fetch(mock_s3_resource_templates, template_key)
+        assert template.in_memory
+        assert template.open().read() == b"version 1"
+        assert not (tmp_path / "templates").exists()
+        assert cache.current_memory_bytes == template.size
+
+
+class TestMultipartDownload:
+    @pytest.fixture(autouse=True)
+    def small_parts(self, monkeypatch):
+        profile = TransferProfile(
+            multipart_threshold=16, multipart_chunksize=10, max_concurrency=4
+        )
+        monkeypatch.setitem(TRANSFER_PROFILES, "default", profile)
+
+    def test_large_template_is_downloaded_in_parts(
+        self, template_cache, mock_s3_resource_templates, monkeypatch
+    ):
+        data = bytes(range(256)) * 4
+        mock_s3_resource_templates.bucket.put_object(Key="large.docx", Body=data)
+        ranges = []
+        download = template_cache_module.download_ranges
+
+        def spy(obj, fp, parts, **kwargs):
+            ranges.extend(parts)
+            download(obj, fp, parts, **kwargs)
+
+        monkeypatch.setattr(template_cache_module, "download_ranges", spy)
+        template = template_cache.fetch(mock_s3_resource_templates, "large.docx")
+        assert template.open().read() == data
+        assert ranges[0] == (10, 19)
+        assert ranges[-1] == (1020, 1023)
+
+    def test_tail_response_is_completed_in_parts(
+        self, tmp_path, mock_s3_resource_templates, monkeypatch
+    ):
+        monkeypatch.setattr(template_cache_module, "TAIL_BYTES", 100)
+        data = bytes(range(256)) * 4
+        mock_s3_resource_templates.bucket.put_object(Key="large.docx", Body=data)
+        cache = TemplateCache(
+            tmp_path, max_bytes=4096, negative_ttl=30, ranged_min_bytes=8192
+        )
+        template = cache.fetch(mock_s3_resource_templates, "large.docx")
+        assert template.open().read() == data
+
+    def test_small_template_is_streamed(
+        self, template_cache, mock_s3_resource_templates, template_key, monkeypatch
+    ):
+        def fail(*args, **kwargs):
+            raise AssertionError("no ranged download below the threshold")
+
+        monkeypatch.setattr(template_cache_module, "download_ranges", fail)
+        template = template_cache.fetch(mock_s3_resource_templates, template_key)
+        assert template.open().read() == b"version 1"
@@ -0,0 +1,50 @@
+import json
+from pathlib import Path
+import pytest
+from aws_lambda_powertools.utilities.validation import SchemaValidationError
+from functions.documents.app.validation import parse_document_request
+
+
+def load_event(name: str) -> dict:
+    with (Path(__file__).parents[2] / "events" / f"{name}.json").open() as fp:
+        return json.load(fp)
+
+
+class TestParseDocumentRequest:
+    def test_bucket_names_and_key_are_parsed_once(self):
+        request = parse_document_request(load_event("general_amdt_doc"))
+        assert request.template_bucket == "webshell-dev-templates"
+        assert request.output_bucket == "webshell-dev-output"
+        assert request.template_key == "documents/general_amdt_doc.docx"
+        assert request.document_key == "documents/test.docx"
+        assert request.content == {"foo": "bar"}
+        assert not request.is_batch and not request.is_async
+
+    def test_batch_items_are_parsed(self):
+        request = parse_document_request(load_event("batch_general_amdt_doc"))
+        assert request.is_batch
+        assert request.template_key == "documents/general_amdt_doc.docx"
+        assert all("documentKey" in item for item in request.content)
+
+    def test_template_named_batch_is_a_single_document(self):
+        event = load_event("general_amdt_doc")
+        event["path"] = "/documents/batch"
+        event["pathParameters"]["template"] = "batch"
+        request = parse_document_request(event)
+        assert not request.is_batch
+        assert request.template_key == "documents/batch"
+        assert request.content == {"foo": "bar"}
+
+    def test_batch_of_a_template_named_batch(self):
+        event = load_event("batch_general_amdt_doc")
+        event["path"] = "/documents/batch/batch"
+        event["pathParameters"]["template"] = "batch"
+        request = parse_document_request(event)
+        assert request.is_batch
+        assert request.template_key == "documents/batch"
+
+    def test_bucket_must_be_an_s3_arn(self):
+        event = load_event("general_amdt_doc")
+        event["queryStringParameters"]["templateBucket"] = "x-arn:aws:s3:::bucket"
+        with pytest.raises(SchemaValidationError):
+            parse_document_request(event)